@@ -10,6 +10,11 @@ income as defined in ConsIndShockModel.
 
 from __future__ import annotations
 
+import hashlib
+from collections import OrderedDict
+from copy import deepcopy
+from time import time
+
 import numpy as np
 from HARK.ConsumptionSaving.ConsBequestModel import (
     BequestWarmGlowConsumerType,
@@ -19,16 +24,455 @@ from HARK.ConsumptionSaving.ConsIndShockModel import IndShockConsumerType
 from HARK.ConsumptionSaving.ConsPortfolioModel import PortfolioConsumerType
 from HARK.ConsumptionSaving.ConsWealthPortfolioModel import WealthPortfolioConsumerType
 from HARK.core import AgentType
+from HARK.utilities import get_arg_names
+
+from estimark.lazy import lazy_import
+from estimark.store import update_hash
+
+egm = lazy_import("estimark.egm")
+
+# Version of the payload that agents are pickled as; bump it whenever the payload
+# changes, so that stale payloads fail loudly instead of building the wrong agent
+agent_schema_version = 2
+
+# Constructor memos shared by the agents of each type that are unpickled in this
+# process, so that the agents rebuilt after the first one restore its objects
+payload_memos = {}
 
 # =====================================================
 # Define objects and functions used for the estimation
 # =====================================================
 
 
+def rebuild_agent(payload):
+    """Rebuilds an agent from the payload made by its get_payload method; the
+    function that unpickling an agent calls.
+
+    Parameters
+    ----------
+    payload : dict
+        Payload of the agent, with the schema version it was made with.
+
+    Returns
+    -------
+    agent : TempConsumerType
+        Agent with the calibration, parameters and attributes in the payload.
+
+    """
+    schema = payload.get("schema")
+    if schema != agent_schema_version:
+        msg = (
+            f"Agent payload has schema version {schema}, but this version of estimark "
+            f"reads version {agent_schema_version}; rebuild the agent with make_agent."
+        )
+        raise ValueError(msg)
+    return payload["type"].from_payload(payload)
+
+
+def get_rng_states(obj):
+    """Gets the seed and random number generator state of a distribution, of the
+    distributions it indexes, or of each distribution in a (nested) list of them.
+
+    Parameters
+    ----------
+    obj : Distribution, list or object
+        Constructed object whose random states are gathered.
+
+    Returns
+    -------
+    states : dict, list or None
+        States mirroring the structure of obj, or None where it has no generator.
+
+    """
+    if isinstance(obj, list):
+        return [get_rng_states(item) for item in obj]
+    if not hasattr(obj, "_rng"):
+        return None
+    return {
+        "seed": obj.seed,
+        "state": obj._rng.bit_generator.state,
+        "dstns": [get_rng_states(dstn) for dstn in getattr(obj, "dstns", [])],
+    }
+
+
+def set_rng_states(obj, states):
+    """Puts states gathered by get_rng_states back into an object of the same
+    structure, such as one rebuilt from the same parameters.
+
+    Parameters
+    ----------
+    obj : Distribution, list or object
+        Constructed object whose random states are set.
+    states : dict, list or None
+        States made by get_rng_states.
+
+    Returns
+    -------
+    None
+
+    """
+    if isinstance(obj, list) and isinstance(states, list):
+        for item, item_states in zip(obj, states, strict=True):
+            set_rng_states(item, item_states)
+    elif isinstance(states, dict) and hasattr(obj, "_rng"):
+        obj.seed = states["seed"]
+        obj._rng.bit_generator.state = states["state"]
+        set_rng_states(getattr(obj, "dstns", []), states["dstns"])
+
+
 class TempConsumerType(AgentType):
+    # Whether to replay a bank of pre-drawn shocks instead of drawing new ones
+    use_shock_bank = False
+    shock_bank = None
+    # Whether construct skips constructors whose inputs match one of their recent
+    # builds, and how many builds of each constructed object to remember
+    elide_constructors = False
+    constructor_memo_size = 2
+    # Whether pickling this agent includes its solution and simulated history
+    pickle_solution = False
+    pickle_history = False
+    # Attributes set outside of the parameters that pickling keeps
+    payload_attributes = (
+        "name",
+        "track_vars",
+        "calibration_hash",
+        "calibration_overrides",
+        "solver_backend",
+        "solver_jit",
+        "elide_constructors",
+        "constructor_memo_size",
+        "pickle_solution",
+        "pickle_history",
+    )
+
     def check_restrictions(self):
         return None
 
+    def construct(self, *args, force=False):
+        """Builds constructed inputs as AgentType.construct does, but when
+        elide_constructors is True, a constructor whose inputs are the same as in one
+        of its recent builds is not run again: the object from that build is restored
+        instead. Inputs that are themselves constructed objects are compared by
+        identity, and all other inputs by a hash of their contents. Counts of built and
+        skipped objects, and the constructor time spent and saved, are kept in the
+        attribute constructor_stats.
+
+        Parameters
+        ----------
+        *args : str, optional
+            Keys of self.constructors to be constructed; all of them if none are given.
+        force : bool, optional
+            Whether to force past errors, as in AgentType.construct.
+
+        Returns
+        -------
+        None
+
+        """
+        if not self.elide_constructors:
+            super().construct(*args, force=force)
+            return
+
+        if "constructor_memo" not in vars(self):
+            self.constructor_memo = {}
+            self.constructor_stats = {
+                "built": 0,
+                "skipped": 0,
+                "seconds_spent": 0.0,
+                "seconds_saved": 0.0,
+            }
+        stats = self.constructor_stats
+
+        # Build each key after the keys its constructor takes as inputs
+        pending = list(args) if len(args) > 0 else list(self.constructors)
+        while pending:
+            ready = [
+                key
+                for key in pending
+                if self.constructors.get(key) is None
+                or not set(get_arg_names(self.constructors[key])) & (set(pending) - {key})
+            ]
+            if not ready:
+                # Circular requirements are left to AgentType.construct
+                super().construct(*pending, force=force)
+                return
+            for key in ready:
+                pending.remove(key)
+                fingerprint, inputs = self.get_constructor_fingerprint(key)
+                memo = self.constructor_memo.setdefault(key, OrderedDict())
+                if fingerprint is not None and fingerprint in memo:
+                    value, seconds, _ = memo[fingerprint]
+                    memo.move_to_end(fingerprint)
+                    setattr(self, key, value)
+                    self.parameters[key] = value
+                    stats["skipped"] += 1
+                    stats["seconds_saved"] += seconds
+                    continue
+
+                t0 = time()
+                super().construct(key, force=force)
+                seconds = time() - t0
+                stats["built"] += 1
+                stats["seconds_spent"] += seconds
+                if fingerprint is not None and hasattr(self, key):
+                    memo[fingerprint] = (getattr(self, key), seconds, inputs)
+                    while len(memo) > self.constructor_memo_size:
+                        memo.popitem(last=False)
+
+    def get_constructor_fingerprint(self, key):
+        """Identifies the inputs of the constructor of one key, gathered the way
+        AgentType.construct gathers them. The random number generator is left out when
+        the shock bank is in use, as it only seeds the distributions' own draws, which
+        the bank replaces.
+
+        Parameters
+        ----------
+        key : str
+            Key of self.constructors.
+
+        Returns
+        -------
+        fingerprint : tuple or None
+            Hashable identity of the inputs, or None if they cannot be identified
+            (a missing constructor or input, or a live random number generator).
+        inputs : list
+            Constructed objects among the inputs, kept alive while their identity is
+            part of a stored fingerprint.
+
+        """
+        constructor = self.constructors.get(key)
+        if constructor is None:
+            return None, []
+
+        fingerprint = []
+        inputs = []
+        for name in get_arg_names(constructor):
+            if name == "RNG":
+                if not self.use_shock_bank:
+                    return None, []
+                continue
+            if hasattr(self, name):
+                value = getattr(self, name)
+            elif name in self.parameters:
+                value = self.parameters[name]
+            else:
+                return None, []
+            if name in self.constructors:
+                fingerprint.append((name, id(value)))
+                inputs.append(value)
+            else:
+                digest = hashlib.sha1()
+                update_hash(digest, value)
+                fingerprint.append((name, digest.hexdigest()))
+        return tuple(fingerprint), inputs
+
+    def initialize_sim(self):
+        """Prepares this type for a new simulation as usual, then makes sure that the
+        shock bank is up to date when use_shock_bank is True.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        super().initialize_sim()
+        if self.use_shock_bank:
+            self.update_shock_bank()
+
+    def update_shock_bank(self):
+        """Makes sure that the shock bank matches the current seed, population and
+        shock distributions, redrawing it only if it does not.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        if (
+            self.shock_bank is None
+            or self.shock_bank["signature"] != self.get_shock_bank_signature()
+        ):
+            self.make_shock_bank()
+
+    def get_shock_bank_dstns(self):
+        """Lists the discrete distributions that simulated agents draw shocks from in
+        each period of their lives. As sim_death never replaces anyone, every agent is
+        in period t_sim of its life, so one distribution per period covers everyone.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        IncShkDstns : [DiscreteDistribution]
+            Income shock distribution used in each simulated period.
+        RiskyDstn : DiscreteDistribution or None
+            Time-invariant risky return distribution, if this type draws idiosyncratic
+            risky returns from one.
+        AdjustPrb : float or None
+            Probability of being able to adjust the portfolio share, if this type
+            draws that shock from a time-invariant distribution.
+
+        """
+        IncShkDstns = []
+        for t_sim in range(self.T_sim):
+            t = t_sim % self.T_cycle
+            # Newborns use the first period, others follow the cycle as in get_shocks
+            if t_sim > 0 and self.cycles == 1:
+                t = t - 1
+            IncShkDstns.append(self.IncShkDstn[t])
+
+        RiskyDstn = getattr(self, "RiskyDstn", None)
+        if "RiskyDstn" in self.time_vary or getattr(self, "sim_common_Rrisky", True):
+            RiskyDstn = None
+
+        AdjustPrb = getattr(self, "AdjustPrb", None)
+        if "AdjustPrb" in self.time_vary:
+            AdjustPrb = None
+
+        return IncShkDstns, RiskyDstn, AdjustPrb
+
+    def get_shock_bank_signature(self):
+        """Makes a fingerprint of everything the shock bank depends on: the seed, the
+        population and horizon, and the probabilities (not the values) of each shock
+        distribution. Changes in atoms alone, like a different risky return belief,
+        leave the banked event indices valid.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        signature : str
+            Hex digest identifying a compatible shock bank.
+
+        """
+        IncShkDstns, RiskyDstn, AdjustPrb = self.get_shock_bank_dstns()
+        digest = hashlib.sha1(
+            repr((self.seed, self.AgentCount, self.T_sim, AdjustPrb)).encode(),
+        )
+        for dstn in [*IncShkDstns, RiskyDstn]:
+            if dstn is not None:
+                digest.update(np.ascontiguousarray(dstn.pmv, dtype=float).tobytes())
+        return digest.hexdigest()
+
+    def make_shock_bank(self):
+        """Draws every stochastic index of the simulation once and stores it in the
+        attribute shock_bank: income and risky return shocks as compact integer panels
+        of event indices into each period's distribution, and portfolio adjustment as
+        a boolean panel. Each kind of shock has its own random stream derived from
+        seed, so every call with the same seed gives the same bank. Initial assets need
+        no banking, as aNrmInit is drawn once in the parameters file.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        bank = {"signature": self.get_shock_bank_signature()}
+        bank.update(self.draw_shock_bank(np.random.SeedSequence(self.seed), self.AgentCount))
+        self.shock_bank = bank
+
+    def draw_shock_bank(self, seed_seq, n_agents):
+        """Draws the panels of a shock bank for n_agents agents, with one random stream
+        per kind of shock spawned from seed_seq. Used by make_shock_bank for the whole
+        population, and for each chunk of agents of a streaming simulation.
+
+        Parameters
+        ----------
+        seed_seq : np.random.SeedSequence
+            Seed sequence from which the random streams are spawned.
+        n_agents : int
+            Number of agents to draw shocks for.
+
+        Returns
+        -------
+        bank : dict
+            Panels of shock indices, as in the attribute shock_bank.
+
+        """
+        IncShkDstns, RiskyDstn, AdjustPrb = self.get_shock_bank_dstns()
+        IncRNG, RiskyRNG, AdjustRNG = (np.random.default_rng(seq) for seq in seed_seq.spawn(3))
+        size = (self.T_sim, n_agents)
+
+        def draw_events(RNG, pmvs):
+            dtype = np.min_scalar_type(max(pmv.size for pmv in pmvs) - 1)
+            events = np.empty(size, dtype=dtype)
+            for t, pmv in enumerate(pmvs):
+                cum_pmv = np.cumsum(pmv)
+                events[t] = np.minimum(
+                    cum_pmv.searchsorted(RNG.uniform(size=n_agents)),
+                    pmv.size - 1,
+                )
+            return events
+
+        bank = {"IncShk": draw_events(IncRNG, [dstn.pmv for dstn in IncShkDstns])}
+        if RiskyDstn is not None:
+            bank["Risky"] = draw_events(RiskyRNG, self.T_sim * [RiskyDstn.pmv])
+        if AdjustPrb is not None:
+            bank["Adjust"] = AdjustRNG.uniform(size=size) < AdjustPrb
+        return bank
+
+    def get_shocks(self):
+        """Gets this period's shocks by replaying the shock bank when it is in use, and
+        draws them as usual otherwise. Shocks without a banked panel are drawn live.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        if not self.use_shock_bank:
+            super().get_shocks()
+            return
+
+        bank = self.shock_bank
+        newborn = self.t_age == 0
+
+        # Income shocks, using the first period's distribution for newborns
+        events = bank["IncShk"][self.t_sim]
+        PermShkNow = np.zeros(self.AgentCount)
+        TranShkNow = np.zeros(self.AgentCount)
+        t_dstn = self.t_cycle - 1 if self.cycles == 1 else self.t_cycle.copy()
+        t_dstn[newborn] = 0
+        for t in np.unique(t_dstn):
+            these = t_dstn == t
+            IncShks = self.IncShkDstn[t].atoms[:, events[these]]
+            PermShkNow[these] = IncShks[0] * self.PermGroFac[t]
+            TranShkNow[these] = IncShks[1]
+        if not self.NewbornTransShk:
+            TranShkNow[newborn] = 1.0
+        self.shocks["PermShk"] = PermShkNow
+        self.shocks["TranShk"] = TranShkNow
+
+        # Risky returns and portfolio adjustment, for types that have them
+        if "Risky" in bank:
+            self.shocks["Risky"] = self.RiskyDstn.atoms[0][bank["Risky"][self.t_sim]]
+        elif hasattr(self, "RiskyDstn"):
+            self.get_Risky()
+        if "Adjust" in bank:
+            self.shocks["Adjust"] = bank["Adjust"][self.t_sim]
+        elif hasattr(self, "AdjustDstn"):
+            self.get_Adjust()
+
     def sim_birth(self, which_agents):
         """Alternate method for simulating initial states for simulated agents, drawing from a finite
         distribution.  Used to overwrite IndShockConsumerType.simBirth, which uses lognormal distributions.
@@ -56,6 +500,240 @@ class TempConsumerType(AgentType):
     def sim_death(self):
         return np.zeros(self.AgentCount, dtype=bool)
 
+    def assign_batch_row(self, row, param_names, prepare=None):
+        """Assigns one row of a batch of parameter vectors to this agent, then constructs
+        everything its solution depends on.
+
+        Parameters
+        ----------
+        row : np.array
+            Values of the parameters, in the order of param_names.
+        param_names : [str]
+            Names of the parameters.
+        prepare : callable or None
+            Function called with this agent to construct its attributes; update if None.
+
+        Returns
+        -------
+        None
+
+        """
+        self.assign_parameters(
+            **{name: float(value) for name, value in zip(param_names, row, strict=True)},
+        )
+        if prepare is None:
+            self.update()
+        else:
+            prepare(self)
+
+    def can_stack_solves(self):
+        """Checks whether solve_batch solves parameter vectors together in one stacked
+        backward induction, rather than one after the other.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        stacked : bool
+            Whether batches of solves are stacked.
+
+        """
+        return False
+
+    def solve_batch(self, param_matrix, param_names, prepare=None):
+        """Solves the model at K parameter vectors, one after the other. Types with a
+        stacked solver override this to solve all of them in one backward induction.
+
+        Parameters
+        ----------
+        param_matrix : np.array
+            Parameter values of shape (K, n_params), one vector per row.
+        param_names : [str]
+            Names of the n_params parameters, in column order.
+        prepare : callable or None
+            Function called with this agent after each row is assigned, to construct
+            everything the solution depends on; update if None.
+
+        Returns
+        -------
+        solutions : [list]
+            Solution of each row. The agent is left at the parameters of the last row,
+            with its solution.
+
+        """
+        solutions = []
+        for row in np.atleast_2d(param_matrix):
+            self.assign_batch_row(row, param_names, prepare)
+            self.solve()
+            solutions.append(self.solution)
+        return solutions
+
+    def get_payload(self, solution=None, history=None):
+        """Collects what it takes to rebuild this agent: its calibration and estimated
+        parameters (but none of the objects its constructors build), the attributes
+        in payload_attributes, the seeds and random number generator states of the
+        agent and of its constructed distributions, and optionally its solution and
+        simulated history. The distributions themselves are rebuilt by from_payload,
+        and the states make them draw what the sender's would have drawn.
+
+        Parameters
+        ----------
+        solution : bool or None
+            Whether to include the solution; pickle_solution if None.
+        history : bool or None
+            Whether to include the simulated history; pickle_history if None.
+
+        Returns
+        -------
+        payload : dict
+            Payload for rebuild_agent, with the schema version.
+
+        """
+        solution = self.pickle_solution if solution is None else solution
+        history = self.pickle_history if history is None else history
+        payload = {
+            "schema": agent_schema_version,
+            "type": type(self),
+            "parameters": {
+                key: getattr(self, key, value)
+                for key, value in self.parameters.items()
+                if key not in self.constructors
+            },
+            "init": {key: getattr(self, key) for key in ["seed", "tolerance", "verbose", "quiet"]},
+            "attributes": {
+                key: getattr(self, key)
+                for key in self.payload_attributes
+                if key in vars(self)
+            },
+            "rng_states": self.get_payload_rng_states(),
+        }
+        if solution and hasattr(self, "solution"):
+            payload["solution"] = self.solution
+        if history:
+            payload["history"] = self.history
+        return payload
+
+    def get_payload_rng_states(self):
+        """Gets the random number generator state of this agent, and the seeds and
+        states of its constructed distributions, for get_payload.
+
+        Returns
+        -------
+        rng_states : dict
+            States of the agent ("RNG") and of each constructed key that has any.
+
+        """
+        rng_states = {"RNG": self.RNG.bit_generator.state}
+        for key in self.constructors:
+            states = get_rng_states(getattr(self, key, None))
+            if states is not None and states != []:
+                rng_states[key] = states
+        return rng_states
+
+    @classmethod
+    def from_payload(cls, payload):
+        """Builds an agent from a payload made by get_payload. Called by rebuild_agent,
+        which checks the schema version first. When elide_constructors is True, the
+        agents of a type rebuilt in one process share a constructor memo, so only the
+        first of them runs every constructor; with use_shock_bank off, constructors
+        that take the random number generator still run for each of them. Each agent
+        then gets its own copies of the objects that hold random states, which are put
+        back from the payload, so that simulations draw the same shocks as the sender's
+        agent would, with or without the shock bank, whichever agent runs first.
+
+        Parameters
+        ----------
+        payload : dict
+            Payload of the agent.
+
+        Returns
+        -------
+        agent : TempConsumerType
+            The rebuilt agent.
+
+        """
+        agent = cls(**payload["init"], **payload["parameters"], construct=False)
+        for key, value in payload["attributes"].items():
+            setattr(agent, key, value)
+        if agent.elide_constructors:
+            agent.constructor_memo = payload_memos.setdefault(cls, {})
+            agent.constructor_stats = {
+                "built": 0,
+                "skipped": 0,
+                "seconds_spent": 0.0,
+                "seconds_saved": 0.0,
+            }
+        agent.construct_from_payload(payload)
+
+        rng_states = payload["rng_states"]
+        agent.RNG.bit_generator.state = rng_states["RNG"]
+        for key, states in rng_states.items():
+            if key == "RNG":
+                continue
+            value = getattr(agent, key, None)
+            if agent.elide_constructors:
+                # Objects restored from the shared memo would otherwise share their
+                # generators with the other agents rebuilt in this process
+                value = deepcopy(value)
+                agent.replace_constructed(key, value)
+            set_rng_states(value, states)
+        if "solution" in payload:
+            agent.solution = payload["solution"]
+        if "history" in payload:
+            agent.history = payload["history"]
+        return agent
+
+    def construct_from_payload(self, _payload):
+        """Builds the constructed objects of an agent made by from_payload.
+
+        Parameters
+        ----------
+        _payload : dict
+            Payload of the agent, which subclasses may build from.
+
+        Returns
+        -------
+        None
+
+        """
+        self.construct()
+
+    def replace_constructed(self, key, value):
+        """Puts a new object in place of a constructed one, such as a copy of it.
+
+        Parameters
+        ----------
+        key : str
+            Key of self.constructors.
+        value : object
+            Object to use from now on.
+
+        Returns
+        -------
+        None
+
+        """
+        setattr(self, key, value)
+        self.parameters[key] = value
+
+    def __reduce__(self):
+        return rebuild_agent, (self.get_payload(),)
+
+    def __copy__(self):
+        agent = object.__new__(type(self))
+        agent.__dict__.update(self.__dict__)
+        return agent
+
+    def __deepcopy__(self, memo):
+        # Copies keep everything, unlike pickles
+        agent = object.__new__(type(self))
+        memo[id(self)] = agent
+        for key, value in self.__dict__.items():
+            agent.__dict__[key] = deepcopy(value, memo)
+        return agent
+
 
 ### Overwrite sim_one_period to not have death or look up of agent ages
 
@@ -65,6 +743,255 @@ class IndShkLifeCycleConsumerType(TempConsumerType, IndShockConsumerType):
     consumers and specifies DiscFac as being age-dependent.  Called "temp" because only used here.
     """
 
+    # Solver for the lifecycle problem: "hark" for HARK's one period solver, or "egm"
+    # for the array kernel in estimark.egm (compiled with numba if solver_jit is True)
+    solver_backend = "hark"
+    solver_jit = False
+
+    def solve(self, verbose=False, presolve=True, from_solution=None, from_t=None):
+        """Solves the model by backward induction as IndShockConsumerType does, or with
+        the array kernel in estimark.egm when solver_backend is "egm" and the kernel
+        can solve this problem. The EGM solution is the same list of ConsumerSolution
+        objects, each also carrying its policy arrays as the attribute policy.
+
+        Parameters
+        ----------
+        verbose : bool, optional
+            If True, solution progress is printed to screen. Default False.
+        presolve : bool, optional
+            If True (default), the pre_solve method is run before solving.
+        from_solution : Solution
+            Starting point of backward induction instead of solution_terminal; only
+            supported by HARK's solver.
+        from_t : int or None
+            Period that from_solution represents; only supported by HARK's solver.
+
+        Returns
+        -------
+        None
+
+        """
+        if (
+            self.solver_backend != "egm"
+            or from_solution is not None
+            or not egm.can_solve_egm(self)
+        ):
+            super().solve(verbose, presolve, from_solution, from_t)
+            return
+
+        with np.errstate(divide="ignore", over="ignore", under="ignore", invalid="ignore"):
+            if presolve:
+                self.pre_solve()
+            policy = egm.solve_egm_policy(self, jit=self.solver_jit)
+            solution_terminal = None
+            if not self.pseudo_terminal:
+                solution_terminal = deepcopy(self.solution_terminal)
+            self.solution = egm.make_solution(policy, self.CRRA, solution_terminal)
+            self.post_solve()
+
+    def can_stack_solves(self):
+        """Checks whether solve_batch stacks parameter vectors: only with the "egm"
+        backend, for problems that estimark.egm can solve.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        stacked : bool
+            Whether batches of solves are stacked.
+
+        """
+        return self.solver_backend == "egm" and egm.can_solve_egm(self)
+
+    def solve_batch(self, param_matrix, param_names, prepare=None):
+        """Solves the model at K parameter vectors in one stacked backward induction
+        with estimark.egm when solver_backend is "egm", so every period is a single
+        array step for all K vectors; otherwise solves them one after the other.
+
+        Parameters
+        ----------
+        param_matrix : np.array
+            Parameter values of shape (K, n_params), one vector per row.
+        param_names : [str]
+            Names of the n_params parameters, in column order.
+        prepare : callable or None
+            Function called with this agent after each row is assigned, to construct
+            everything the solution depends on; update if None.
+
+        Returns
+        -------
+        solutions : [list]
+            Solution of each row. The agent is left at the parameters of the last row,
+            with its solution.
+
+        """
+        if not self.can_stack_solves():
+            return super().solve_batch(param_matrix, param_names, prepare)
+
+        inputs = []
+        terminals = []
+        with np.errstate(divide="ignore", over="ignore", under="ignore", invalid="ignore"):
+            for row in np.atleast_2d(param_matrix):
+                self.assign_batch_row(row, param_names, prepare)
+                self.pre_solve()
+                inputs.append(egm.get_egm_inputs(self))
+                terminals.append(
+                    None if self.pseudo_terminal else deepcopy(self.solution_terminal)
+                )
+            policies = egm.solve_egm_policies(inputs, jit=self.solver_jit)
+            solutions = [
+                egm.make_solution(policy, row_inputs["CRRA"], terminal)
+                for policy, row_inputs, terminal in zip(policies, inputs, terminals, strict=True)
+            ]
+            self.solution = solutions[-1]
+            self.post_solve()
+        return solutions
+
+
+class DualBeliefType:
+    """Mixin for agent types that hold more than one belief regime at once, such as the
+    subjective stock return beliefs used to solve the "(Stock)" specifications and the
+    true returns used to simulate them. Each regime is a dictionary of parameters.
+    The constructed objects that depend on those parameters (directly or through
+    other constructed objects) are built once per regime and kept side by side, so
+    switching regimes with use_beliefs swaps them in instead of constructing them
+    again. An object is only rebuilt when its other inputs have changed since it was
+    built for that regime.
+    """
+
+    belief_regimes = None
+    belief_now = None
+
+    def get_payload(self, solution=None, history=None):
+        """Collects the payload of TempConsumerType.get_payload, plus the belief
+        regimes and the one in use; the objects built for each regime are left out.
+        """
+        payload = super().get_payload(solution, history)
+        payload["beliefs"] = {"regimes": self.belief_regimes, "now": self.belief_now}
+        return payload
+
+    def construct_from_payload(self, payload):
+        """Builds the constructed objects as TempConsumerType.construct_from_payload
+        does, then sets up the belief regimes and switches to the one that was in use.
+        Objects of the other regimes are built when they are first switched to.
+        """
+        super().construct_from_payload(payload)
+        beliefs = payload["beliefs"]
+        if beliefs["regimes"] is not None:
+            self.set_belief_regimes(**beliefs["regimes"])
+            if beliefs["now"] is not None:
+                self.use_beliefs(beliefs["now"])
+
+    def replace_constructed(self, key, value):
+        """Puts a new object in place of a constructed one as
+        TempConsumerType.replace_constructed does, and stores it for the belief regime
+        in use if it was stored there.
+        """
+        if self.belief_now is not None:
+            stored = self.belief_objects[self.belief_now]
+            if key in stored and stored[key][1] is getattr(self, key, None):
+                fingerprint, _, inputs = stored[key]
+                stored[key] = (fingerprint, value, inputs)
+        super().replace_constructed(key, value)
+
+    def set_belief_regimes(self, **regimes):
+        """Defines the belief regimes of this agent and finds the constructed objects
+        that depend on them. No regime is in use until use_beliefs is called.
+
+        Parameters
+        ----------
+        **regimes : dict
+            Mapping from the name of each regime to its parameters.
+
+        Returns
+        -------
+        None
+
+        """
+        self.belief_regimes = regimes
+        self.belief_objects = {name: {} for name in regimes}
+        self.belief_now = None
+
+        # Objects built from belief parameters, or from other objects built from them
+        names = set().union(*regimes.values())
+        belief_args = {}
+        found = True
+        while found:
+            found = False
+            for key, constructor in self.constructors.items():
+                if constructor is None or key in belief_args:
+                    continue
+                args = set(get_arg_names(constructor))
+                if args & (names | set(belief_args)):
+                    belief_args[key] = args
+                    found = True
+
+        # Order them so that each comes after the belief objects it is built from
+        self.belief_keys = []
+        while len(self.belief_keys) < len(belief_args):
+            for key, args in belief_args.items():
+                if key not in self.belief_keys and args & set(belief_args) <= set(self.belief_keys):
+                    self.belief_keys.append(key)
+
+    def use_beliefs(self, name):
+        """Switches to one of the belief regimes: assigns its parameters and swaps in
+        its constructed objects, building those that are missing or out of date.
+
+        Parameters
+        ----------
+        name : str
+            Name of the regime, as passed to set_belief_regimes.
+
+        Returns
+        -------
+        None
+
+        """
+        self.assign_parameters(**self.belief_regimes[name])
+        self.belief_now = name
+        self.construct(*self.belief_keys)
+
+    def construct(self, *args, force=False):
+        """Builds constructed inputs as usual, except that once a belief regime is in
+        use, the objects that depend on beliefs are swapped in from those stored for
+        the regime when their inputs are unchanged, and stored after being built.
+
+        Parameters
+        ----------
+        *args : str, optional
+            Keys of self.constructors to be constructed; all of them if none are given.
+        force : bool, optional
+            Whether to force past errors, as in AgentType.construct.
+
+        Returns
+        -------
+        None
+
+        """
+        keys = list(args) if len(args) > 0 else list(self.constructors)
+        if self.belief_now is None:
+            super().construct(*keys, force=force)
+            return
+
+        # Nothing else depends on belief objects, so they can come last
+        regular = [key for key in keys if key not in self.belief_keys]
+        if regular:
+            super().construct(*regular, force=force)
+        stored = self.belief_objects[self.belief_now]
+        for key in self.belief_keys:
+            if key not in keys:
+                continue
+            fingerprint, inputs = self.get_constructor_fingerprint(key)
+            if fingerprint is not None and key in stored and stored[key][0] == fingerprint:
+                setattr(self, key, stored[key][1])
+                self.parameters[key] = stored[key][1]
+                continue
+            super().construct(key, force=force)
+            if fingerprint is not None and hasattr(self, key):
+                stored[key] = (fingerprint, getattr(self, key), inputs)
+
 
 class PortfolioLifeCycleConsumerType(TempConsumerType, PortfolioConsumerType):
     """A very lightly edited version of PortfolioConsumerType.  Uses an alternate method of making new
@@ -105,3 +1032,21 @@ class WealthPortfolioLifeCycleConsumerType(
     """A very lightly edited version of WealthPortfolioConsumerType.  Uses an alternate method of making new
     consumers and specifies DiscFac as being age-dependent.  Called "temp" because only used here.
     """
+
+
+class PortfolioDualBeliefLifeCycleConsumerType(DualBeliefType, PortfolioLifeCycleConsumerType):
+    """PortfolioLifeCycleConsumerType that keeps its subjective and true beliefs side by side."""
+
+
+class BequestWarmGlowDualBeliefLifeCyclePortfolioType(
+    DualBeliefType,
+    BequestWarmGlowLifeCyclePortfolioType,
+):
+    """BequestWarmGlowLifeCyclePortfolioType that keeps its subjective and true beliefs side by side."""
+
+
+class WealthPortfolioDualBeliefLifeCycleConsumerType(
+    DualBeliefType,
+    WealthPortfolioLifeCycleConsumerType,
+):
+    """WealthPortfolioLifeCycleConsumerType that keeps its subjective and true beliefs side by side."""
@@ -0,0 +1,166 @@
+"""In-process cache of solved agents for the Life-Cycle-Prime-Time estimation.
+Optimizers, multistart samplers, numerical derivatives and the bootstrap often
+revisit parameter vectors that have already been solved; the cache stores each
+agent.solution list under the (rounded) estimated parameters so those revisits
+skip the solve entirely.
+"""
+
+from __future__ import annotations
+
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+# Belief regimes that change the solution of an otherwise identical agent
+belief_regimes = ("(Stock)", "(Labor)")
+
+
+def estimate_nbytes(obj, seen=None):
+    """
+    Roughly measure the memory held by an object, following lists, tuples, dicts
+    and instance attributes. Numpy arrays are counted by their data buffers.
+    Objects reachable through more than one path are only counted once.
+
+    Parameters
+    ----------
+    obj : object
+        Object to measure, usually the solution list of a solved agent.
+    seen : set or None
+        Set of object ids that have already been counted.
+
+    Returns
+    -------
+    nbytes : int
+        Approximate number of bytes held by obj.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    nbytes = sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple)):
+        nbytes += sum(estimate_nbytes(item, seen) for item in obj)
+    elif isinstance(obj, dict):
+        nbytes += sum(estimate_nbytes(item, seen) for item in obj.values())
+    elif hasattr(obj, "__dict__"):
+        nbytes += estimate_nbytes(vars(obj), seen)
+    return nbytes
+
+
+class SolutionCache:
+    """
+    Least-recently-used cache of agent.solution lists, keyed on the agent name,
+    its belief regime, its calibration hash and the rounded values of the estimated
+    parameters. When the stored solutions exceed the memory budget, the least
+    recently used ones are evicted first.
+
+    Parameters
+    ----------
+    max_mb : float
+        Memory budget for stored solutions, in megabytes. A budget of zero
+        disables the cache.
+    digits : int
+        Number of decimal places that parameter values are rounded to when
+        making keys, so that evaluations differing only by floating point
+        noise share a solution.
+    """
+
+    def __init__(self, max_mb=512.0, digits=10):
+        self.max_bytes = int(max_mb * 2**20)
+        self.digits = digits
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, agent, params):
+        """
+        Make the cache key for an agent solved at the given parameters.
+
+        Parameters
+        ----------
+        agent : AgentType
+            Agent being estimated; its name identifies the specification.
+        params : dict
+            Mapping from estimated parameter names to values.
+
+        Returns
+        -------
+        key : tuple
+            Hashable key identifying the solution.
+        """
+        regime = tuple(label for label in belief_regimes if label in agent.name)
+        rounded = tuple(
+            (name, round(float(value), self.digits))
+            for name, value in sorted(params.items())
+        )
+        return (agent.name, regime, getattr(agent, "calibration_hash", ""), rounded)
+
+    def get(self, key):
+        """
+        Look up a stored solution, marking it as most recently used. Returns
+        None (and counts a miss) if the key is not in the cache.
+        """
+        solution = self.entries.get(key)
+        if solution is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return solution[0]
+
+    def put(self, key, solution):
+        """
+        Store a solution, evicting least recently used entries until the cache
+        fits in its memory budget. Solutions larger than the whole budget are
+        not stored.
+        """
+        size = estimate_nbytes(solution)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+        self.entries[key] = (solution, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, old_size) = self.entries.popitem(last=False)
+            self.nbytes -= old_size
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all stored solutions and reset the counters."""
+        self.entries.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """
+        Report the cache counters.
+
+        Returns
+        -------
+        stats : dict
+            Numbers of hits, misses, evictions and stored entries, and the memory
+            held by stored solutions in megabytes.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "size_mb": self.nbytes / 2**20,
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
@@ -0,0 +1,175 @@
+"""Checkpoint files for resuming long Life-Cycle-Prime-Time runs.
+Estimations, bootstrap replicates and whole specifications are checkpointed to
+small JSON files in the save directory as they progress:
+
+    <agent>_history_<key>.jsonl  every criterion evaluation of the optimizer, where
+                                 key identifies the calibration and the targets
+    <agent>_bootstrap.jsonl      every finished bootstrap replicate
+    <agent>_checkpoint.json      the stages of estimate() that have finished
+
+Records are appended one line at a time (or replaced atomically), so a run that
+is killed part way leaves every completed record readable.
+"""
+
+from __future__ import annotations
+
+import inspect
+import json
+from pathlib import Path
+from time import time
+
+import numpy as np
+
+from estimark.lazy import lazy_import
+from estimark.store import hash_object
+
+pd = lazy_import("pandas")
+
+
+def append_record(path, record):
+    """
+    Append one JSON record to a JSON lines file, creating it if needed.
+    """
+    line = json.dumps(record) + "\n"
+    with Path(path).open("a") as f:
+        f.write(line)
+
+
+def read_records(path):
+    """
+    Read all complete records of a JSON lines file, skipping a final line that
+    was cut off by an interrupted write. Returns an empty list if there is no file.
+    """
+    path = Path(path)
+    if not path.exists():
+        return []
+    records = []
+    with path.open() as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def read_state(path):
+    """
+    Read a JSON checkpoint file, returning an empty dict if there is none.
+    """
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def write_state(path, state):
+    """
+    Write a JSON checkpoint file atomically, so that it is never left half-written.
+    """
+    path = Path(path)
+    temp_path = path.with_suffix(path.suffix + ".tmp")
+    temp_path.write_text(json.dumps(state, indent=4))
+    temp_path.replace(path)
+
+
+class CriterionHistory:
+    """
+    Wrapper of a criterion function that appends every evaluation to a JSON lines
+    history file. It can be pickled, so it also records evaluations made by the
+    worker processes of a parallel optimizer.
+
+    Parameters
+    ----------
+    criterion : callable
+        Criterion function taking a params dict (plus keyword arguments) and
+        returning a number or a dict with a "value" entry.
+    path : str or Path
+        Location of the history file.
+    """
+
+    def __init__(self, criterion, path):
+        self.criterion = criterion
+        self.path = Path(path)
+        # Optimizers match keyword arguments against the wrapped signature
+        self.__signature__ = inspect.signature(criterion)
+
+    def __call__(self, params, **kwargs):
+        out = self.criterion(params, **kwargs)
+        value = out["value"] if isinstance(out, dict) else out
+        append_record(
+            self.path,
+            {
+                "params": {key: float(np.squeeze(x)) for key, x in params.items()},
+                "value": float(value),
+                "time": time(),
+            },
+        )
+        return out
+
+
+def get_history_path(save_dir, agent_name, calibration_hash, target_hash):
+    """
+    Locate the optimizer history of a specification. Evaluations are only
+    comparable on the same calibration and targets, so each combination of them
+    has its own file.
+
+    Parameters
+    ----------
+    save_dir : Path
+        Directory of the checkpoint files.
+    agent_name : str
+        Name of the agent specification.
+    calibration_hash : str
+        Calibration hash of the agent.
+    target_hash : str
+        Hash of the empirical moments and weights that the criterion targets.
+
+    Returns
+    -------
+    path : Path
+        Location of the history file.
+    """
+    key = hash_object({"calibration_hash": calibration_hash, "target_hash": target_hash})
+    return Path(save_dir) / f"{agent_name}_history_{key[:12]}.jsonl"
+
+
+def read_history(path):
+    """
+    Read an optimizer history file into a DataFrame with one column per parameter,
+    plus the criterion value and the time of each evaluation.
+    """
+    records = read_records(path)
+    history = pd.DataFrame([record["params"] for record in records])
+    history["value"] = [record["value"] for record in records]
+    history["time"] = [record["time"] for record in records]
+    return history
+
+
+def get_best_params(path, param_names):
+    """
+    Find the evaluation with the lowest criterion value in an optimizer history,
+    among those that estimated exactly the parameters in param_names.
+
+    Parameters
+    ----------
+    path : str or Path
+        Location of the history file.
+    param_names : [str]
+        Names of the estimated parameters.
+
+    Returns
+    -------
+    best_params : dict or None
+        Mapping from parameter names to values, or None if there is no such
+        evaluation.
+    """
+    records = [
+        record
+        for record in read_records(path)
+        if set(record["params"]) == set(param_names) and np.isfinite(record["value"])
+    ]
+    if not records:
+        return None
+    best = min(records, key=lambda record: record["value"])
+    return {key: best["params"][key] for key in param_names}
@@ -0,0 +1,300 @@
+"""Binary columnar cache of the input data for the Life-Cycle-Prime-Time estimation.
+Each dataset is converted once from its source file (a CSV or an Excel workbook)
+into a directory of .npy files, one per column, together with the sorted
+GroupIndex arrays that its moments are computed from. Later runs, and every worker
+process, memory-map those files instead of parsing the source again, so the
+operating system keeps a single copy of the data in memory.
+
+A small pointer file per dataset records the directory in use and the size and
+modification time of the source. When those change, the source is hashed again
+and the table is rebuilt if its contents (or the settings of the sample, such as
+the ages and education level in parameters.py) have changed:
+
+    <cache>/data/scf.json           pointer to the current table
+    <cache>/data/scf-<key>/         manifest.json and one .npy file per array
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from estimark.lazy import lazy_import
+from estimark.moments import GroupIndex, get_group_codes
+from estimark.store import hash_object
+
+pd = lazy_import("pandas")
+
+# Version of the layout of the cached tables; changing it rebuilds all of them
+table_format = 1
+
+
+def file_digest(path):
+    """
+    Hash the contents of a file into a hex string.
+    """
+    digest = hashlib.sha1()
+    with Path(path).open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def compact_array(values):
+    """
+    Store values in the smallest dtype that holds them exactly: integers in the
+    narrowest integer type for their range, and floats in float32 when that
+    round-trips every value (otherwise they stay float64, so that no moment of
+    the data changes).
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in "iu":
+        if values.size == 0:
+            return values.astype(np.int8)
+        for dtype in (np.int8, np.int16, np.int32):
+            info = np.iinfo(dtype)
+            if info.min <= values.min() and values.max() <= info.max:
+                return values.astype(dtype)
+        return values.astype(np.int64)
+    if values.dtype.kind == "f":
+        single = values.astype(np.float32)
+        if np.array_equal(single.astype(values.dtype), values, equal_nan=True):
+            return single
+        return values.astype(np.float64)
+    return values
+
+
+class ColumnarTable:
+    """
+    Read-only table of memory-mapped columns, as written by write_table. Numeric
+    columns are returned as arrays in their stored (compact) dtype; categorical
+    columns are stored as integer codes and returned as arrays of their labels.
+
+    Parameters
+    ----------
+    path : str or Path
+        Directory of the table.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.manifest = json.loads((self.path / "manifest.json").read_text())
+        self.n_rows = self.manifest["n_rows"]
+        self.categories = {
+            name: column["categories"]
+            for name, column in self.manifest["columns"].items()
+            if "categories" in column
+        }
+        self._arrays = {}
+        self._group_indices = {}
+
+    def load_array(self, file_name):
+        """
+        Memory-map one of the .npy files of the table, opening each file only once.
+        """
+        if file_name not in self._arrays:
+            self._arrays[file_name] = np.load(self.path / file_name, mmap_mode="r")
+        return self._arrays[file_name]
+
+    @property
+    def columns(self):
+        """Names of the columns of the table."""
+        return list(self.manifest["columns"])
+
+    def codes(self, name):
+        """Integer codes of a categorical column, numbered in the order of its categories."""
+        return self.load_array(self.manifest["columns"][name]["file"])
+
+    def __len__(self):
+        return self.n_rows
+
+    def __getitem__(self, name):
+        values = self.codes(name)
+        if name in self.categories:
+            return np.asarray(self.categories[name], dtype=object)[values]
+        return values
+
+    def get_group_index(self, variable, weights=None, groups=None, mapping=None):
+        """
+        Get the GroupIndex made for these variables when the table was built, or
+        None if there is no such index.
+
+        Parameters
+        ----------
+        variable : str
+            Name of the variable that the index sorts.
+        weights : str or None
+            Name of the weighting variable, if any.
+        groups : str
+            Name of the grouping variable.
+        mapping : iterable
+            Group labels, in the order they are numbered in the index.
+
+        Returns
+        -------
+        index : GroupIndex or None
+            Index with memory-mapped arrays.
+        """
+        key = (variable, weights, groups, tuple(mapping))
+        if key not in self._group_indices:
+            index = None
+            for spec in self.manifest["indices"]:
+                spec_key = (spec["variable"], spec["weights"], spec["groups"], tuple(spec["labels"]))
+                if spec_key == key:
+                    arrays = {
+                        name: self.load_array(file_name)
+                        for name, file_name in spec["files"].items()
+                    }
+                    index = GroupIndex.from_arrays(arrays, self.n_rows)
+            self._group_indices[key] = index
+        return self._group_indices[key]
+
+    def to_frame(self):
+        """
+        Copy the table into a DataFrame, with categorical columns as pd.Categorical
+        and numeric columns widened back to int64 and float64.
+        """
+        frame = {}
+        for name in self.columns:
+            values = self.codes(name)
+            if name in self.categories:
+                frame[name] = pd.Categorical.from_codes(
+                    np.asarray(values, dtype=np.int64),
+                    categories=self.categories[name],
+                )
+            elif values.dtype.kind in "iu":
+                frame[name] = np.asarray(values, dtype=np.int64)
+            else:
+                frame[name] = np.asarray(values, dtype=np.float64)
+        return pd.DataFrame(frame)
+
+
+def write_table(path, frame, categories=None, indices=()):
+    """
+    Write a DataFrame into a directory of .npy files that can be opened as a
+    ColumnarTable, along with the GroupIndex of each requested variable.
+
+    Parameters
+    ----------
+    path : Path
+        Directory to write; it should not exist yet.
+    frame : pd.DataFrame
+        Data to store.
+    categories : dict or None
+        Mapping from names of categorical columns to their list of labels. The
+        labels of the data that are not listed are added after the listed ones.
+    indices : [dict]
+        GroupIndex arrays to store, each given by its variable, weights, groups and
+        labels (the group labels, in order).
+    """
+    categories = {} if categories is None else categories
+    path.mkdir(parents=True)
+
+    manifest = {"format": table_format, "n_rows": len(frame), "columns": {}, "indices": []}
+    for name in frame.columns:
+        column = {"file": f"{name}.npy"}
+        if name in categories:
+            labels = list(categories[name])
+            labels += sorted(set(frame[name].astype(str)) - set(labels))
+            column["categories"] = labels
+            values = compact_array(get_group_codes(frame[name].astype(str), labels))
+        else:
+            values = compact_array(frame[name].to_numpy())
+        column["dtype"] = values.dtype.str
+        np.save(path / column["file"], values)
+        manifest["columns"][name] = column
+
+    for n, spec in enumerate(indices):
+        labels = list(spec["labels"])
+        index = GroupIndex(
+            frame[spec["variable"]].to_numpy(dtype=float),
+            get_group_codes(frame[spec["groups"]].astype(str), labels),
+            len(labels),
+            weights=frame[spec["weights"]].to_numpy(dtype=float) if spec["weights"] else None,
+        )
+        files = {}
+        for name, values in index.to_arrays().items():
+            files[name] = f"index{n}-{name}.npy"
+            np.save(path / files[name], values)
+        manifest["indices"].append({**spec, "labels": labels, "files": files})
+
+    # The manifest is written last, so a table without one is incomplete
+    (path / "manifest.json").write_text(json.dumps(manifest, indent=4))
+
+
+def get_table(name, source, build, settings, cache_dir):
+    """
+    Open the cached columnar table of a dataset, building it first if the cache is
+    missing or out of date. The size and modification time of the source are
+    checked on every call; the source is only hashed again when they change.
+
+    Parameters
+    ----------
+    name : str
+        Name of the dataset, used for its files in the cache directory.
+    source : Path
+        Location of the source file.
+    build : callable
+        Function of the source path returning (frame, categories, indices), the
+        arguments of write_table other than the path.
+    settings : dict
+        Everything else the table depends on, such as the sample selection.
+    cache_dir : Path
+        Directory that holds the cached tables.
+
+    Returns
+    -------
+    table : ColumnarTable
+        The memory-mapped table.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    pointer_path = cache_dir / f"{name}.json"
+    stat = source.stat()
+    source_info = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    settings_hash = hash_object({"format": table_format, "settings": settings})
+
+    pointer = json.loads(pointer_path.read_text()) if pointer_path.exists() else {}
+    table_path = cache_dir / pointer.get("table", "")
+    if (
+        pointer.get("source") == source_info
+        and pointer.get("settings_hash") == settings_hash
+        and (table_path / "manifest.json").exists()
+    ):
+        return ColumnarTable(table_path)
+
+    # The source looks different, so hash it to see whether it really is
+    key = hash_object({"source": file_digest(source), "settings": settings_hash})
+    table_path = cache_dir / f"{name}-{key[:16]}"
+    if not (table_path / "manifest.json").exists():
+        print(f"Building the columnar cache of {name} from {source.name}.")
+        frame, categories, indices = build(source)
+        temp_path = cache_dir / f"{table_path.name}.{os.getpid()}.tmp"
+        shutil.rmtree(temp_path, ignore_errors=True)
+        write_table(temp_path, frame, categories, indices)
+        try:
+            temp_path.replace(table_path)
+        except OSError:
+            # Another process built the same table first
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+    pointer = {
+        "table": table_path.name,
+        "source": source_info,
+        "settings_hash": settings_hash,
+    }
+    temp_pointer = pointer_path.with_suffix(f".{os.getpid()}.tmp")
+    temp_pointer.write_text(json.dumps(pointer, indent=4))
+    temp_pointer.replace(pointer_path)
+
+    # Tables of older versions of the source are no longer needed
+    for old_path in cache_dir.glob(f"{name}-*"):
+        if old_path.is_dir() and old_path != table_path and not old_path.name.endswith(".tmp"):
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    return ColumnarTable(table_path)
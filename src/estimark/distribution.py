@@ -0,0 +1,212 @@
+"""Deterministic moments of the solved lifecycle agent types in estimark.agents, by
+iterating the distribution of agents over a fine histogram (Young's method) rather
+than simulating them. Everyone is born together from the distribution of aNrmInit
+and nobody dies, so the population at each age is one distribution over normalized
+market resources. Each period, the mass at every gridpoint of market resources is
+carried through that period's policy functions and every combination of income
+shock and risky return, and the resulting market resources are split between
+the two nearest gridpoints of the next period's histogram in proportion to their
+distance. Medians are read off the cumulative distributions, interpolating
+linearly between the midpoints of the grids, so the moments are smooth in the
+parameters and free of simulation noise.
+
+The timing and shocks are those of estimark.simulation.simulate_lifecycle, of which
+the histogram is the large population limit.
+"""
+
+from __future__ import annotations
+
+import importlib
+
+import numpy as np
+
+from estimark.lazy import lazy_import
+from estimark.simulation import is_portfolio_solution
+
+agents = lazy_import("estimark.agents")
+egm = lazy_import("estimark.egm")
+
+# Variables whose distributions the histogram can record
+histogram_vars = {"bNrm", "mNrm", "cNrm", "aNrm", "Share"}
+
+
+def can_iterate_distribution(agent):
+    """
+    Check whether iterate_distribution_medians covers this agent: it must be a
+    solved lifecycle type from estimark.agents whose portfolio share, if it has one,
+    is adjusted every period, with idiosyncratic risky returns.
+
+    Parameters
+    ----------
+    agent : AgentType
+        Agent whose moments are wanted.
+
+    Returns
+    -------
+    iterable : bool
+        Whether the histogram can be used.
+    """
+    if not isinstance(agent, agents.TempConsumerType):
+        return False
+    if agent.cycles != 1 or not hasattr(agent, "solution"):
+        return False
+    if is_portfolio_solution(agent):
+        _, RiskyDstn, AdjustPrb = agent.get_shock_bank_dstns()
+        return RiskyDstn is not None and AdjustPrb == 1.0
+    return True
+
+
+def make_histogram_grid(grid_max, grid_count, nest=3):
+    """
+    Make the gridpoints of a histogram of normalized wealth, from zero to grid_max
+    and multi-exponentially spaced so that most of them are at low wealth.
+    """
+    # Imported on first use, as importing HARK is slow
+    utilities = importlib.import_module("HARK.utilities")
+    return utilities.make_grid_exp_mult(0.0, grid_max, grid_count, nest)
+
+
+def distribute_mass(values, weights, grid):
+    """
+    Split the weight of each value between the two gridpoints around it, in
+    proportion to its distance from each (Young's method). Values beyond the ends
+    of the grid are put on the end points.
+
+    Parameters
+    ----------
+    values : np.array
+        Locations of the masses.
+    weights : np.array
+        Masses, of the same shape as values.
+    grid : np.array
+        Increasing gridpoints of the histogram.
+
+    Returns
+    -------
+    mass : np.array
+        Mass at each gridpoint.
+    """
+    values = values.ravel()
+    weights = weights.ravel()
+    j = np.clip(np.searchsorted(grid, values, side="right") - 1, 0, grid.size - 2)
+    upper = np.clip((values - grid[j]) / (grid[j + 1] - grid[j]), 0.0, 1.0)
+    mass = np.bincount(j, weights * (1.0 - upper), minlength=grid.size)
+    mass += np.bincount(j + 1, weights * upper, minlength=grid.size)
+    return mass
+
+
+def get_histogram_median(grid, mass):
+    """
+    Median of a histogram, taking the mass at each gridpoint to be spread evenly
+    between the midpoints to its neighbors, so the cumulative distribution is
+    interpolated linearly between midpoints.
+    """
+    edges = np.concatenate([grid[:1], 0.5 * (grid[1:] + grid[:-1]), grid[-1:]])
+    cdf = np.concatenate([[0.0], np.cumsum(mass) / mass.sum()])
+    j = int(np.searchsorted(cdf, 0.5, side="left"))
+    return edges[j - 1] + (0.5 - cdf[j - 1]) / (cdf[j] - cdf[j - 1]) * (edges[j] - edges[j - 1])
+
+
+def iterate_distribution_medians(agent, groups, sim_periods, grid, share_grid):
+    """
+    Find the medians of variables over groups of periods from the distribution of a
+    population of agents, iterated forward on a histogram of market resources.
+
+    Parameters
+    ----------
+    agent : TempConsumerType
+        Solved agent for which can_iterate_distribution is True.
+    groups : dict
+        Mapping from moment names to pairs of a variable name in histogram_vars and
+        an array of the periods whose pooled values the moment is the median of.
+    sim_periods : int
+        Number of periods to iterate, at least one more than the last period in
+        groups.
+    grid : np.array
+        Gridpoints of the histograms of market resources and other wealth variables.
+    share_grid : np.array
+        Gridpoints of the histograms of the risky share.
+
+    Returns
+    -------
+    medians : dict
+        Mapping from moment names to medians.
+    """
+    portfolio = is_portfolio_solution(agent)
+    if portfolio:
+        RiskyDstn = agent.get_shock_bank_dstns()[1]
+    Rfree = np.array(agent.Rfree)
+    histograms = {
+        name: np.zeros((share_grid if var_name == "Share" else grid).size)
+        for name, (var_name, periods) in groups.items()
+    }
+    in_period = [
+        [name for name, (var_name, periods) in groups.items() if t_sim in periods]
+        for t_sim in range(sim_periods)
+    ]
+
+    # Everyone is born with the draws of aNrmInit, as in TempConsumerType.sim_birth
+    aNrm, counts = np.unique(np.asarray(agent.aNrmInit, dtype=float), return_counts=True)
+    weights = counts / counts.sum()
+    Share = np.zeros(aNrm.size)
+
+    for t_sim in range(sim_periods):
+        t = t_sim % agent.T_cycle
+        solution = agent.solution[t]
+
+        # Newborns use the first period's distribution, others the one before t_cycle
+        t_dstn = 0 if t_sim == 0 else t - 1
+        IncShkDstn = agent.IncShkDstn[t_dstn]
+        PermShk = IncShkDstn.atoms[0] * agent.PermGroFac[t_dstn]
+        TranShk = IncShkDstn.atoms[1]
+        if t_sim == 0 and not agent.NewbornTransShk:
+            TranShk = np.ones_like(TranShk)
+
+        # Return on last period's portfolio, for each gridpoint and risky return
+        if portfolio and t_sim > 0:
+            Risky = RiskyDstn.atoms[0]
+            RfreeNow = Share[:, None] * Risky[None, :] + (1.0 - Share[:, None]) * Rfree[t]
+            RiskyPrb = RiskyDstn.pmv
+        else:
+            RfreeNow = np.full((aNrm.size, 1), Rfree[t])
+            RiskyPrb = np.ones(1)
+
+        # Transition to this period's states, for every combination of shocks
+        bNrm = (RfreeNow[:, :, None] / PermShk[None, None, :]) * aNrm[:, None, None]
+        prob = weights[:, None, None] * RiskyPrb[None, :, None] * IncShkDstn.pmv[None, None, :]
+        mass = distribute_mass(bNrm + TranShk[None, None, :], prob, grid)
+
+        # Controls at the gridpoints that have mass
+        points = np.flatnonzero(mass > 0.0)
+        mNrm = grid[points]
+        weights = mass[points]
+        if not portfolio and hasattr(solution, "policy"):
+            # Solved by estimark.egm, so skip the interpolator objects
+            cNrm = egm.eval_policy(solution.policy, mNrm)
+        elif not portfolio:
+            cNrm = solution.cFunc(mNrm)
+        else:
+            cNrm = solution.cFuncAdj(mNrm)
+            Share = solution.ShareFuncAdj(mNrm)
+        aNrm = mNrm - cNrm
+
+        # Add this period's distributions to the moments that pool it
+        now = {}
+        for name in in_period[t_sim]:
+            var_name = groups[name][0]
+            if var_name not in now:
+                if var_name == "bNrm":
+                    now[var_name] = distribute_mass(bNrm, prob, grid)
+                elif var_name == "mNrm":
+                    now[var_name] = mass
+                elif var_name == "Share":
+                    now[var_name] = distribute_mass(Share, weights, share_grid)
+                else:
+                    values = {"cNrm": cNrm, "aNrm": aNrm}[var_name]
+                    now[var_name] = distribute_mass(values, weights, grid)
+            histograms[name] += now[var_name]
+
+    return {
+        name: get_histogram_median(share_grid if groups[name][0] == "Share" else grid, mass)
+        for name, mass in histograms.items()
+    }
@@ -0,0 +1,662 @@
+"""Array-based endogenous grid method (EGM) solver for IndShkLifeCycleConsumerType.
+HARK's generic solver handles each period of the lifecycle by building interpolator
+and distribution objects and taking expectations through them. For the estimark
+calibration (CRRA utility, discrete income shocks, a fixed grid of assets above
+the borrowing constraint, and age-varying LivPrb, PermGroFac and Rfree) the whole
+backward induction reduces to a recursion on small arrays: the consumption function
+of each period is a linear interpolation through (mNrm, cNrm) knots, with HARK's
+decay extrapolation above the top knot and the borrowing constraint below it.
+
+The recursion runs in NumPy, or as a numba-compiled loop when numba is installed
+and jit is requested. The NumPy kernel performs the same floating point operations
+as HARK's solve_one_period_ConsIndShock, so its policies match HARK's exactly; the
+compiled kernel sums expectations in a different order and matches to rounding.
+The policies are returned as arrays, and can be wrapped into the usual list of
+HARK ConsumerSolution objects for everything else that uses agent.solution.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from estimark.lazy import lazy_import
+
+interpolation = lazy_import("HARK.interpolation")
+utilities = lazy_import("HARK.utilities")
+ConsIndShockModel = lazy_import("HARK.ConsumptionSaving.ConsIndShockModel")
+
+try:
+    import numba
+except ImportError:  # The compiled kernel is optional
+    numba = None
+
+
+def get_decay_extrap(x, y, intercept, slope):
+    """
+    Find the parameters of the decay extrapolation that HARK's LinearInterp uses
+    above its top knot, approaching the limiting linear function from below, for
+    K consumption functions at once.
+
+    Parameters
+    ----------
+    x, y : np.array
+        Knots of market resources and consumption, of shape (K, n).
+    intercept, slope : np.array
+        Limiting linear consumption functions, of shape (K,).
+
+    Returns
+    -------
+    decay : np.array
+        Whether decay extrapolation is used; if not, the top segment is extended.
+    A : np.array
+        Gap between the limiting function and the interpolant at the top knot.
+    B : np.array
+        Rate at which the gap decays.
+    """
+    slope_at_top = (y[:, -1] - y[:, -2]) / (x[:, -1] - x[:, -2])
+    level_diff = intercept + slope * x[:, -1] - y[:, -1]
+    slope_diff = slope - slope_at_top
+    decay = ~np.isclose(slope, slope_at_top, atol=1e-15)
+    A = np.where(decay, level_diff, 0.0)
+    B = np.where(decay, -slope_diff / level_diff, 0.0)
+    return decay, A, B
+
+
+def eval_consumption_stacked(m, x, y, intercept, slope, decay, A, B, mNrmMin=None):
+    """
+    Evaluate K consumption functions given by their knots, each at its own array of
+    market resources, exactly as HARK evaluates LowerEnvelope(LinearInterp(x, y,
+    intercept, slope), constrained function) for each of them.
+
+    Parameters
+    ----------
+    m : np.array
+        Normalized market resources, of shape (K, ...).
+    x, y : np.array
+        Knots of market resources and consumption, of shape (K, n).
+    intercept, slope : np.array
+        Limiting linear consumption functions as m goes to infinity, of shape (K,).
+    decay : np.array
+        Whether to use decay extrapolation above the top knot, of shape (K,).
+    A, B : np.array
+        Parameters of the decay extrapolation, of shape (K,).
+    mNrmMin : np.array or None
+        Minimum market resources, where the borrowing constraint binds; None for
+        unconstrained functions (like the terminal one).
+
+    Returns
+    -------
+    c : np.array
+        Consumption at m, of the same shape; NaN below the first knot.
+    """
+    shape = m.shape
+    K = x.shape[0]
+    m = m.reshape(K, -1)
+    i = np.empty(m.shape, dtype=np.intp)
+    for k in range(K):
+        i[k] = np.searchsorted(x[k, :-1], m[k])
+    i = np.maximum(i, 1)
+    x0 = np.take_along_axis(x, i - 1, axis=1)
+    x1 = np.take_along_axis(x, i, axis=1)
+    alpha = (m - x0) / (x1 - x0)
+    c = (1.0 - alpha) * np.take_along_axis(y, i - 1, axis=1) + alpha * np.take_along_axis(
+        y, i, axis=1
+    )
+    c = np.where(m < x[:, :1], np.nan, c)
+    if np.any(decay):
+        top = x[:, -1:]
+        extrap = intercept[:, None] + slope[:, None] * m - A[:, None] * np.exp(
+            -B[:, None] * (m - top)
+        )
+        c = np.where(decay[:, None] & (m > top), extrap, c)
+    if mNrmMin is None:
+        return c.reshape(shape)
+
+    # Consuming everything above the constraint, as LinearInterp([mMin, mMin + 1], [0, 1])
+    mNrmMin = mNrmMin[:, None]
+    alpha = (m - mNrmMin) / ((mNrmMin + 1.0) - mNrmMin)
+    c_cnst = np.where(m < mNrmMin, np.nan, (1.0 - alpha) * 0.0 + alpha * 1.0)
+    return np.minimum(c, c_cnst).reshape(shape)
+
+
+def eval_consumption(m, x, y, intercept, slope, decay, A, B, mNrmMin=None):
+    """
+    Evaluate one consumption function given by its knots, as eval_consumption_stacked
+    does for several.
+
+    Parameters
+    ----------
+    m : np.array
+        Normalized market resources, of any shape.
+    x, y : np.array
+        Knots of market resources and consumption.
+    intercept, slope : float
+        Limiting linear consumption function as m goes to infinity.
+    decay : bool
+        Whether to use decay extrapolation above the top knot.
+    A, B : float
+        Parameters of the decay extrapolation.
+    mNrmMin : float or None
+        Minimum market resources, where the borrowing constraint binds; None for
+        an unconstrained function.
+
+    Returns
+    -------
+    c : np.array
+        Consumption at m; NaN below the first knot.
+    """
+    m = np.asarray(m, dtype=float)
+    c = eval_consumption_stacked(
+        m[None],
+        np.asarray(x)[None],
+        np.asarray(y)[None],
+        np.array([intercept]),
+        np.array([slope]),
+        np.array([decay]),
+        np.array([A]),
+        np.array([B]),
+        None if mNrmMin is None else np.array([mNrmMin]),
+    )
+    return c[0]
+
+
+def eval_policy(policy, m):
+    """
+    Evaluate the consumption function of one period from its policy arrays (the
+    policy attribute that solve_egm attaches to each period's solution).
+    """
+    return eval_consumption(
+        m,
+        policy["mNrm"],
+        policy["cNrm"],
+        policy["intercept"],
+        policy["slope"],
+        policy["decay"],
+        policy["decay_A"],
+        policy["decay_B"],
+        policy["mNrmMin"],
+    )
+
+
+def can_solve_egm(agent):
+    """
+    Check whether solve_egm solves this agent's problem: a lifecycle consumption-
+    saving model solved by HARK's solve_one_period_ConsIndShock from the basic
+    terminal solution, with linear interpolation and no value function.
+    """
+    constructors = getattr(agent, "constructors", {})
+    return (
+        getattr(agent, "solve_one_period", None)
+        is ConsIndShockModel.solve_one_period_ConsIndShock
+        and constructors.get("solution_terminal")
+        is ConsIndShockModel.make_basic_CRRA_solution_terminal
+        and agent.cycles == 1
+        and not agent.CubicBool
+        and not agent.vFuncBool
+    )
+
+
+def get_egm_inputs(agent):
+    """
+    Collect everything the EGM recursion needs from an agent whose constructed
+    attributes are up to date, stacking the income shock atoms of each period into
+    arrays padded with zero-probability atoms.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        Agent to be solved.
+
+    Returns
+    -------
+    inputs : dict
+        Arrays of period-by-period parameters and income shocks.
+    """
+    T = agent.T_cycle
+    n_atoms = np.array([agent.IncShkDstn[t].pmv.size for t in range(T)])
+    perm = np.ones((T, n_atoms.max()))
+    tran = np.ones((T, n_atoms.max()))
+    pmv = np.zeros((T, n_atoms.max()))
+    WorstIncPrb = np.empty(T)
+    Ex_IncNext = np.empty(T)
+    perm_min = np.empty(T)
+    tran_min = np.empty(T)
+    for t in range(T):
+        dstn = agent.IncShkDstn[t]
+        n = n_atoms[t]
+        perm[t, :n], tran[t, :n] = dstn.atoms
+        pmv[t, :n] = dstn.pmv
+
+        # As in HARK's calc_worst_inc_prob and calc_boro_const_nat
+        income = dstn.atoms[0] * dstn.atoms[1]
+        WorstIncPrb[t] = np.sum(dstn.pmv[income == np.prod(dstn.limit["infimum"])])
+        Ex_IncNext[t] = np.dot(income, dstn.pmv)
+        perm_min[t], tran_min[t] = dstn.limit["infimum"]
+
+    return {
+        "CRRA": float(agent.CRRA),
+        "DiscFac": float(agent.DiscFac),
+        "BoroCnstArt": agent.BoroCnstArt,
+        "aXtraGrid": np.asarray(agent.aXtraGrid, dtype=float),
+        "LivPrb": np.array([agent.LivPrb[t] for t in range(T)], dtype=float),
+        "PermGroFac": np.array([agent.PermGroFac[t] for t in range(T)], dtype=float),
+        "Rfree": np.array([agent.Rfree[t] for t in range(T)], dtype=float),
+        "n_atoms": n_atoms,
+        "perm": perm,
+        "tran": tran,
+        "pmv": pmv,
+        "WorstIncPrb": WorstIncPrb,
+        "Ex_IncNext": Ex_IncNext,
+        "perm_min": perm_min,
+        "tran_min": tran_min,
+    }
+
+
+def stack_egm_inputs(inputs_list):
+    """
+    Stack the EGM inputs of K agents along a leading parameter axis, padding the
+    income shocks of each period to the largest number of atoms with zero-probability
+    atoms. The agents must have the same number of periods and asset gridpoints.
+
+    Parameters
+    ----------
+    inputs_list : [dict]
+        Inputs of each agent, from get_egm_inputs.
+
+    Returns
+    -------
+    inputs : dict
+        The same arrays with a leading axis of length K; an artificial borrowing
+        constraint of None becomes -inf.
+    """
+    K = len(inputs_list)
+    n_atoms = np.array([inputs["n_atoms"] for inputs in inputs_list])
+    T = n_atoms.shape[1]
+    stacked = {"n_atoms": n_atoms}
+    for key, fill in [("perm", 1.0), ("tran", 1.0), ("pmv", 0.0)]:
+        stacked[key] = np.full((K, T, n_atoms.max()), fill)
+        for k, inputs in enumerate(inputs_list):
+            stacked[key][k, :, : inputs[key].shape[1]] = inputs[key]
+    for key in [
+        "CRRA",
+        "DiscFac",
+        "aXtraGrid",
+        "LivPrb",
+        "PermGroFac",
+        "Rfree",
+        "WorstIncPrb",
+        "Ex_IncNext",
+        "perm_min",
+        "tran_min",
+    ]:
+        stacked[key] = np.array([inputs[key] for inputs in inputs_list], dtype=float)
+    stacked["BoroCnstArt"] = np.array(
+        [-np.inf if inputs["BoroCnstArt"] is None else inputs["BoroCnstArt"] for inputs in inputs_list],
+        dtype=float,
+    )
+    return stacked
+
+
+def solve_bounds(inputs):
+    """
+    Run the scalar part of the backward induction for K stacked agents: human
+    wealth, the natural and artificial borrowing constraints and the bounds of the
+    MPC in each period, with the same formulas as HARK's solve_one_period_ConsIndShock.
+    These are scalar operations, as in HARK, because NumPy's vectorized power can
+    round differently from the scalar one.
+
+    Parameters
+    ----------
+    inputs : dict
+        Stacked inputs, from stack_egm_inputs.
+
+    Returns
+    -------
+    bounds : dict
+        Arrays of BoroCnstNat, mNrmMin, hNrm, MPCmin and MPCmax, of shape (K, T_cycle).
+    """
+    K, T = inputs["Rfree"].shape
+    names = ["BoroCnstNat", "mNrmMin", "hNrm", "MPCmin", "MPCmax"]
+    bounds = {key: np.empty((K, T)) for key in names}
+
+    for k in range(K):
+        CRRA = inputs["CRRA"][k]
+        BoroCnstArt = inputs["BoroCnstArt"][k]
+
+        # The terminal period consumes everything
+        mNrmMin_next, hNrm_next, MPCmin_next, MPCmax_next = 0.0, 0.0, 1.0, 1.0
+        for t in reversed(range(T)):
+            Rfree = inputs["Rfree"][k, t]
+            PermGroFac = inputs["PermGroFac"][k, t]
+            DiscFacEff = inputs["DiscFac"][k] * inputs["LivPrb"][k, t]
+
+            hNrm = (PermGroFac / Rfree) * (hNrm_next + inputs["Ex_IncNext"][k, t])
+            BoroCnstNat = (mNrmMin_next - inputs["tran_min"][k, t]) * (
+                (PermGroFac * inputs["perm_min"][k, t]) / Rfree
+            )
+            mNrmMin = max(BoroCnstNat, BoroCnstArt)
+            PatFac = ((Rfree * DiscFacEff) ** (1.0 / CRRA)) / Rfree
+            MPCmin = 1.0 / (1.0 + PatFac / MPCmin_next)
+            MPCmaxUnc = 1.0 / (
+                1.0 + ((inputs["WorstIncPrb"][k, t] ** (1.0 / CRRA)) * PatFac) / MPCmax_next
+            )
+            MPCmax = 1.0 if BoroCnstNat < mNrmMin else MPCmaxUnc
+
+            values = [BoroCnstNat, mNrmMin, hNrm, MPCmin, MPCmax]
+            for key, value in zip(names, values, strict=True):
+                bounds[key][k, t] = value
+            mNrmMin_next, hNrm_next, MPCmin_next, MPCmax_next = mNrmMin, hNrm, MPCmin, MPCmax
+    return bounds
+
+
+def solve_knots_numpy(inputs, bounds):
+    """
+    Find the (mNrm, cNrm) knots of the consumption function in every period by
+    backward induction for K stacked agents, with the same array operations as
+    HARK's solver. Each period is one step on arrays of shape (K, aXtraCount, n_atoms).
+
+    Parameters
+    ----------
+    inputs : dict
+        Stacked inputs, from stack_egm_inputs.
+    bounds : dict
+        Bounds of each period, from solve_bounds.
+
+    Returns
+    -------
+    mNrm, cNrm : np.array
+        Knots of shape (K, T_cycle, aXtraCount + 1), including the point where the
+        unconstrained consumption function reaches zero.
+    decay : np.array
+        Decay extrapolation flag and parameters A and B, of shape (K, T_cycle, 3).
+    """
+    K, T = inputs["Rfree"].shape
+    CRRA = inputs["CRRA"][:, None, None]
+    aXtraGrid = inputs["aXtraGrid"]
+    mNrm = np.empty((K, T, aXtraGrid.shape[1] + 1))
+    cNrm = np.empty((K, T, aXtraGrid.shape[1] + 1))
+    decay = np.empty((K, T, 3))
+    intercept = bounds["MPCmin"] * bounds["hNrm"]
+    slope = bounds["MPCmin"]
+
+    for t in reversed(range(T)):
+        n = inputs["n_atoms"][:, t].max()
+        perm = inputs["perm"][:, t, None, :n]
+        tran = inputs["tran"][:, t, None, :n]
+        pmv = inputs["pmv"][:, t, :n, None]
+        Rfree = inputs["Rfree"][:, t, None, None]
+        PermGroFac = inputs["PermGroFac"][:, t, None, None]
+        DiscFacEff = inputs["DiscFac"] * inputs["LivPrb"][:, t]
+        BoroCnstNat = bounds["BoroCnstNat"][:, t]
+
+        # Next period's market resources and marginal value at each (asset, shock) pair
+        aNrm = aXtraGrid + BoroCnstNat[:, None]
+        mNrm_next = Rfree / (PermGroFac * perm) * aNrm[:, :, None] + tran
+        if t == T - 1:
+            # Terminal consumption function c = m
+            knots = np.tile([0.0, 1.0], (K, 1))
+            zeros = np.zeros(K)
+            cNrm_next = eval_consumption_stacked(
+                mNrm_next, knots, knots, zeros, zeros + 1.0, zeros > 0.0, zeros, zeros
+            )
+        else:
+            cNrm_next = eval_consumption_stacked(
+                mNrm_next,
+                mNrm[:, t + 1],
+                cNrm[:, t + 1],
+                intercept[:, t + 1],
+                slope[:, t + 1],
+                decay[:, t + 1, 0] > 0.0,
+                decay[:, t + 1, 1],
+                decay[:, t + 1, 2],
+                bounds["mNrmMin"][:, t + 1],
+            )
+        vP_next = perm ** (-CRRA) * cNrm_next**-CRRA
+
+        # Invert the first order condition at each end-of-period asset gridpoint
+        # (a scalar power for each agent, as HARK takes, rounds like HARK's)
+        vPfacEff = DiscFacEff * inputs["Rfree"][:, t] * np.array(
+            [
+                G ** (-rho)
+                for G, rho in zip(inputs["PermGroFac"][:, t], inputs["CRRA"], strict=True)
+            ]
+        )
+        EndOfPrdvP = vPfacEff[:, None] * np.matmul(vP_next, pmv)[:, :, 0]
+        c = EndOfPrdvP ** (-1.0 / inputs["CRRA"][:, None])
+        mNrm[:, t, 0] = BoroCnstNat
+        mNrm[:, t, 1:] = c + aNrm
+        cNrm[:, t, 0] = 0.0
+        cNrm[:, t, 1:] = c
+        decay[:, t] = np.stack(
+            get_decay_extrap(mNrm[:, t], cNrm[:, t], intercept[:, t], slope[:, t]),
+            axis=1,
+        )
+    return mNrm, cNrm, decay
+
+
+def solve_knots_loops(
+    CRRA,
+    DiscFac,
+    aXtraGrid,
+    LivPrb,
+    PermGroFac,
+    Rfree,
+    n_atoms,
+    perm,
+    tran,
+    pmv,
+    BoroCnstNat,
+    mNrmMin,
+    intercept,
+    slope,
+):
+    """
+    Loop version of solve_knots_numpy, with scalar operations only, which numba
+    compiles into a single kernel. Takes the arrays of get_egm_inputs and
+    solve_bounds and returns the same knots and decay parameters.
+    """
+    T = Rfree.size
+    A = aXtraGrid.size
+    mNrm = np.empty((T, A + 1))
+    cNrm = np.empty((T, A + 1))
+    decay = np.zeros((T, 3))
+
+    for t in range(T - 1, -1, -1):
+        DiscFacEff = DiscFac * LivPrb[t]
+        vPfacEff = DiscFacEff * Rfree[t] * PermGroFac[t] ** (-CRRA)
+        mNrm[t, 0] = BoroCnstNat[t]
+        cNrm[t, 0] = 0.0
+        for a in range(A):
+            aNrm = aXtraGrid[a] + BoroCnstNat[t]
+            EndOfPrdvP = 0.0
+            for s in range(n_atoms[t]):
+                m = Rfree[t] / (PermGroFac[t] * perm[t, s]) * aNrm + tran[t, s]
+                if t == T - 1:
+                    c = m if m >= 0.0 else np.nan
+                else:
+                    # Interpolate next period's consumption function
+                    lo = 0
+                    hi = A
+                    while lo < hi:
+                        mid = (lo + hi) // 2
+                        if mNrm[t + 1, mid] < m:
+                            lo = mid + 1
+                        else:
+                            hi = mid
+                    i = max(lo, 1)
+                    x0 = mNrm[t + 1, i - 1]
+                    x1 = mNrm[t + 1, i]
+                    alpha = (m - x0) / (x1 - x0)
+                    c = (1.0 - alpha) * cNrm[t + 1, i - 1] + alpha * cNrm[t + 1, i]
+                    if m < mNrm[t + 1, 0]:
+                        c = np.nan
+                    if decay[t + 1, 0] > 0.0 and m > mNrm[t + 1, A]:
+                        c = (
+                            intercept[t + 1]
+                            + slope[t + 1] * m
+                            - decay[t + 1, 1] * np.exp(-decay[t + 1, 2] * (m - mNrm[t + 1, A]))
+                        )
+                    # Borrowing constraint of next period
+                    alpha = (m - mNrmMin[t + 1]) / ((mNrmMin[t + 1] + 1.0) - mNrmMin[t + 1])
+                    c_cnst = np.nan if m < mNrmMin[t + 1] else alpha
+                    if c_cnst < c or np.isnan(c_cnst):
+                        c = c_cnst
+                EndOfPrdvP += pmv[t, s] * perm[t, s] ** (-CRRA) * c ** (-CRRA)
+            c = (vPfacEff * EndOfPrdvP) ** (-1.0 / CRRA)
+            mNrm[t, a + 1] = c + aNrm
+            cNrm[t, a + 1] = c
+
+        # Decay extrapolation above the top knot, as in get_decay_extrap
+        slope_at_top = (cNrm[t, A] - cNrm[t, A - 1]) / (mNrm[t, A] - mNrm[t, A - 1])
+        level_diff = intercept[t] + slope[t] * mNrm[t, A] - cNrm[t, A]
+        if abs(slope[t] - slope_at_top) > 1e-15 + 1e-5 * abs(slope_at_top):
+            decay[t, 0] = 1.0
+            decay[t, 1] = level_diff
+            decay[t, 2] = -(slope[t] - slope_at_top) / level_diff
+    return mNrm, cNrm, decay
+
+
+if numba is not None:
+    solve_knots_jit = numba.njit(cache=True)(solve_knots_loops)
+else:
+    solve_knots_jit = None
+
+
+def solve_egm_policies(inputs_list, jit=False):
+    """
+    Solve the lifecycle problems of K agents by the endogenous grid method in one
+    stacked backward induction, returning the consumption policy of every period
+    of each agent as arrays.
+
+    Parameters
+    ----------
+    inputs_list : [dict]
+        Inputs of each agent, from get_egm_inputs.
+    jit : bool
+        Whether to use the numba-compiled kernel, if numba is installed; it solves
+        the stacked agents one after the other.
+
+    Returns
+    -------
+    policies : [dict]
+        Policy of each agent: knots mNrm and cNrm of shape (T_cycle, aXtraCount + 1),
+        the limiting intercept and slope, decay extrapolation parameters, and the
+        bounds mNrmMin, hNrm, MPCmin and MPCmax of each period.
+    """
+    inputs = stack_egm_inputs(inputs_list)
+    with np.errstate(divide="ignore", over="ignore", under="ignore", invalid="ignore"):
+        bounds = solve_bounds(inputs)
+        intercept = bounds["MPCmin"] * bounds["hNrm"]
+        slope = bounds["MPCmin"]
+        if jit and solve_knots_jit is not None:
+            knots = [
+                solve_knots_jit(
+                    inputs["CRRA"][k],
+                    inputs["DiscFac"][k],
+                    inputs["aXtraGrid"][k],
+                    inputs["LivPrb"][k],
+                    inputs["PermGroFac"][k],
+                    inputs["Rfree"][k],
+                    inputs["n_atoms"][k],
+                    inputs["perm"][k],
+                    inputs["tran"][k],
+                    inputs["pmv"][k],
+                    bounds["BoroCnstNat"][k],
+                    bounds["mNrmMin"][k],
+                    intercept[k],
+                    slope[k],
+                )
+                for k in range(len(inputs_list))
+            ]
+            mNrm, cNrm, decay = (np.stack(arrays) for arrays in zip(*knots, strict=True))
+        else:
+            mNrm, cNrm, decay = solve_knots_numpy(inputs, bounds)
+
+    return [
+        {
+            "mNrm": mNrm[k],
+            "cNrm": cNrm[k],
+            "intercept": intercept[k],
+            "slope": slope[k],
+            "decay": decay[k, :, 0] > 0.0,
+            "decay_A": decay[k, :, 1],
+            "decay_B": decay[k, :, 2],
+            **{key: value[k] for key, value in bounds.items()},
+        }
+        for k in range(len(inputs_list))
+    ]
+
+
+def solve_egm_policy(agent, jit=False):
+    """
+    Solve one agent's lifecycle problem by the endogenous grid method, as
+    solve_egm_policies does for several.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        Agent for which can_solve_egm is True, with constructed attributes.
+    jit : bool
+        Whether to use the numba-compiled kernel, if numba is installed.
+
+    Returns
+    -------
+    policy : dict
+        Policy arrays of the agent.
+    """
+    return solve_egm_policies([get_egm_inputs(agent)], jit)[0]
+
+
+def make_solution(policy, CRRA, solution_terminal):
+    """
+    Wrap EGM policy arrays into the list of ConsumerSolution objects that HARK's
+    solver would have made, one per period plus the terminal solution. Each
+    period's solution also carries its policy arrays in the attribute policy, for
+    evaluating consumption without going through the interpolator objects.
+
+    Parameters
+    ----------
+    policy : dict
+        Policy arrays from solve_egm_policy.
+    CRRA : float
+        Coefficient of relative risk aversion.
+    solution_terminal : ConsumerSolution or None
+        Solution of the terminal period, appended to the list unless None.
+
+    Returns
+    -------
+    solution : [ConsumerSolution]
+        Solution of every period.
+    """
+    solution = []
+    for t in range(policy["mNrm"].shape[0]):
+        mNrmMin = policy["mNrmMin"][t]
+        cFuncUnc = interpolation.LinearInterp(
+            policy["mNrm"][t],
+            policy["cNrm"][t],
+            policy["intercept"][t],
+            policy["slope"][t],
+        )
+        cFuncCnst = interpolation.LinearInterp(
+            np.array([mNrmMin, mNrmMin + 1.0]),
+            np.array([0.0, 1.0]),
+        )
+        cFunc = interpolation.LowerEnvelope(cFuncUnc, cFuncCnst, nan_bool=False)
+        solution_t = ConsIndShockModel.ConsumerSolution(
+            cFunc=cFunc,
+            vFunc=utilities.NullFunc(),
+            vPfunc=interpolation.MargValueFuncCRRA(cFunc, CRRA),
+            vPPfunc=utilities.NullFunc(),
+            mNrmMin=mNrmMin,
+            hNrm=policy["hNrm"][t],
+            MPCmin=policy["MPCmin"][t],
+            MPCmax=policy["MPCmax"][t],
+        )
+        solution_t.policy = {
+            key: policy[key][t]
+            for key in ["mNrm", "cNrm", "intercept", "slope", "decay", "decay_A", "decay_B", "mNrmMin"]
+        }
+        solution.append(solution_t)
+    if solution_terminal is not None:
+        solution.append(solution_terminal)
+    return solution
@@ -0,0 +1,369 @@
+"""Local surrogate of simulated moments for exploring the estimation objective.
+Every evaluation of simulate_moments is logged in the evaluation store. The
+emulator fits a Gaussian process to those evaluations, one per moment, over a box
+of the estimated parameters. It then predicts the moments (and their uncertainty)
+at thousands of parameter points per second, for contour plots, sensitivity checks
+and interactive exploration in notebooks. The emulator refines itself by asking for
+true evaluations only where its predictions are most uncertain, and reports its own
+accuracy by leave-one-out cross-validation.
+
+A typical notebook session:
+
+    from estimark.emulator import load_emulator
+    emulator = load_emulator(agent, ["CRRA", "DiscFac"], emp_moments, bounds)
+    emulator.refine(lambda params: simulate_moments(params, agent, emp_moments, use_store=True))
+    values = emulator.criterion(points, emp_moments, weights)
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from estimark.lazy import lazy_import
+
+estimation = lazy_import("estimark.estimation")
+optimize = lazy_import("scipy.optimize")
+qmc = lazy_import("scipy.stats.qmc")
+linalg = lazy_import("scipy.linalg")
+
+
+def squared_exponential(X, Z, length_scales):
+    """
+    Squared exponential (Gaussian) kernel with one length scale per dimension,
+    without the signal variance.
+
+    Parameters
+    ----------
+    X, Z : np.array
+        Points of shape (n, d) and (m, d).
+    length_scales : np.array
+        Length scale of each of the d dimensions.
+
+    Returns
+    -------
+    K : np.array
+        Kernel matrix of shape (n, m).
+    """
+    X = X / length_scales
+    Z = Z / length_scales
+    sq_dist = (X**2).sum(1)[:, None] + (Z**2).sum(1)[None, :] - 2.0 * X @ Z.T
+    return np.exp(-0.5 * np.maximum(sq_dist, 0.0))
+
+
+class GaussianProcess:
+    """
+    Gaussian process regression of one standardized output on points in the unit
+    box, with a squared exponential kernel and a noise term for simulation error.
+    The log length scales, signal variance and noise variance are fit by maximizing
+    the marginal likelihood.
+
+    Parameters
+    ----------
+    X : np.array
+        Points of shape (n, d), scaled to the unit box.
+    y : np.array
+        Standardized outputs at the points, of shape (n,).
+    """
+
+    def __init__(self, X, y):
+        self.X = X
+        self.y = y
+        d = X.shape[1]
+        theta0 = np.concatenate([np.log(np.full(d, 0.5)), [0.0, np.log(1e-4)]])
+        bounds = d * [(np.log(1e-2), np.log(1e2))] + [(np.log(1e-3), np.log(1e3))]
+        bounds += [(np.log(1e-10), np.log(1.0))]
+        result = optimize.minimize(
+            self.neg_log_likelihood,
+            theta0,
+            method="L-BFGS-B",
+            bounds=bounds,
+        )
+        self.set_hyperparameters(result.x)
+
+    def unpack(self, theta):
+        d = self.X.shape[1]
+        return np.exp(theta[:d]), np.exp(theta[d]), np.exp(theta[d + 1])
+
+    def neg_log_likelihood(self, theta):
+        length_scales, signal, noise = self.unpack(theta)
+        K = signal * squared_exponential(self.X, self.X, length_scales)
+        K[np.diag_indices_from(K)] += noise + 1e-10
+        try:
+            factor = linalg.cho_factor(K, lower=True)
+        except np.linalg.LinAlgError:
+            return np.inf
+        alpha = linalg.cho_solve(factor, self.y)
+        return 0.5 * self.y @ alpha + np.log(np.diag(factor[0])).sum()
+
+    def set_hyperparameters(self, theta):
+        self.length_scales, self.signal, self.noise = self.unpack(theta)
+        K = self.signal * squared_exponential(self.X, self.X, self.length_scales)
+        K[np.diag_indices_from(K)] += self.noise + 1e-10
+        self.factor = linalg.cho_factor(K, lower=True)
+        self.alpha = linalg.cho_solve(self.factor, self.y)
+
+    def predict(self, Z):
+        """
+        Predictive mean and standard deviation of the output at points Z, of shape
+        (m, d) in the unit box.
+        """
+        K_star = self.signal * squared_exponential(Z, self.X, self.length_scales)
+        mean = K_star @ self.alpha
+        v = linalg.cho_solve(self.factor, K_star.T)
+        var = self.signal - np.einsum("ij,ji->i", K_star, v)
+        return mean, np.sqrt(np.maximum(var, 0.0))
+
+    def loo_residuals(self):
+        """
+        Leave-one-out prediction errors at the fitted points, in closed form.
+        """
+        K_inv = linalg.cho_solve(self.factor, np.eye(self.y.size))
+        return self.alpha / np.diag(K_inv)
+
+
+class MomentEmulator:
+    """
+    Surrogate of simulate_moments over a box of the estimated parameters, with one
+    Gaussian process per simulated moment.
+
+    Parameters
+    ----------
+    param_names : [str]
+        Names of the estimated parameters, in the order of points passed to predict.
+    moment_names : [str]
+        Names of the emulated moments.
+    bounds : dict
+        Mapping from each parameter name to its (lower, upper) bounds; the box that
+        the emulator covers and refines over.
+    """
+
+    def __init__(self, param_names, moment_names, bounds):
+        self.param_names = list(param_names)
+        self.moment_names = list(moment_names)
+        self.lower = np.array([bounds[name][0] for name in self.param_names], dtype=float)
+        self.upper = np.array([bounds[name][1] for name in self.param_names], dtype=float)
+        self.points = np.empty((0, len(self.param_names)))
+        self.values = np.empty((0, len(self.moment_names)))
+        self.processes = None
+
+    def __len__(self):
+        return self.points.shape[0]
+
+    def to_array(self, points):
+        """
+        Convert a parameter dictionary, a list of them, or an array of points into an
+        array of shape (m, n_params).
+        """
+        if isinstance(points, dict):
+            points = [points]
+        if len(points) > 0 and isinstance(points[0], dict):
+            points = [[params[name] for name in self.param_names] for params in points]
+        return np.atleast_2d(np.asarray(points, dtype=float))
+
+    def scale(self, points):
+        return (points - self.lower) / (self.upper - self.lower)
+
+    def in_box(self, points):
+        return np.all((points >= self.lower) & (points <= self.upper), axis=1)
+
+    def add(self, params, moments):
+        """
+        Add a true evaluation to the training data, if it lies in the box. The
+        emulator must be fit again before the point is used.
+
+        Parameters
+        ----------
+        params : dict
+            Mapping from parameter names to values.
+        moments : dict
+            Simulated moments at params, with every emulated moment.
+        """
+        point = self.to_array(params)
+        if not self.in_box(point)[0]:
+            return
+        value = np.array([[moments[name] for name in self.moment_names]], dtype=float)
+        self.points = np.vstack([self.points, point])
+        self.values = np.vstack([self.values, value])
+        self.processes = None
+
+    def fit(self):
+        """
+        Fit the Gaussian process of each moment to the training data. Moments are
+        standardized before fitting, so their hyperparameters are comparable.
+        """
+        if len(self) < len(self.param_names) + 2:
+            msg = (
+                f"The emulator needs at least {len(self.param_names) + 2} evaluations "
+                f"in its box to be fit, and has {len(self)}."
+            )
+            raise ValueError(msg)
+        X = self.scale(self.points)
+        self.y_mean = self.values.mean(axis=0)
+        self.y_std = self.values.std(axis=0)
+        self.y_std[self.y_std == 0.0] = 1.0
+        Y = (self.values - self.y_mean) / self.y_std
+        self.processes = [GaussianProcess(X, Y[:, j]) for j in range(Y.shape[1])]
+
+    def predict(self, points):
+        """
+        Predict the moments and their standard deviations at many parameter points.
+
+        Parameters
+        ----------
+        points : np.array, dict or [dict]
+            Parameter points, as an array of shape (m, n_params) in the order of
+            param_names or as parameter dictionaries.
+
+        Returns
+        -------
+        mean : np.array
+            Predicted moments, of shape (m, n_moments).
+        std : np.array
+            Standard deviations of the predictions, of shape (m, n_moments).
+        """
+        if self.processes is None:
+            self.fit()
+        Z = self.scale(self.to_array(points))
+        mean = np.empty((Z.shape[0], len(self.moment_names)))
+        std = np.empty_like(mean)
+        for j, process in enumerate(self.processes):
+            mean[:, j], std[:, j] = process.predict(Z)
+        return mean * self.y_std + self.y_mean, std * self.y_std
+
+    def predict_moments(self, params):
+        """
+        Predict the moments at one parameter point, in the form simulate_moments
+        returns them.
+        """
+        mean, _ = self.predict(params)
+        return dict(zip(self.moment_names, mean[0], strict=True))
+
+    def criterion(self, points, emp_moments, weights):
+        """
+        Emulated MSM criterion at many parameter points: the weighted sum of squared
+        differences between predicted and empirical moments, as msm_criterion.
+
+        Parameters
+        ----------
+        points : np.array, dict or [dict]
+            Parameter points, as in predict.
+        emp_moments : dict
+            Empirical moments.
+        weights : dict
+            Weight of each moment.
+
+        Returns
+        -------
+        values : np.array
+            Criterion value at each point.
+        """
+        mean, _ = self.predict(points)
+        emp = np.array([emp_moments[name] for name in self.moment_names])
+        w = np.array([weights[name] for name in self.moment_names])
+        return np.sum(np.square(w * (mean - emp)), axis=1)
+
+    def errors(self):
+        """
+        Report the emulator's accuracy on the moments it was fit to.
+
+        Returns
+        -------
+        errors : dict
+            Mapping from each moment name to its leave-one-out root mean squared
+            prediction error, in the units of the moment.
+        """
+        if self.processes is None:
+            self.fit()
+        return {
+            name: float(np.sqrt(np.mean(np.square(process.loo_residuals()))) * scale)
+            for name, process, scale in zip(
+                self.moment_names, self.processes, self.y_std, strict=True
+            )
+        }
+
+    def refine(self, evaluate, max_evaluations=20, tol=0.01, n_candidates=2048, seed=0):
+        """
+        Add true evaluations where the emulator is most uncertain until every moment
+        is predicted to within tol (relative to its spread in the training data)
+        everywhere in the box, or max_evaluations have been made. Candidates are
+        drawn from a scrambled Sobol sequence over the box.
+
+        Parameters
+        ----------
+        evaluate : callable
+            Function that takes a parameter dictionary and returns the simulated
+            moments, such as a wrapper of simulate_moments.
+        max_evaluations : int
+            Largest number of true evaluations to make.
+        tol : float
+            Target largest predictive standard deviation, relative to the standard
+            deviation of each moment across the training data.
+        n_candidates : int
+            Number of candidate points searched for the most uncertain one.
+        seed : int
+            Seed of the candidate sequence.
+
+        Returns
+        -------
+        n_evaluations : int
+            Number of true evaluations made.
+        """
+        sampler = qmc.Sobol(len(self.param_names), seed=seed)
+        candidates = qmc.scale(sampler.random(n_candidates), self.lower, self.upper)
+        for n_evaluations in range(max_evaluations):
+            if len(self) < len(self.param_names) + 2:
+                # Not enough points to fit yet: fill the box along the sequence
+                point = candidates[len(self) % n_candidates]
+            else:
+                _, std = self.predict(candidates)
+                relative = (std / self.y_std).max(axis=1)
+                if relative.max() < tol:
+                    return n_evaluations
+                point = candidates[np.argmax(relative)]
+            params = dict(zip(self.param_names, point.tolist(), strict=True))
+            self.add(params, evaluate(params))
+        return max_evaluations
+
+
+def load_emulator(agent, param_names, emp_moments, bounds, store=None):
+    """
+    Make an emulator of an agent's simulated moments from the evaluations already
+    logged in the evaluation store for the same specification, seed and calibration
+    that lie in the box given by bounds.
+
+    Parameters
+    ----------
+    agent : AgentType
+        Agent used in the estimation.
+    param_names : [str]
+        Names of the estimated parameters.
+    emp_moments : dict
+        Empirical moments, which determine the moments that are emulated.
+    bounds : dict
+        Mapping from each parameter name to its (lower, upper) bounds.
+    store : EvaluationStore or None
+        Store to read; the one used by simulate_moments if None.
+
+    Returns
+    -------
+    emulator : MomentEmulator
+        Emulator with the logged evaluations as training data, not fit yet.
+    """
+    store = estimation.evaluation_store if store is None else store
+    moment_names = estimation.get_moment_names(agent, emp_moments)
+    emulator = MomentEmulator(param_names, moment_names, bounds)
+    if not store.enabled:
+        return emulator
+
+    frame = store.to_frame(agent.name)
+    columns = list(param_names) + moment_names
+    if frame.empty or not set(columns) <= set(frame.columns):
+        return emulator
+    frame = frame[
+        (frame["seed"] == int(getattr(agent, "seed", 0)))
+        & (frame["calibration_hash"] == getattr(agent, "calibration_hash", ""))
+    ]
+    for row in frame[columns].dropna().itertuples(index=False):
+        values = dict(zip(columns, row, strict=True))
+        emulator.add({name: values[name] for name in param_names}, values)
+    return emulator
@@ -11,60 +11,109 @@ income as defined in ConsIndShockModel.
 from __future__ import annotations
 
 import csv
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from time import time
+from types import SimpleNamespace
 
-import estimagic as em
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-
-# Estimation methods
-from estimagic.inference import get_bootstrap_samples
-from scipy.optimize import approx_fprime
-from statsmodels.stats.weightstats import DescrStatsW
-
-# Import modules from core HARK libraries:
-# The consumption-saving micro model
-from estimark.agents import (
-    BequestWarmGlowLifeCycleConsumerType,
-    BequestWarmGlowLifeCyclePortfolioType,
-    IndShkLifeCycleConsumerType,
-    PortfolioLifeCycleConsumerType,
-    WealthPortfolioLifeCycleConsumerType,
+
+from estimark.cache import SolutionCache
+from estimark.checkpoint import (
+    CriterionHistory,
+    append_record,
+    get_best_params,
+    get_history_path,
+    read_records,
+    read_state,
+    write_state,
+)
+from estimark.distribution import (
+    can_iterate_distribution,
+    iterate_distribution_medians,
+    make_histogram_grid,
+)
+from estimark.lazy import lazy_import
+from estimark.moments import (
+    draw_bootstrap_counts,
+    get_bootstrap_moments,
+    get_group_index,
 )
 
 # Parameters for the consumer type and the estimation
 from estimark.parameters import (
     age_mapping,
     bootstrap_options,
-    init_calibration,
+    constructor_options,
+    evaluation_store_options,
+    fidelity_options,
+    get_init_calibration,
     init_params_options,
     init_subjective_labor,
     init_subjective_stock,
-    true_stock_params,
+    jacobian_options,
     minimize_options,
     sim_mapping,
+    simulation_options,
+    solution_cache_options,
+    solver_options,
+    sweep_options,
+    true_stock_params,
+    worker_pool_options,
 )
+from estimark.pool import WarmCriterion, WarmPool
 
 # SCF 2004 data on household wealth
-from estimark.scf import scf_data
-from estimark.snp import snp_data
+from estimark.scf import get_scf_table
+from estimark.simulation import (
+    can_simulate_fast,
+    plan_lifecycle,
+    simulate_lifecycle_medians,
+    simulate_lifecycle_records,
+)
+from estimark.snp import get_snp_table
+from estimark.store import EvaluationStore, hash_object
+
+# Heavy dependencies are imported the first time they are used
+em = lazy_import("estimagic")
+plt = lazy_import("matplotlib.pyplot")
+pd = lazy_import("pandas")
+sparse = lazy_import("scipy.sparse")
+weightstats = lazy_import("statsmodels.stats.weightstats")
+
+# The consumption-saving micro models, built on the core HARK libraries
+agents = lazy_import("estimark.agents")
 
 # =====================================================
 # Define objects and functions used for the estimation
 # =====================================================
 
+# Names of the AgentType subclasses in estimark.agents
 agent_types = {
-    "IndShock": IndShkLifeCycleConsumerType,
-    "Portfolio": PortfolioLifeCycleConsumerType,
-    "WarmGlow": BequestWarmGlowLifeCycleConsumerType,
-    "WarmGlowPortfolio": BequestWarmGlowLifeCyclePortfolioType,
-    "WealthPortfolio": WealthPortfolioLifeCycleConsumerType,
+    "IndShock": "IndShkLifeCycleConsumerType",
+    "Portfolio": "PortfolioLifeCycleConsumerType",
+    "WarmGlow": "BequestWarmGlowLifeCycleConsumerType",
+    "WarmGlowPortfolio": "BequestWarmGlowLifeCyclePortfolioType",
+    "WealthPortfolio": "WealthPortfolioLifeCycleConsumerType",
+}
+
+# Subclasses that keep subjective and true stock beliefs side by side, used for the
+# (Stock) specifications of the portfolio types
+dual_belief_types = {
+    "PortfolioLifeCycleConsumerType": "PortfolioDualBeliefLifeCycleConsumerType",
+    "BequestWarmGlowLifeCyclePortfolioType": "BequestWarmGlowDualBeliefLifeCyclePortfolioType",
+    "WealthPortfolioLifeCycleConsumerType": "WealthPortfolioDualBeliefLifeCycleConsumerType",
 }
 
+# Solutions already computed in this process, keyed on the estimated parameters
+solution_cache = SolutionCache(**solution_cache_options)
+
+# On-disk record of every simulate_moments call, shared across runs and processes
+evaluation_store = EvaluationStore(**evaluation_store_options)
 
-def make_agent(agent_name):
+
+def make_agent(agent_name, calibration_overrides=None):
     """
     Construct an instance of an AgentType subclass that can be used in the structural
     estimation. The specific class used, as well as some of the exogenously calibrated
@@ -90,6 +139,11 @@ def make_agent(agent_name):
     agent_name : str
         Name of the agent specification, which determines details of its type
         and exogenous parameters.
+    calibration_overrides : dict or None
+        Calibrated values that replace those of init_calibration, such as the
+        fewer agents and coarser grids of a cheap fidelity level. Smaller
+        populations keep the first AgentCount draws of aNrmInit; larger ones need
+        a streaming simulation, which resamples them.
         
     Returns
     -------
@@ -99,9 +153,12 @@ def make_agent(agent_name):
     """
     for key, value in agent_types.items():
         if key in agent_name:
-            agent_type = value
+            agent_type = getattr(agents, value)
+    stock_beliefs = "(Stock)" in agent_name and "Portfolio" in agent_name
+    if stock_beliefs:
+        agent_type = getattr(agents, dual_belief_types[agent_type.__name__])
 
-    calibration = init_calibration.copy()
+    calibration = get_init_calibration().copy()
 
     if "Sub" in agent_name:
         if "(Stock)" in agent_name:
@@ -109,9 +166,23 @@ def make_agent(agent_name):
         if "(Labor)" in agent_name:
             calibration.update(init_subjective_labor)
 
+    if calibration_overrides:
+        calibration.update(calibration_overrides)
+        # Streaming simulations resample aNrmInit for populations larger than it
+        if calibration["AgentCount"] > len(calibration["aNrmInit"]):
+            if not simulation_options["streaming"]:
+                msg = (
+                    f"AgentCount of {calibration['AgentCount']} exceeds the "
+                    f"{len(calibration['aNrmInit'])} draws of aNrmInit."
+                )
+                raise ValueError(msg)
+        else:
+            calibration["aNrmInit"] = calibration["aNrmInit"][: calibration["AgentCount"]]
+
     # Make a lifecycle consumer to be used for estimation
     agent = agent_type(**calibration)
     agent.name = agent_name
+    agent.calibration_overrides = dict(calibration_overrides or {})
     
     # Choose to track bank balances as wealth, and track risky asset share if needed
     track_vars = ["bNrm"]
@@ -119,16 +190,47 @@ def make_agent(agent_name):
         track_vars += ["Share"]
     agent.track_vars = track_vars
 
+    # Solve with subjective stock beliefs and simulate with the true ones
+    if stock_beliefs:
+        agent.set_belief_regimes(subjective=init_subjective_stock, true=true_stock_params)
+
+    # Skip rebuilding constructed inputs that the estimated parameters do not affect
+    agent.elide_constructors = constructor_options["elide"]
+    agent.constructor_memo_size = constructor_options["memo_size"]
+
+    # Choose the solver; the EGM kernel reproduces HARK's solution, so it is left out
+    # of the calibration hash
+    if isinstance(agent, agents.IndShkLifeCycleConsumerType):
+        agent.solver_backend = solver_options["backend"]
+        agent.solver_jit = solver_options["jit"]
+
+    # Identify everything besides the estimated parameters that moments depend on,
+    # including the way moments are computed when it changes their values
+    hash_inputs = {
+        "calibration": calibration,
+        "true_stock_params": true_stock_params,
+        "init_subjective_labor": init_subjective_labor,
+        "sim_mapping": sim_mapping,
+    }
+    if simulation_options["histogram"]:
+        hash_inputs["histogram"] = {
+            key: simulation_options[key]
+            for key in ["histogram_max", "histogram_count", "share_count"]
+        }
+    elif simulation_options["streaming"] and calibration["AgentCount"] > simulation_options["chunk_size"]:
+        hash_inputs["chunk_size"] = simulation_options["chunk_size"]
+    agent.calibration_hash = hash_object(hash_inputs)
+
     return agent
 
 
 def weighted_median(values, weights):
-    stats = DescrStatsW(values, weights=weights)
+    stats = weightstats.DescrStatsW(values, weights=weights)
     return stats.quantile(0.5, return_pandas=False)
 
 
 def winsored_mean(values, weights, limits):
-    stats = DescrStatsW(values, weights=weights)
+    stats = weightstats.DescrStatsW(values, weights=weights)
     qs = stats.quantile(limits, return_pandas=False)
 
     # discard values outside qs
@@ -169,46 +271,58 @@ def get_weighted_moments(
     weight_sum : dict
         Dictionary mapping from keys of mapping input to total weight of group.
     """
-    # Common variables that don't depend on whether weights are None or not
-    data_variable = data[variable]
-    data_groups = data[groups]
-    data_weights = data[weights] if weights else None
+    # Sort the data once by (group, value), or reuse the index already made for it
+    index = get_group_index(data, variable, weights=weights, groups=groups, mapping=mapping)
+    medians = index.medians()
+    weight_sums = index.weight_sums
 
     emp_moments = {}
     weight_sum = {}
-    for key in mapping:
-        group_data = data_variable[data_groups == key]
-        group_weights = data_weights[data_groups == key] if weights else None
-        W = np.sum(group_weights)
-        weight_sum[key] = W
+    for j, key in enumerate(mapping):
+        weight_sum[key] = weight_sums[j] if weights else None
 
         # Check if the group has any data
-        if not group_data.empty:
-            if weights is None:
-                emp_moments[key] = group_data.median()
-            else:
-                emp_moments[key] = weighted_median(
-                    group_data.to_numpy(),
-                    group_weights.to_numpy(),
-                )
+        if index.counts[j] > 0:
+            emp_moments[key] = medians[j]
         # else:
         #     print(f"Warning: Group {key} does not have any data.")
     
     return emp_moments, weight_sum
 
 
-def get_moments_cov(agent_name, emp_moments):
-    #TODO: WRITE DOCSTRING
-    moments_cov = em.get_moments_cov(
-        scf_data,
-        get_weighted_moments,
-        moment_kwargs={
-            "variable": "wealth_income_ratio",
-            "weights": "weight",
-            "groups": "age_group",
-            "mapping": age_mapping,
-        },
+def get_moments_cov(agent_name, emp_moments, n_draws=1000, rng=None):
+    """
+    Bootstrap the covariance matrix of the empirical wealth moments. All replicates
+    are drawn and evaluated in one batch by get_bootstrap_moments, which resamples
+    the SCF data exactly as estimagic's get_moments_cov would with the same rng.
+    Moments without a bootstrap distribution (risky shares) get unit variance.
+
+    Parameters
+    ----------
+    agent_name : str
+        Name of the current specification.
+    emp_moments : dict
+        Mapping from moment names to empirical moments.
+    n_draws : int
+        Number of bootstrap replicates.
+    rng : np.random.Generator or None
+        Random number generator for the resampling.
+
+    Returns
+    -------
+    moments_cov : dict
+        Nested mapping from pairs of moment names to their covariance.
+    """
+    _, cov = get_bootstrap_moments(
+        get_scf_table(),
+        variable="wealth_income_ratio",
+        weights="weight",
+        groups="age_group",
+        mapping=age_mapping,
+        n_draws=n_draws,
+        rng=rng,
     )
+    moments_cov = cov.to_dict()
 
     if "Port" in agent_name:
         for key1 in emp_moments:
@@ -251,7 +365,7 @@ def get_empirical_moments(agent_name):
         weights from the dataset.
     """
     emp_moments, weight_sum = get_weighted_moments(
-        data=scf_data,
+        data=get_scf_table(),
         variable="wealth_income_ratio",
         weights="weight",
         groups="age_group",
@@ -262,7 +376,7 @@ def get_empirical_moments(agent_name):
     # Add share moments if agent is a portfolio type
     if "Portfolio" in agent_name:
         share_moments, share_weight_sum = get_weighted_moments(
-            data=snp_data,
+            data=get_snp_table(),
             variable="share",
             groups="age_group",
             mapping=age_mapping,
@@ -326,10 +440,13 @@ def get_initial_guess(agent, params_to_estimate, save_dir):
 
 
 # Define the function that generates simulated moments
-def simulate_moments(params, agent, emp_moments):
+def simulate_moments(params, agent, emp_moments, use_store=False):
     """
     Generate simulated moments by solving and simulating the agents at the given
     parameters. Returns a dictionary that corresponds to the empirical moments.
+    With use_store, moments already in the evaluation store are returned without
+    solving or simulating, which leaves the agent's solution at whatever point was
+    solved last; only callers that need nothing but the moments should use it.
 
     Parameters
     ----------
@@ -340,6 +457,9 @@ def simulate_moments(params, agent, emp_moments):
         and simulated to generate moments.
     emp_moments : dict
         Mapping from moment names to empirical moments. Used for ????
+    use_store : bool
+        Whether to look up the moments in the evaluation store before solving.
+        New moments are recorded in the store either way.
 
     Returns
     -------
@@ -352,27 +472,30 @@ def simulate_moments(params, agent, emp_moments):
     if hasattr(agent, "BeqCRRA"):
         agent.BeqCRRA = agent.CRRA
 
-    # ensure subjective beliefs are used for solution
-    if "(Stock)" in agent.name and "Portfolio" in agent.name:
-        agent.assign_parameters(**init_subjective_stock)
-        agent.construct('RiskyDstn','ShockDstn')
-    if "(Labor)" in agent.name:
-        agent.assign_parameters(**init_subjective_labor)
-        agent.update_income_process()
+    # Look up moments that were simulated before, in this or an earlier run
+    moment_names = get_moment_names(agent, emp_moments)
+    store_key = evaluation_store.make_key(agent, params)
+    if use_store:
+        stored_moments = evaluation_store.get(store_key, moment_names)
+        if stored_moments is not None:
+            return stored_moments
+    t0 = time()
 
-    # Update parameters on the agent / construct them
-    agent.update()
-    if "WarmGlow" in agent.name:
-        agent.BeqFac = agent.BeqMPC ** (-agent.CRRA)
-        agent.BeqShift = agent.BeqInt / agent.BeqMPC
+    # Reuse the solution if these parameters have already been solved
+    cache_key = solution_cache.make_key(agent, params)
+    cached_solution = solution_cache.get(cache_key)
+    if cached_solution is not None:
+        agent.solution = cached_solution
+    else:
+        prepare_solve(agent)
 
-    # Solve the model for these parameters, then simulate wealth data
-    agent.solve()  # Solve the microeconomic model
+        # Solve the model for these parameters, then simulate wealth data
+        agent.solve()  # Solve the microeconomic model
+        solution_cache.put(cache_key, agent.solution)
 
     # simulate with true parameters (override subjective beliefs)
     if "(Stock)" in agent.name and "Portfolio" in agent.name:
-        agent.assign_parameters(**true_stock_params)
-        agent.construct('RiskyDstn','ShockDstn')
+        agent.use_beliefs("true")
     # for labor keep same process as subjective beliefs
     if "(Labor)" in agent.name:
         agent.TranShkStd = init_subjective_labor["TranShkStd"]
@@ -381,32 +504,150 @@ def simulate_moments(params, agent, emp_moments):
 
     agent.update()
 
-    max_sim_age = agent.T_cycle + 1
-    # Initialize the simulation by clearing histories, resetting initial values
-    agent.initialize_sim()
-    agent.simulate(max_sim_age)  # Simulate histories of consumption and wealth
-    # Take "wealth" to mean bank balances before receiving labor income
-    sim_w_history = agent.history["bNrm"]
-
-    # Find the distance between empirical data and simulated medians for each age group
-    sim_moments = {
-        key: np.median(sim_w_history[cohort_idx])
-        for key, cohort_idx in sim_mapping.items()
-        if key in emp_moments
-    }
+    # Simulate only up to the last age that a moment uses, recording only the
+    # variables and ages that the moments need
+    groups = get_moment_groups(agent, emp_moments)
+    sim_periods, record = plan_lifecycle(groups)
+    if simulation_options["histogram"] and can_iterate_distribution(agent):
+        # Iterate the distribution of agents on a histogram, without simulation noise
+        sim_moments = iterate_distribution_medians(
+            agent,
+            groups,
+            sim_periods,
+            make_histogram_grid(
+                simulation_options["histogram_max"], simulation_options["histogram_count"]
+            ),
+            np.linspace(0.0, 1.0, simulation_options["share_count"]),
+        )
+    elif simulation_options["streaming"] and can_simulate_fast(agent):
+        # Stream chunks of agents through the moments without keeping their histories
+        sim_moments = simulate_lifecycle_medians(
+            agent,
+            groups,
+            sim_periods,
+            chunk_size=simulation_options["chunk_size"],
+        )
+    elif simulation_options["fast"] and can_simulate_fast(agent):
+        # Simulate the whole panel with array operations, replaying the shock bank
+        records = simulate_lifecycle_records(agent, sim_periods, record)
+        sim_moments = {
+            key: np.median(records[var_name][np.searchsorted(record[var_name], periods)])
+            for key, (var_name, periods) in groups.items()
+        }
+    else:
+        # Initialize the simulation by clearing histories, resetting initial values
+        agent.initialize_sim()
+        agent.simulate(sim_periods)  # Simulate histories of consumption and wealth
+        sim_moments = {
+            key: np.median(agent.history[var_name][periods])
+            for key, (var_name, periods) in groups.items()
+        }
 
-    if "Portfolio" in agent.name:
-        sim_share_history = agent.history["Share"]
-        share_moments = {}
-        for key, cohort_idx in sim_mapping.items():
-            key_port = key + "_port"
-            if key_port in emp_moments:
-                share_moments[key_port] = np.median(sim_share_history[cohort_idx])
-        sim_moments.update(share_moments)
+    evaluation_store.put(store_key, sim_moments, seconds=time() - t0)
 
     return sim_moments
 
 
+def get_moment_names(agent, emp_moments):
+    """
+    List the simulated moments that simulate_moments returns for an agent: the
+    wealth moments in emp_moments, plus the portfolio share moments of Portfolio
+    specifications.
+    """
+    moment_names = [key for key in sim_mapping if key in emp_moments]
+    if "Portfolio" in agent.name:
+        moment_names += [key + "_port" for key in sim_mapping if key + "_port" in emp_moments]
+    return moment_names
+
+
+def get_moment_groups(agent, emp_moments):
+    """
+    Map each simulated moment to the tracked variable and the simulated periods
+    that it is the median of: wealth, taken to mean bank balances before receiving
+    labor income, for the age groups in emp_moments, and the risky share for the
+    _port moments.
+    """
+    groups = {}
+    for key in get_moment_names(agent, emp_moments):
+        if key.endswith("_port"):
+            groups[key] = ("Share", sim_mapping[key[: -len("_port")]])
+        else:
+            groups[key] = ("bNrm", sim_mapping[key])
+    return groups
+
+
+def prepare_solve(agent):
+    """
+    Construct everything the agent's solution depends on once the estimated
+    parameters have been assigned: the subjective beliefs of the (Stock) and
+    (Labor) specifications, the constructed attributes and the bequest motive.
+    """
+    if hasattr(agent, "BeqCRRA"):
+        agent.BeqCRRA = agent.CRRA
+
+    # ensure subjective beliefs are used for solution
+    if "(Stock)" in agent.name and "Portfolio" in agent.name:
+        agent.use_beliefs("subjective")
+    if "(Labor)" in agent.name:
+        agent.assign_parameters(**init_subjective_labor)
+        agent.update_income_process()
+
+    # Update parameters on the agent / construct them
+    agent.update()
+    if "WarmGlow" in agent.name:
+        agent.BeqFac = agent.BeqMPC ** (-agent.CRRA)
+        agent.BeqShift = agent.BeqInt / agent.BeqMPC
+
+
+def solve_params_batch(agent, params_list, emp_moments):
+    """
+    Solve the agent at several parameter vectors with one call of agent.solve_batch,
+    which stacks them into a single backward induction when the agent's solver can,
+    and put the solutions in solution_cache for simulate_moments to pick up. Vectors
+    whose moments are already stored, or whose solution is already cached, are
+    skipped. Nothing is solved if the cache is disabled.
+
+    Parameters
+    ----------
+    agent : AgentType
+        Agent used in the estimation.
+    params_list : [dict]
+        Mappings from estimated parameter names to values, all with the same names.
+    emp_moments : dict
+        Empirical moments, which determine the moments looked up in the store.
+
+    Returns
+    -------
+    n_solved : int
+        Number of parameter vectors that were solved.
+    """
+    if solution_cache.max_bytes == 0:
+        return 0
+    moment_names = get_moment_names(agent, emp_moments)
+
+    todo = {}
+    for params in params_list:
+        cache_key = solution_cache.make_key(agent, params)
+        store_key = evaluation_store.make_key(agent, params)
+        if cache_key in solution_cache or cache_key in todo:
+            continue
+        if evaluation_store.get(store_key, moment_names, count=False) is not None:
+            continue
+        todo[cache_key] = params
+    if len(todo) < 2:
+        # A single vector is solved by simulate_moments anyway
+        return 0
+
+    param_names = list(next(iter(todo.values())))
+    param_matrix = np.array(
+        [[float(params[name]) for name in param_names] for params in todo.values()]
+    )
+    solutions = agent.solve_batch(param_matrix, param_names, prepare=prepare_solve)
+    for cache_key, solution in zip(todo, solutions, strict=True):
+        solution_cache.put(cache_key, solution)
+    return len(todo)
+
+
 def calculate_weights(emp_moments, weight_sum):
     """
     Generate a dictionary of all moment weights, loading both median wealth-to-
@@ -467,7 +708,7 @@ def msm_criterion(params, agent=None, emp_moments=None, weights=None):
     NEED TO WRITE CORRECT OUTPUTS
     """
     emp_moments = emp_moments.copy()
-    sim_moments = simulate_moments(params, agent, emp_moments)
+    sim_moments = simulate_moments(params, agent, emp_moments, use_store=True)
 
     # TODO: make sure all keys in moments have a corresponding
     # key in sim_moments, raise an error if not
@@ -480,6 +721,11 @@ def msm_criterion(params, agent=None, emp_moments=None, weights=None):
 
     squared_errors = np.square(errors)
     loss = np.sum(squared_errors)
+    evaluation_store.put_loss(
+        evaluation_store.make_key(agent, params),
+        hash_object({"emp_moments": emp_moments, "weights": weights}),
+        loss,
+    )
 
     return {
         "value": loss,
@@ -488,60 +734,362 @@ def msm_criterion(params, agent=None, emp_moments=None, weights=None):
     }
 
 
+def get_estimagic_bounds(params):
+    """
+    Select the bounds from init_params_options for the parameters being estimated,
+    in the form of keyword arguments for em.minimize.
+
+    Parameters
+    ----------
+    params : dict
+        Mapping from the names of the estimated parameters to their values.
+
+    Returns
+    -------
+    estimagic_options : dict
+        Dictionary with upper_bounds and lower_bounds for the parameters.
+    """
+    upper_bounds = {
+        key: value
+        for key, value in init_params_options["upper_bounds"].items()
+        if key in params
+    }
+
+    lower_bounds = {
+        key: value
+        for key, value in init_params_options["lower_bounds"].items()
+        if key in params
+    }
+
+    return {"upper_bounds": upper_bounds, "lower_bounds": lower_bounds}
+
+
+def set_minimize_cores(options, n_cores):
+    """
+    Copy a dictionary of minimize_options with every n_cores setting replaced, so
+    that an optimizer stays within the cores it has been given.
+    """
+    options = {
+        key: value.copy() if isinstance(value, dict) else value
+        for key, value in options.items()
+    }
+    for key in ["algo_options", "numdiff_options"]:
+        if "n_cores" in options.get(key, {}):
+            options[key]["n_cores"] = n_cores
+    return options
+
+
+def use_worker_pool(agent, func, minimize_options, kwargs):
+    """
+    Wrap a criterion or moment simulator for evaluation by a WarmPool, if the pool
+    is enabled. With more than one core in minimize_options, batches are spread
+    over warm worker processes, and the wrapped function carries its own keyword
+    arguments so that the agent is not pickled with each batch. With one core,
+    they are evaluated in this process. Either way, the points of a batch are
+    solved together in groups of solver_options["batch_size"].
+
+    Parameters
+    ----------
+    agent : AgentType
+        Agent used in the estimation.
+    func : callable
+        Function of the params dict and keyword arguments including agent.
+    minimize_options : dict
+        Options for em.minimize.
+    kwargs : dict
+        Keyword arguments of func, possibly including agent.
+
+    Returns
+    -------
+    func : callable
+        The wrapped function, or func itself if the pool is not used.
+    minimize_options : dict
+        Copy of minimize_options using the pool as the batch evaluator.
+    kwargs : dict
+        Keyword arguments left to pass with func; empty if it was wrapped.
+    """
+    if not worker_pool_options["enabled"]:
+        return func, minimize_options, kwargs
+    kwargs = {key: value for key, value in kwargs.items() if key != "agent"}
+    pool = WarmPool(
+        agent,
+        idle_timeout=worker_pool_options["idle_timeout"],
+        batch_size=solver_options["batch_size"],
+    )
+    return WarmCriterion(func, agent, **kwargs), pool.set_batch_evaluator(minimize_options), {}
+
+
+def get_fidelity_minimize_options(options, level):
+    """
+    Copy a dictionary of minimize_options for one level of a fidelity schedule:
+    multistart is switched on or off as the level asks, and the level's
+    algo_options are merged into those of options.
+    """
+    options = {
+        key: value.copy() if isinstance(value, dict) else value
+        for key, value in options.items()
+    }
+    options["multistart"] = level.get("multistart", False)
+    if not options["multistart"]:
+        options.pop("multistart_options", None)
+    options["algo_options"] = {
+        **options.get("algo_options", {}),
+        **level.get("algo_options", {}),
+    }
+    return options
+
+
+def run_fidelity_levels(
+    agent_name,
+    initial_guess,
+    levels,
+    emp_moments,
+    minimize_options,
+    criterion_kwargs=None,
+    estimagic_options=None,
+):
+    """
+    Minimize msm_criterion on each of the cheap levels of a fidelity schedule in
+    turn, starting each level from the optimum of the one before. Each level has
+    its own agent, built with the level's calibration, so its solutions and stored
+    evaluations are kept apart from those of the full calibration.
+
+    Parameters
+    ----------
+    agent_name : str
+        Name of the specification being estimated.
+    initial_guess : dict
+        Starting point of the first level.
+    levels : [dict]
+        Levels of fidelity_options, each with a calibration, multistart and
+        algo_options, from the cheapest up.
+    emp_moments : dict
+        Empirical moments.
+    minimize_options : dict
+        Options for em.minimize, which each level updates.
+    criterion_kwargs : dict or None
+        Keyword arguments for msm_criterion besides the agent and the moments.
+    estimagic_options : dict or None
+        Bounds of the parameters, as from get_estimagic_bounds.
+
+    Returns
+    -------
+    params : dict
+        Optimum of the last level, the starting point of the next one.
+    """
+    params = initial_guess
+    for j, level in enumerate(levels):
+        level_agent = make_agent(agent_name, level["calibration"])
+        res, time_to_estimate = estimate_min(
+            level_agent,
+            msm_criterion,
+            params,
+            emp_moments,
+            get_fidelity_minimize_options(minimize_options, level),
+            criterion_kwargs={**(criterion_kwargs or {})},
+            estimagic_options=estimagic_options,
+        )
+        params = {key: float(value) for key, value in res.params.items()}
+        estimates = ", ".join(f"{key} = {value:.3f}" for key, value in params.items())
+        print(
+            f"Fidelity level {j + 1} of {len(levels) + 1} ({level_agent.AgentCount} agents): "
+            f"{estimates} after {time_to_estimate:.1f} sec."
+        )
+    return params
+
+
+# Agent held by each worker process, built once by init_worker
+worker_state = SimpleNamespace(agent=None)
+
+
+def init_worker(agent_name, calibration_overrides=None, calibration_hash=None):
+    """
+    Build the agent that a worker process uses for all of its tasks, so that its
+    solution cache stays warm from one task to the next. The agent has the same
+    calibration overrides as the parent's; if calibration_hash is given, it must
+    also have the same calibration hash.
+    """
+    agent = make_agent(agent_name, calibration_overrides)
+    if calibration_hash is not None and agent.calibration_hash != calibration_hash:
+        msg = (
+            f"Worker built {agent_name} with calibration hash "
+            f"{agent.calibration_hash}, but the parent's agent has {calibration_hash}."
+        )
+        raise ValueError(msg)
+    worker_state.agent = agent
+
+
+def get_worker_initargs(agent):
+    """
+    Arguments of init_worker that rebuild an agent in a worker process.
+    """
+    return (
+        agent.name,
+        getattr(agent, "calibration_overrides", None),
+        getattr(agent, "calibration_hash", None),
+    )
+
+
+def estimate_bootstrap_replicate(
+    n,
+    bootstrap_moments,
+    initial_estimate,
+    weights,
+    options,
+    agent=None,
+):
+    """
+    Re-estimate the model on the moments of one bootstrap replicate, using the agent
+    of this worker process unless one is passed. Returns the replicate number and
+    the estimated parameters as a dictionary.
+    """
+    agent = worker_state.agent if agent is None else agent
+    res = em.minimize(
+        msm_criterion,
+        initial_estimate,
+        criterion_kwargs={
+            "agent": agent,
+            "emp_moments": bootstrap_moments,
+            "weights": weights,
+        },
+        **options,
+        **get_estimagic_bounds(initial_estimate),
+    )
+    return n, {key: float(value) for key, value in res.params.items()}
+
+
 # Define the bootstrap procedure
 def calculate_se_bootstrap(
     agent,
     initial_estimate,
     n_draws=50,
     seed=0,
+    n_cores=1,
+    emp_moments=None,
+    weights=None,
+    checkpoint_file=None,
     verbose=False,
 ):
-    #TODO: WRITE DOCSTRING
+    """
+    Compute standard errors of the estimated parameters by re-estimating the model on
+    bootstrap resamples of the SCF data. Each replicate has its own random stream
+    spawned from seed, which determines both its resample and the starting points of
+    a multistart optimizer, so results do not depend on n_cores or on the order in
+    which replicates finish. With n_cores > 1, replicates are spread over a pool of
+    processes that each build their own agent once.
+
+    Parameters
+    ----------
+    agent : AgentType
+        Agent used in the estimation; worker processes rebuild it from agent.name.
+    initial_estimate : dict
+        Point estimate of the parameters, used as the starting point.
+    n_draws : int
+        Number of bootstrap replicates.
+    seed : int
+        Seed for the random streams of the replicates.
+    n_cores : int
+        Number of worker processes; replicates run in this process if 1.
+    emp_moments : dict or None
+        Empirical moments; found from agent.name if None. Moments that are not
+        resampled (risky shares) are held at these values.
+    weights : dict or None
+        Moment weights for msm_criterion; found from the data if None.
+    checkpoint_file : Path or None
+        JSON lines file to which each finished replicate is appended. Replicates
+        already in it (for the same seed, starting point and targets) are not run
+        again.
+    verbose : bool
+        Whether to report progress after each replicate.
+
+    Returns
+    -------
+    std_errors : dict
+        Mapping from parameter names to their bootstrap standard errors.
+    estimates : pd.DataFrame
+        Estimated parameters of each replicate (rows).
+    """
     t_0 = time()
 
-    # Generate a list of seeds for generating bootstrap samples
-    RNG = np.random.default_rng(seed)
-    seed_list = RNG.integers(2**31 - 1, size=n_draws)
+    if emp_moments is None or weights is None:
+        found_moments, weight_sum = get_empirical_moments(agent.name)
+        emp_moments = found_moments if emp_moments is None else emp_moments
+        weights = calculate_weights(found_moments, weight_sum) if weights is None else weights
 
-    # Estimate the model N times, recording each set of estimated parameters
-    estimate_list = []
-    for n in range(n_draws):
-        t_start = time()
-
-        # Bootstrap a new dataset by resampling from the original data
-        bootstrap_data = get_bootstrap_samples(data=scf_data, rng=RNG)
-
-        # Find moments with bootstrapped sample
-        bootstrap_moments, trash = get_weighted_moments(
-            data=bootstrap_data,
-            variable="wealth_income_ratio",
-            weights="weight",
-            groups="age_group",
-            mapping=age_mapping,
-        )
+    # Give each replicate its own random stream for resampling and multistart
+    streams = np.random.SeedSequence(seed).spawn(n_draws)
+    counts = sparse.vstack(
+        [
+            draw_bootstrap_counts(len(get_scf_table()), 1, np.random.default_rng(stream))
+            for stream in streams
+        ],
+        format="csr",
+    )
 
-        # Estimate the model with the bootstrap data and add to list of estimates
-        this_estimate = em.minimize(
-            msm_criterion,
-            initial_estimate,
-            criterion_kwargs={"agent": agent, "emp_moments": bootstrap_moments},
-            **minimize_options,
-        ).params
-        estimate_list.append(this_estimate)
-        t_now = time()
-
-        # Report progress of the bootstrap
-    if verbose:
-        print(
-            f"Finished bootstrap estimation #{n + 1} of {n_draws} in {t_now - t_start} seconds ({t_now - t_0} cumulative)",
-        )
+    # Find the moments of every bootstrap resample of the data in one batch
+    replicate_moments, _ = get_bootstrap_moments(
+        get_scf_table(),
+        variable="wealth_income_ratio",
+        weights="weight",
+        groups="age_group",
+        mapping=age_mapping,
+        counts=counts,
+    )
+
+    # Replicates are spread over cores, so each optimizer runs on a single one
+    options = set_minimize_cores(minimize_options, 1)
+    tasks = []
+    for n, stream in enumerate(streams):
+        task_options = options.copy()
+        if task_options.get("multistart"):
+            task_options["multistart_options"] = {
+                **task_options.get("multistart_options", {}),
+                "seed": int(stream.generate_state(1)[0]),
+            }
+        bootstrap_moments = {**emp_moments, **replicate_moments.iloc[n].to_dict()}
+        tasks.append((n, bootstrap_moments, initial_estimate, weights, task_options))
+
+    # Reload replicates finished by an earlier, interrupted run
+    estimate_list = [None] * n_draws
+    run_key = hash_object(
+        {"seed": seed, "start": initial_estimate, "targets": emp_moments, "weights": weights},
+    )
+    if checkpoint_file is not None:
+        for record in read_records(checkpoint_file):
+            if record["run"] == run_key and record["n"] < n_draws:
+                estimate_list[record["n"]] = record["params"]
+        tasks = [task for task in tasks if estimate_list[task[0]] is None]
+        if len(tasks) < n_draws:
+            print(f"Resuming bootstrap with {n_draws - len(tasks)} replicates already done.")
+
+    def record(n_done, n, this_estimate):
+        estimate_list[n] = this_estimate
+        if checkpoint_file is not None:
+            append_record(checkpoint_file, {"run": run_key, "n": n, "params": this_estimate})
+        if verbose:
+            print(
+                f"Finished bootstrap estimation #{n + 1} ({n_done} of {len(tasks)}) after {time() - t_0:.1f} seconds",
+            )
+
+    # Estimate the model N times, recording each set of estimated parameters
+    if n_cores == 1:
+        for n_done, task in enumerate(tasks, start=1):
+            record(n_done, *estimate_bootstrap_replicate(*task, agent=agent))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_cores,
+            initializer=init_worker,
+            initargs=get_worker_initargs(agent),
+        ) as pool:
+            futures = [pool.submit(estimate_bootstrap_replicate, *task) for task in tasks]
+            for n_done, future in enumerate(as_completed(futures), start=1):
+                record(n_done, *future.result())
 
     # Calculate the standard errors for each parameter
-    estimate_array = (np.array(estimate_list)).T
-    DiscFac_std_error = np.std(estimate_array[0])
-    CRRA_std_error = np.std(estimate_array[1])
+    estimates = pd.DataFrame(estimate_list, columns=list(initial_estimate))
+    std_errors = {key: float(np.std(estimates[key])) for key in estimates}
 
-    return [DiscFac_std_error, CRRA_std_error]
+    return std_errors, estimates
 
 
 # =================================================================
@@ -560,9 +1108,30 @@ def do_estimate_model(
     minimize_options=None,
     criterion_kwargs=None,
     save_dir=None,
+    history_file=None,
+    jacobian_options=jacobian_options,
+    fidelity_levels=None,
 ):
     #TODO: WRITE DOCSTRING
-    
+
+    estimagic_options = get_estimagic_bounds(initial_guess)
+
+    # Find a starting point on cheaper calibrations before running on the full one
+    if fidelity_levels:
+        if fidelity_levels[-1]["calibration"]:
+            msg = "The last fidelity level must be the full calibration."
+            raise ValueError(msg)
+        initial_guess = run_fidelity_levels(
+            agent.name,
+            initial_guess,
+            fidelity_levels[:-1],
+            emp_moments,
+            minimize_options,
+            criterion_kwargs=criterion_kwargs,
+            estimagic_options=estimagic_options,
+        )
+        minimize_options = get_fidelity_minimize_options(minimize_options, fidelity_levels[-1])
+
     fmt_init_guess = [f"{key} = {value:.3f}" for key, value in initial_guess.items()]
     multistart_text = " with multistart" if minimize_options.get("multistart") else ""
     statement1 = f"Estimating model using {minimize_options['algorithm']}{multistart_text} from an initial guess of"
@@ -579,24 +1148,15 @@ def do_estimate_model(
     print(statement2)
     print(dash_line)
 
-    upper_bounds = {
-        key: value
-        for key, value in init_params_options["upper_bounds"].items()
-        if key in initial_guess
-    }
-
-    lower_bounds = {
-        key: value
-        for key, value in init_params_options["lower_bounds"].items()
-        if key in initial_guess
-    }
-
-    estimagic_options = {"upper_bounds": upper_bounds, "lower_bounds": lower_bounds}
-
     if estimate_method == "min":
+        # Checkpoint every criterion evaluation so an interrupted run can resume
+        criterion = msm_criterion
+        if history_file is not None:
+            criterion = CriterionHistory(msm_criterion, history_file)
+
         res, time_to_estimate = estimate_min(
             agent,
-            msm_criterion,
+            criterion,
             initial_guess,
             emp_moments,
             minimize_options,
@@ -615,6 +1175,12 @@ def do_estimate_model(
             initial_guess,
             minimize_options,
             estimagic_options=estimagic_options,
+            jacobian=get_msm_jacobian,
+            jacobian_kwargs={
+                "agent": agent,
+                "emp_moments": emp_moments,
+                **jacobian_options,
+            },
         )
 
         model_estimate = res._params
@@ -628,10 +1194,27 @@ def do_estimate_model(
     statement2 = f"Time to estimate: {int(minutes)} min, {int(seconds)} sec."
     estimates = [f"{key} = {value:.3f}" for key, value in model_estimate.items()]
     statement3 = "Estimated values: " + ", ".join(estimates)
-    dash_len = max(len(statement1), len(statement2), len(statement3))
-    print(statement1)
-    print(statement2)
-    print(statement3)
+    cache_stats = solution_cache.stats()
+    statement4 = (
+        f"Solution cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+        f"{cache_stats['evictions']} evictions ({cache_stats['size_mb']:.1f} MB held)."
+    )
+    store_stats = evaluation_store.stats()
+    statement5 = (
+        f"Evaluation store: {store_stats['hits']} hits, {store_stats['misses']} misses."
+    )
+    statements = [statement1, statement2, statement3, statement4, statement5]
+    constructor_stats = getattr(agent, "constructor_stats", None)
+    if constructor_stats is not None:
+        statements.append(
+            f"Constructors: {constructor_stats['built']} built, "
+            f"{constructor_stats['skipped']} skipped, "
+            f"saving {constructor_stats['seconds_saved']:.1f} of "
+            f"{constructor_stats['seconds_spent'] + constructor_stats['seconds_saved']:.1f} sec."
+        )
+    dash_len = max(len(statement) for statement in statements)
+    for statement in statements:
+        print(statement)
     print("-" * dash_len)
 
     # Create the simple estimate table
@@ -660,27 +1243,63 @@ def do_compute_se_boostrap(
     time_to_estimate,
     bootstrap_size=50,
     seed=0,
+    n_cores=1,
+    emp_moments=None,
+    weights=None,
     save_dir=None,
 ):
-    #TODO: WRITE DOCSTRING
-    
+    """
+    Compute bootstrap standard errors for the estimated parameters, report them,
+    and save them to a csv file alongside the point estimates. The estimates of
+    every replicate are saved to a second csv file.
+
+    Parameters
+    ----------
+    agent : AgentType
+        Agent used in the estimation.
+    model_estimate : dict
+        Point estimate of the parameters.
+    time_to_estimate : float
+        Seconds taken by the point estimation, used to predict the run time.
+    bootstrap_size : int
+        Number of bootstrap replicates.
+    seed : int
+        Seed for the random streams of the replicates.
+    n_cores : int
+        Number of worker processes to spread replicates over.
+    emp_moments : dict or None
+        Empirical moments of the estimation.
+    weights : dict or None
+        Moment weights of the estimation.
+    save_dir : Path
+        Directory in which to save the results.
+
+    Returns
+    -------
+    None
+    """
     # Estimate the model:
     print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
     print(
-        f"Computing standard errors using {bootstrap_size} bootstrap replications.",
+        f"Computing standard errors using {bootstrap_size} bootstrap replications on {n_cores} cores.",
     )
     print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
 
-    t_bootstrap_guess = time_to_estimate * bootstrap_size
+    t_bootstrap_guess = time_to_estimate * np.ceil(bootstrap_size / n_cores)
     minutes, seconds = divmod(t_bootstrap_guess, 60)
     print(f"This will take approximately {int(minutes)} min, {int(seconds)} sec.")
 
+    save_dir = Path(save_dir) if save_dir is not None else Path.cwd()
     t_start_bootstrap = time()
-    std_errors = calculate_se_bootstrap(
+    std_errors, estimates = calculate_se_bootstrap(
         agent,
         model_estimate,
         n_draws=bootstrap_size,
         seed=seed,
+        n_cores=n_cores,
+        emp_moments=emp_moments,
+        weights=weights,
+        checkpoint_file=save_dir / (agent.name + "_bootstrap.jsonl"),
         verbose=True,
     )
     t_end_bootstrap = time()
@@ -690,102 +1309,465 @@ def do_compute_se_boostrap(
     minutes, seconds = divmod(time_to_bootstrap, 60)
     print(f"Time to bootstrap: {int(minutes)} min, {int(seconds)} sec.")
 
-    print(f"Standard errors: DiscFac--> {std_errors[0]}, CRRA--> {std_errors[1]}")
+    errors = [f"{key}--> {value}" for key, value in std_errors.items()]
+    print("Standard errors: " + ", ".join(errors))
 
     # Create the simple bootstrap table
-    bootstrap_results_file = save_dir + agent.name + "_bootstrap_results.csv"
+    bootstrap_results_file = save_dir / (agent.name + "_bootstrap_results.csv")
 
     with open(bootstrap_results_file, "w") as f:
         writer = csv.writer(f)
         writer.writerow(
-            [
-                "DiscFac",
-                "DiscFac_standard_error",
-                "CRRA",
-                "CRRA_standard_error",
-            ],
+            [name for key in std_errors for name in (key, key + "_standard_error")],
         )
         writer.writerow(
-            [model_estimate[0], std_errors[0], model_estimate[1], std_errors[1]],
+            [
+                value
+                for key in std_errors
+                for value in (float(model_estimate[key]), std_errors[key])
+            ],
         )
 
+    estimates.to_csv(save_dir / (agent.name + "_bootstrap_estimates.csv"))
 
-def do_compute_sensitivity(agent, model_estimate, emp_moments, save_dir=None):
-    #TODO: WRITE DOCSTRING
-    
+
+def evaluate_sim_moments(j, params, emp_moments, agent=None):
+    """
+    Simulate moments at one set of parameters, using the agent of this worker
+    process unless one is passed. Returns the task number and the moments.
+    """
+    agent = worker_state.agent if agent is None else agent
+    return j, simulate_moments(params, agent, emp_moments, use_store=True)
+
+
+def compute_moment_jacobian(agent, params, emp_moments, step=0.01, n_cores=1):
+    """
+    Compute the Jacobian of the simulated moments with respect to the parameters by
+    forward differences, perturbing each parameter once. The n_params + 1 parameter
+    vectors are simulated in one batch, spread over worker processes if n_cores > 1
+    and solved in one stacked backward induction otherwise, and all of them use the
+    same common random numbers. A parameter whose forward
+    step would cross its upper bound is stepped backward instead.
+
+    Parameters
+    ----------
+    agent : AgentType
+        Agent used in the estimation; worker processes rebuild it from agent.name.
+    params : dict
+        Mapping from parameter names to the values at which to differentiate.
+    emp_moments : dict
+        Empirical moments, which determine the moments that are simulated.
+    step : float
+        Size of the perturbation of each parameter.
+    n_cores : int
+        Number of worker processes; simulations run in this process if 1.
+
+    Returns
+    -------
+    jacobian : pd.DataFrame
+        Derivatives of each moment (rows) with respect to each parameter (columns).
+    """
+    params = {key: float(value) for key, value in params.items()}
+    upper_bounds = init_params_options["upper_bounds"]
+
+    steps = {}
+    tasks = [(0, params, emp_moments)]
+    for j, key in enumerate(params, start=1):
+        h = step
+        if params[key] + step > upper_bounds.get(key, np.inf):
+            h = -step
+        steps[key] = h
+        tasks.append((j, {**params, key: params[key] + h}, emp_moments))
+
+    results = [None] * len(tasks)
+    if n_cores == 1:
+        # Solve all the perturbed vectors together, then simulate each of them
+        solve_params_batch(agent, [task[1] for task in tasks], emp_moments)
+        for task in tasks:
+            j, moments = evaluate_sim_moments(*task, agent=agent)
+            results[j] = moments
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(n_cores, len(tasks)),
+            initializer=init_worker,
+            initargs=get_worker_initargs(agent),
+        ) as pool:
+            for j, moments in pool.map(evaluate_sim_moments, *zip(*tasks, strict=True)):
+                results[j] = moments
+
+    base = pd.Series(results[0], dtype=float)
+    jacobian = pd.DataFrame(
+        {
+            key: (pd.Series(results[j], dtype=float)[base.index] - base) / steps[key]
+            for j, key in enumerate(params, start=1)
+        },
+    )
+    jacobian.index.name = "moment"
+    jacobian.columns.name = "parameter"
+    return jacobian
+
+
+def get_msm_jacobian(params, agent, emp_moments, step=0.01, n_cores=1):
+    """
+    Jacobian of the simulated moments in the nested form that em.estimate_msm
+    accepts for its jacobian argument, mapping moment names to mappings from
+    parameter names to derivatives.
+    """
+    jacobian = compute_moment_jacobian(agent, params, emp_moments, step, n_cores)
+    return {
+        moment: {key: float(value) for key, value in row.items()}
+        for moment, row in jacobian.iterrows()
+    }
+
+
+def do_compute_sensitivity(
+    agent,
+    model_estimate,
+    emp_moments,
+    step=0.01,
+    n_cores=1,
+    save_dir=None,
+):
+    """
+    Compute the sensitivity of the estimated parameters to each moment, as in
+    Andrews, Gentzkow, and Shapiro (2017) with all moments weighted equally, plot
+    it for every parameter, and save the Jacobian and sensitivity matrices.
+
+    Parameters
+    ----------
+    agent : AgentType
+        Agent used in the estimation.
+    model_estimate : dict
+        Point estimate of the parameters.
+    emp_moments : dict
+        Empirical moments of the estimation.
+    step : float
+        Size of the perturbation of each parameter in the Jacobian.
+    n_cores : int
+        Number of worker processes to spread the Jacobian simulations over.
+    save_dir : Path
+        Directory in which to save the results.
+
+    Returns
+    -------
+    sensitivity : pd.DataFrame
+        Sensitivity of each parameter (rows) to each moment (columns).
+    """
     print("``````````````````````````````````````````````````````````````````````")
     print("Computing sensitivity measure.")
     print("``````````````````````````````````````````````````````````````````````")
 
     # Find the Jacobian of the function that simulates moments
+    jac = compute_moment_jacobian(agent, model_estimate, emp_moments, step, n_cores)
 
-    n_moments = len(emp_moments)
-    jac = np.array(
-        [
-            approx_fprime(
-                model_estimate,
-                lambda params: simulate_moments(params, agent=agent)[j],
-                epsilon=0.01,
-            )
-            for j in range(n_moments)
-        ],
+    # Compute sensitivity measure. (all moments weighted equally)
+    sensitivity = pd.DataFrame(
+        np.linalg.solve(jac.T @ jac, jac.T),
+        index=jac.columns,
+        columns=jac.index,
     )
 
-    # Compute sensitivity measure. (all moments weighted equally)
-    sensitivity = np.dot(np.linalg.inv(np.dot(jac.T, jac)), jac.T)
+    save_dir = Path(save_dir) if save_dir is not None else Path.cwd()
+    jac.to_csv(save_dir / (agent.name + "Jacobian.csv"))
+    sensitivity.to_csv(save_dir / (agent.name + "Sensitivity.csv"))
 
     # Create lables for moments in the plots
-    moment_labels = emp_moments.keys()
+    moment_labels = list(jac.index)
+    n_moments = len(moment_labels)
 
     # Plot
-    fig, axs = plt.subplots(len(model_estimate))
+    fig, axs = plt.subplots(len(sensitivity), squeeze=False)
     fig.set_tight_layout(True)
 
-    axs[0].bar(range(n_moments), sensitivity[0, :], tick_label=moment_labels)
-    axs[0].set_title("DiscFac")
-    axs[0].set_ylabel("Sensitivity")
-    axs[0].set_xlabel("Median W/Y Ratio")
+    for ax, (key, row) in zip(axs[:, 0], sensitivity.iterrows(), strict=True):
+        ax.bar(range(n_moments), row.to_numpy(), tick_label=moment_labels)
+        ax.set_title(key)
+        ax.set_ylabel("Sensitivity")
+        ax.set_xlabel("Moment")
+
+    plt.savefig(save_dir / (agent.name + "Sensitivity.pdf"))
+    plt.savefig(save_dir / (agent.name + "Sensitivity.png"))
+    plt.savefig(save_dir / (agent.name + "Sensitivity.svg"))
+
+    plt.show()
+
+    return sensitivity
+
+
+def make_sweep_grid(model_estimate, sweep_params, grid_density=20, width=0.25):
+    """
+    Make a grid of values for each swept parameter, centered on its estimate. The
+    grid extends width times the range of the parameter's bounds to each side of
+    the estimate, clipped to those bounds.
 
-    axs[1].bar(range(n_moments), sensitivity[1, :], tick_label=moment_labels)
-    axs[1].set_title("CRRA")
-    axs[1].set_ylabel("Sensitivity")
-    axs[1].set_xlabel("Median W/Y Ratio")
+    Parameters
+    ----------
+    model_estimate : dict
+        Point estimate of the parameters.
+    sweep_params : [str]
+        Names of the parameters to sweep over.
+    grid_density : int
+        Number of values in each dimension.
+    width : float
+        Half-width of each grid as a fraction of the range of its bounds.
 
-    plt.savefig(save_dir + agent.name + "Sensitivity.pdf")
-    plt.savefig(save_dir + agent.name + "Sensitivity.png")
-    plt.savefig(save_dir + agent.name + "Sensitivity.svg")
+    Returns
+    -------
+    grids : dict
+        Mapping from parameter names to arrays of grid values.
+    """
+    grids = {}
+    for key in sweep_params:
+        lower = init_params_options["lower_bounds"][key]
+        upper = init_params_options["upper_bounds"][key]
+        center = float(model_estimate[key])
+        half_width = width * (upper - lower)
+        grids[key] = np.linspace(
+            max(center - half_width, lower),
+            min(center + half_width, upper),
+            grid_density,
+        )
+    return grids
 
+
+def evaluate_sweep_point(point, params, emp_moments, weights, agent=None):
+    """
+    Evaluate the MSM criterion at one point of a parameter sweep, using the agent of
+    this worker process unless one is passed. Returns the grid position of the point
+    and the criterion value.
+    """
+    agent = worker_state.agent if agent is None else agent
+    value = msm_criterion(params, agent=agent, emp_moments=emp_moments, weights=weights)
+    return point, float(value["value"])
+
+
+def run_param_sweep(
+    agent,
+    model_estimate,
+    grids,
+    emp_moments,
+    weights,
+    save_dir,
+    n_cores=1,
+    flush_every=10,
+):
+    """
+    Evaluate the MSM criterion on the full grid of the swept parameters, holding all
+    other parameters at their estimates. Values are written to a .npy array in
+    save_dir as they are computed, with unevaluated points left as NaN; running the
+    same sweep again resumes from the points already saved. The grids, the fixed
+    parameters, the agent's calibration hash and hashes of the empirical moments
+    and weights are recorded in a .json file next to the array, and a sweep in
+    which any of them differ starts over.
+
+    Parameters
+    ----------
+    agent : AgentType
+        Agent used in the estimation; worker processes rebuild it from agent.name.
+    model_estimate : dict
+        Point estimate of the parameters.
+    grids : dict
+        Mapping from the names of the swept parameters to arrays of grid values.
+    emp_moments : dict
+        Empirical moments of the estimation.
+    weights : dict
+        Moment weights of the estimation.
+    save_dir : Path
+        Directory in which to save the sweep.
+    n_cores : int
+        Number of worker processes; points are evaluated in this process if 1.
+    flush_every : int
+        Number of points evaluated between writes of the array to disk.
+
+    Returns
+    -------
+    values : np.array
+        Criterion values with one axis per swept parameter, in the order of grids.
+    """
+    sweep_params = list(grids)
+    fixed = {
+        key: float(value)
+        for key, value in model_estimate.items()
+        if key not in grids
+    }
+    spec = {
+        "grids": {key: [float(x) for x in grid] for key, grid in grids.items()},
+        "fixed": fixed,
+        "calibration_hash": getattr(agent, "calibration_hash", None),
+        "emp_moments_hash": hash_object(emp_moments),
+        "weights_hash": hash_object(weights),
+    }
+    save_dir = Path(save_dir)
+    stem = agent.name + "_sweep_" + "_".join(sweep_params)
+    values_file = save_dir / (stem + ".npy")
+    spec_file = save_dir / (stem + ".json")
+
+    shape = tuple(len(grid) for grid in grids.values())
+    resume = (
+        values_file.exists()
+        and spec_file.exists()
+        and json.loads(spec_file.read_text()) == spec
+    )
+    if resume:
+        values = np.lib.format.open_memmap(values_file, mode="r+")
+    else:
+        if values_file.exists():
+            print(f"Saved sweep in {values_file} has another specification; starting over.")
+        values = np.lib.format.open_memmap(
+            values_file, mode="w+", dtype=np.float64, shape=shape
+        )
+        values[...] = np.nan
+        values.flush()
+        spec_file.write_text(json.dumps(spec, indent=4))
+
+    todo = [tuple(point) for point in np.argwhere(np.isnan(values))]
+    print(f"Evaluating {len(todo)} of {values.size} grid points on {n_cores} cores.")
+
+    tasks = []
+    for point in todo:
+        params = fixed.copy()
+        for key, j in zip(sweep_params, point, strict=True):
+            params[key] = float(grids[key][j])
+        tasks.append((point, params, emp_moments, weights))
+
+    def record(n_done, point, value):
+        values[point] = value
+        if n_done % flush_every == 0:
+            values.flush()
+
+    if n_cores == 1:
+        batch_size = solver_options["batch_size"]
+        for start in range(0, len(tasks), batch_size):
+            batch = tasks[start : start + batch_size]
+            solve_params_batch(agent, [task[1] for task in batch], emp_moments)
+            for n_done, task in enumerate(batch, start=start + 1):
+                record(n_done, *evaluate_sweep_point(*task, agent=agent))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_cores,
+            initializer=init_worker,
+            initargs=get_worker_initargs(agent),
+        ) as pool:
+            futures = [pool.submit(evaluate_sweep_point, *task) for task in tasks]
+            for n_done, future in enumerate(as_completed(futures), start=1):
+                record(n_done, *future.result())
+    values.flush()
+
+    return np.array(values)
+
+
+def plot_param_sweep(
+    agent_name,
+    grids,
+    values,
+    model_estimate,
+    save_dir,
+    level_count=100,
+):
+    """
+    Make a contour plot of the criterion over the first two swept parameters. If
+    more than two parameters were swept, the plot shows the minimum over the others.
+
+    Parameters
+    ----------
+    agent_name : str
+        Name of the specification, used in the file names.
+    grids : dict
+        Mapping from the names of the swept parameters to arrays of grid values.
+    values : np.array
+        Criterion values with one axis per swept parameter, as from run_param_sweep.
+    model_estimate : dict
+        Point estimate of the parameters, marked on the plot.
+    save_dir : Path
+        Directory in which to save the plots.
+    level_count : int
+        Number of contour levels to plot.
+
+    Returns
+    -------
+    None
+    """
+    y_name, x_name = list(grids)[:2]
+    if values.ndim > 2:
+        values = np.nanmin(values, axis=tuple(range(2, values.ndim)))
+    x_mesh, y_mesh = np.meshgrid(grids[x_name], grids[y_name])
+
+    smm_contour = plt.contourf(x_mesh, y_mesh, values, level_count)
+    plt.colorbar(smm_contour)
+    plt.plot(model_estimate[x_name], model_estimate[y_name], "*r", ms=15)
+    plt.xlabel(x_name, fontsize=14)
+    plt.ylabel(y_name, fontsize=14)
+    save_dir = Path(save_dir)
+    plt.savefig(save_dir / (agent_name + "SMMcontour.pdf"))
+    plt.savefig(save_dir / (agent_name + "SMMcontour.png"))
+    plt.savefig(save_dir / (agent_name + "SMMcontour.svg"))
     plt.show()
 
 
-def do_make_contour_plot(agent, model_estimate, emp_moments, save_dir=None):
-    #TODO: WRITE DOCSTRING
-    
+def do_make_contour_plot(
+    agent,
+    model_estimate,
+    emp_moments,
+    weights=None,
+    sweep_params=None,
+    grid_density=20,
+    width=0.25,
+    n_cores=1,
+    save_dir=None,
+):
+    """
+    Sweep the MSM criterion over a grid of parameter values around the estimate and
+    make a contour plot of it. The sweep is saved in save_dir and resumes if it was
+    interrupted.
+
+    Parameters
+    ----------
+    agent : AgentType
+        Agent used in the estimation.
+    model_estimate : dict
+        Point estimate of the parameters.
+    emp_moments : dict
+        Empirical moments of the estimation.
+    weights : dict or None
+        Moment weights of the estimation; found from the data if None.
+    sweep_params : [str] or None
+        Names of the parameters to sweep over; the first two estimated parameters
+        if None. Other estimated parameters are held at their estimates.
+    grid_density : int
+        Number of values in each dimension of the grid.
+    width : float
+        Half-width of each grid as a fraction of the range of its bounds.
+    n_cores : int
+        Number of worker processes to spread grid points over.
+    save_dir : Path
+        Directory in which to save the sweep and the plots.
+
+    Returns
+    -------
+    None
+    """
     print("``````````````````````````````````````````````````````````````````````")
     print("Creating the contour plot.")
     print("``````````````````````````````````````````````````````````````````````")
     t_start_contour = time()
-    DiscFac_star, CRRA_star = model_estimate
-    grid_density = 20  # Number of parameter values in each dimension
-    level_count = 100  # Number of contour levels to plot
-    DiscFac_list = np.linspace(
-        max(DiscFac_star - 0.25, 0.5),
-        min(DiscFac_star + 0.25, 1.05),
-        grid_density,
+
+    if weights is None:
+        _, weight_sum = get_empirical_moments(agent.name)
+        weights = calculate_weights(emp_moments, weight_sum)
+    if sweep_params is None:
+        sweep_params = list(model_estimate)[:2]
+    save_dir = Path(save_dir) if save_dir is not None else Path.cwd()
+
+    grids = make_sweep_grid(model_estimate, sweep_params, grid_density, width)
+    values = run_param_sweep(
+        agent,
+        model_estimate,
+        grids,
+        emp_moments,
+        weights,
+        save_dir,
+        n_cores=n_cores,
     )
-    CRRA_list = np.linspace(max(CRRA_star - 5, 2), min(CRRA_star + 5, 8), grid_density)
-    CRRA_mesh, DiscFac_mesh = np.meshgrid(CRRA_list, DiscFac_list)
-    smm_obj_levels = np.empty([grid_density, grid_density])
-    for j in range(grid_density):
-        DiscFac = DiscFac_list[j]
-        for k in range(grid_density):
-            CRRA = CRRA_list[k]
-            smm_obj_levels[j, k] = msm_criterion(
-                np.array([DiscFac, CRRA]),
-                agent=agent,
-                emp_moments=emp_moments,
-            )
-    smm_contour = plt.contourf(CRRA_mesh, DiscFac_mesh, smm_obj_levels, level_count)
     t_end_contour = time()
     time_to_contour = t_end_contour - t_start_contour
 
@@ -793,14 +1775,8 @@ def do_make_contour_plot(agent, model_estimate, emp_moments, save_dir=None):
     minutes, seconds = divmod(time_to_contour, 60)
     print(f"Time to contour: {int(minutes)} min, {int(seconds)} sec.")
 
-    plt.colorbar(smm_contour)
-    plt.plot(model_estimate[1], model_estimate[0], "*r", ms=15)
-    plt.xlabel(r"coefficient of relative risk aversion $\rho$", fontsize=14)
-    plt.ylabel(r"discount factor adjustment $\beth$", fontsize=14)
-    plt.savefig(save_dir + agent.name + "SMMcontour.pdf")
-    plt.savefig(save_dir + agent.name + "SMMcontour.png")
-    plt.savefig(save_dir + agent.name + "SMMcontour.svg")
-    plt.show()
+    if len(grids) >= 2:
+        plot_param_sweep(agent.name, grids, values, model_estimate, save_dir)
 
 
 def estimate_msm(
@@ -812,6 +1788,8 @@ def estimate_msm(
     minimize_options=None,
     simulate_moments_kwargs=None,
     estimagic_options=None,
+    jacobian=None,
+    jacobian_kwargs=None,
 ):
     #TODO: WRITE DOCSTRING
     
@@ -820,6 +1798,10 @@ def estimate_msm(
     simulate_moments_kwargs = simulate_moments_kwargs or {}
     simulate_moments_kwargs.setdefault("agent", agent)
     simulate_moments_kwargs.setdefault("emp_moments", emp_moments)
+    simulate_moments_kwargs.setdefault("use_store", True)
+    simulate_moments, minimize_options, simulate_moments_kwargs = use_worker_pool(
+        agent, simulate_moments, minimize_options, simulate_moments_kwargs
+    )
 
     res = em.estimate_msm(
         simulate_moments,
@@ -828,6 +1810,8 @@ def estimate_msm(
         initial_params,
         optimize_options=minimize_options,
         simulate_moments_kwargs=simulate_moments_kwargs,
+        jacobian=jacobian,
+        jacobian_kwargs=jacobian_kwargs,
         **estimagic_options,
     )
 
@@ -852,6 +1836,9 @@ def estimate_min(
     criterion_kwargs = criterion_kwargs or {}
     criterion_kwargs.setdefault("agent", agent)
     criterion_kwargs.setdefault("emp_moments", emp_moments)
+    criterion, minimize_options, criterion_kwargs = use_worker_pool(
+        agent, criterion, minimize_options, criterion_kwargs
+    )
 
     res = em.minimize(
         criterion,
@@ -877,9 +1864,27 @@ def estimate(
     save_dir=None,
     emp_moments=None,
     moments_cov=None,
+    resume=True,
+    n_cores=None,
+    multi_fidelity=None,
 ):
     """Run the main estimation procedure for Life-Cycle-Prime-Time.
 
+    Progress is checkpointed in save_dir: every criterion evaluation, every
+    bootstrap replicate and every finished stage. With resume=True, a rerun of the
+    same specification skips finished stages and restarts the estimation from the
+    best point evaluated so far.
+
+    If n_cores is given, it replaces the core counts in minimize_options,
+    bootstrap_options, jacobian_options and sweep_options, so that the whole run
+    stays within that many cores (as when run by the replication scheduler).
+
+    With multi_fidelity=True (or None and fidelity_options["enabled"]), the model
+    is first estimated on the cheaper levels of fidelity_options["levels"], with
+    fewer agents and coarser grids, and the full calibration only refines the
+    optimum found on them. A run that resumes from its history starts directly on
+    the full calibration.
+
     Parameters
     ----------
     NEED TO MAKE CORRECT INPUTS
@@ -891,6 +1896,17 @@ def estimate(
     save_dir = Path(save_dir).resolve() if save_dir is not None else Path.cwd()
     save_dir.mkdir(parents=True, exist_ok=True)
 
+    # Keep every stage within the cores given to this run, if any
+    run_minimize_options = minimize_options
+    run_bootstrap_options = bootstrap_options
+    run_jacobian_options = jacobian_options
+    run_sweep_options = sweep_options
+    if n_cores is not None:
+        run_minimize_options = set_minimize_cores(minimize_options, n_cores)
+        run_bootstrap_options = {**bootstrap_options, "n_cores": n_cores}
+        run_jacobian_options = {**jacobian_options, "n_cores": n_cores}
+        run_sweep_options = {**sweep_options, "n_cores": n_cores}
+
     ############################################################
     # Make agent
     ############################################################
@@ -911,6 +1927,8 @@ def estimate(
         emp_moments, weight_sum = get_empirical_moments(agent_name)
 
         print("Calculated empirical moments.")
+    else:
+        _, weight_sum = get_empirical_moments(agent_name)
 
     weights = calculate_weights(emp_moments, weight_sum)
 
@@ -923,50 +1941,104 @@ def estimate(
 
         print("Calculated moments covariance matrix.")
 
+    ############################################################
+    # Load checkpoint
+    ############################################################
+
+    # Stages already finished for this exact specification can be skipped
+    checkpoint_file = save_dir / (agent_name + "_checkpoint.json")
+    spec = {
+        "params_to_estimate": list(params_to_estimate),
+        "estimate_method": estimate_method,
+        "calibration_hash": agent.calibration_hash,
+        "target_hash": hash_object({"emp_moments": emp_moments, "weights": weights}),
+    }
+
+    history_file = get_history_path(
+        save_dir, agent_name, spec["calibration_hash"], spec["target_hash"]
+    )
+    state = read_state(checkpoint_file) if resume else {}
+    if state.get("spec") != spec:
+        state = {"spec": spec, "finished": {}}
+    finished = state["finished"]
+
+    def mark_finished(stage, **info):
+        finished[stage] = info
+        write_state(checkpoint_file, state)
+
     ############################################################
     # Estimate model
     ############################################################
 
-    if estimate_model:
+    if estimate_model and "estimate" in finished:
+        model_estimate = finished["estimate"]["params"]
+        time_to_estimate = finished["estimate"]["time_to_estimate"]
+        print(f"Resuming {agent_name} from its finished estimate in {checkpoint_file}.")
+    elif estimate_model:
+        best_params = get_best_params(history_file, list(initial_guess)) if resume else None
+        if multi_fidelity is None:
+            multi_fidelity = fidelity_options["enabled"]
+        fidelity_levels = fidelity_options["levels"] if multi_fidelity else None
+        if best_params is not None:
+            initial_guess = best_params
+            print(f"Resuming {agent_name} from the best point in {history_file}.")
+            # The history only records evaluations of the full calibration
+            fidelity_levels = fidelity_levels[-1:] if multi_fidelity else None
+
         model_estimate, res, time_to_estimate = do_estimate_model(
             agent,
             initial_guess,
             estimate_method=estimate_method,
             emp_moments=emp_moments,
             moments_cov=moments_cov,
-            minimize_options=minimize_options,
+            minimize_options=run_minimize_options,
             criterion_kwargs={"weights": weights},
             save_dir=save_dir,
+            history_file=history_file,
+            jacobian_options=run_jacobian_options,
+            fidelity_levels=fidelity_levels,
+        )
+        model_estimate = {key: float(value) for key, value in model_estimate.items()}
+        mark_finished(
+            "estimate", params=model_estimate, time_to_estimate=time_to_estimate
         )
 
     # Compute standard errors by bootstrap
-    if compute_se_bootstrap:
+    if compute_se_bootstrap and "bootstrap" not in finished:
         do_compute_se_boostrap(
             agent,
             model_estimate,
             time_to_estimate,
+            emp_moments=emp_moments,
+            weights=weights,
             save_dir=save_dir,
-            **bootstrap_options,
+            **run_bootstrap_options,
         )
+        mark_finished("bootstrap")
 
     # Compute sensitivity measure
-    if compute_sensitivity:
+    if compute_sensitivity and "sensitivity" not in finished:
         do_compute_sensitivity(
             agent,
             model_estimate,
-            initial_guess,
+            emp_moments,
             save_dir=save_dir,
+            **run_jacobian_options,
         )
+        mark_finished("sensitivity")
 
     # Make a contour plot of the objective function
-    if make_contour_plot:
+    if make_contour_plot and "contour" not in finished:
         do_make_contour_plot(
             agent,
             model_estimate,
             emp_moments,
+            weights=weights,
             save_dir=save_dir,
+            **run_sweep_options,
         )
-        
+        mark_finished("contour")
+
 
 def prepare_model(agent_name, params_to_estimate):
     """
@@ -1011,7 +2083,8 @@ def prepare_model(agent_name, params_to_estimate):
     def temp_func(param_vec, return_moments=False, plot_moments=False):
         params = {params_to_estimate[j] : param_vec[j] for j in range(len(params_to_estimate))}
         emp_moments = empirical_moments.copy()
-        sim_moments = simulate_moments(params, estimation_agents, emp_moments)
+        # Only the moments are used, so points in the evaluation store are not solved
+        sim_moments = simulate_moments(params, estimation_agents, emp_moments, use_store=True)
         
         if plot_moments:
             wealth_keys = [key for key in sim_moments if not "_port" in key]
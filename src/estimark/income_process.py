@@ -6,10 +6,35 @@ shocks in retirement on top of the usual permanent-transitory shock structure.
 from HARK.Calibration.Income.IncomeProcesses import construct_lognormal_income_process_unemployment
 from HARK.distributions.utils import add_discrete_outcome
 from HARK.distributions import Lognormal, DiscreteDistribution, combine_indep_dstns, DiscreteDistributionLabeled
-from copy import deepcopy
+from copy import copy, deepcopy
 import numpy as np
 from scipy.stats import norm
 
+
+def share_distribution(dstn, seed):
+    """
+    Make a distribution that shares its atoms and probabilities with another one,
+    but has its own seed and random number generator. The shared arrays are made
+    read-only, so no period can change the distribution of another.
+
+    Parameters
+    ----------
+    dstn : DiscreteDistribution
+        Distribution whose atoms and probabilities are shared.
+    seed : int
+        Seed of the new distribution's random number generator.
+
+    Returns
+    -------
+    dstn_t : DiscreteDistribution
+        Shallow copy of dstn with the given seed.
+    """
+    dstn.atoms.flags.writeable = False
+    dstn.pmv.flags.writeable = False
+    dstn_t = copy(dstn)
+    dstn_t.seed = seed
+    return dstn_t
+
 def construct_lognormal_income_process_with_retirement_expense_shocks(
         T_cycle,
         PermShkStd,
@@ -119,12 +144,11 @@ def construct_lognormal_income_process_with_retirement_expense_shocks(
     for t in range(T_retire):
         IncShkDstn.append(IncShkDstnBase[t])
     
-    # Replace the income shock distribution in each year of retirement
+    # Replace the income shock distribution in each year of retirement, sharing its
+    # atoms and probabilities across years
     for t in range(T_retire, T_cycle):
         seed_t = RNG.integers(0, 2**31 - 1)
-        IncShkDstnRet_t = deepcopy(IncShkDstnRet)
-        IncShkDstnRet_t.seed = seed_t
-        IncShkDstn.append(IncShkDstnRet_t)
+        IncShkDstn.append(share_distribution(IncShkDstnRet, seed_t))
         
     return IncShkDstn
 
@@ -219,16 +243,28 @@ def construct_lognormal_income_process_with_mateos_expense_shocks(
     IncShkDstn = []
     for t in range(T_retire):
         IncShkDstn.append(IncShkDstnBase[t])
-        
-    # Add the "net income" distributions when retired
+
+    # Make the "net income" distribution of each age bracket once, for all years
+    # of retirement at the same time: no permanent shock, and a transitory shock of
+    # one minus the expense shock
+    TranShkRet = 1 - np.array(exp_shks_retired[: T_cycle - T_retire])
+    TranShkBrackets, bracket_of_year = np.unique(TranShkRet, axis=0, return_inverse=True)
+    IncShkDstnBrackets = []
+    for TranShk in TranShkBrackets:
+        atoms = np.vstack([np.ones(TranShk.size), TranShk])
+        pmv = 1.0 * equiprobable_one_seventh
+        IncShkDstnBrackets.append(
+            DiscreteDistributionLabeled(pmv=pmv, atoms=atoms,
+                                        limit={"infimum": np.min(atoms, axis=-1),
+                                               "supremum": np.max(atoms, axis=-1)},
+                                        name="Retired income shock distribution",
+                                        var_names=["PermShk","TranShk"])
+        )
+
+    # Add the "net income" distributions when retired, sharing each bracket's arrays
     for t in range(T_retire, T_cycle):
         seed_t = RNG.integers(0, 2**31 - 1)
-        s = t - T_retire
-        PermShkDstn_t = DiscreteDistribution(pmv=np.array([1.0]), atoms=np.array([1.0]))
-        TranShkDstn_t = DiscreteDistribution(pmv=equiprobable_one_seventh, atoms=1-exp_shks_retired[s])
-        IncShkDstn_t = DiscreteDistributionLabeled.from_unlabeled(combine_indep_dstns(PermShkDstn_t, TranShkDstn_t, seed=seed_t),
-                                                                   name="Retired income shock distribution",
-                                                                   var_names=["PermShk","TranShk"])
+        IncShkDstn_t = share_distribution(IncShkDstnBrackets[bracket_of_year[t - T_retire]], seed_t)
         IncShkDstn.append(IncShkDstn_t)
         
     return IncShkDstn
@@ -0,0 +1,36 @@
+"""Deferred imports for the Life-Cycle-Prime-Time estimation.
+Heavy dependencies (estimagic, HARK, matplotlib, statsmodels, pandas) are only
+imported the first time one of their attributes is used, so that importing
+estimark, or starting a worker process that only needs a few of them, is fast.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+    Return a module that is imported the first time one of its attributes is
+    accessed. If the module has already been imported, it is returned as is.
+
+    Parameters
+    ----------
+    name : str
+        Full name of the module, such as "matplotlib.pyplot".
+
+    Returns
+    -------
+    module : ModuleType
+        The (possibly not yet executed) module.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
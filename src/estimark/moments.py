@@ -0,0 +1,544 @@
+"""Vectorized machinery for the weighted, age-group-conditional moments used in the
+Life-Cycle-Prime-Time estimation. Data are sorted once by (group, value) so that
+weighted quantiles for every group come out of a single pass over cumulative
+weights, following the same (SAS) definition as statsmodels' DescrStatsW.
+"""
+
+from __future__ import annotations
+
+import weakref
+
+import numpy as np
+
+from estimark.lazy import lazy_import
+
+pd = lazy_import("pandas")
+sparse = lazy_import("scipy.sparse")
+
+
+def get_group_codes(data_groups, mapping):
+    """
+    Translate group labels into integer codes, numbered in the order of mapping.
+    Labels that do not appear in mapping get the code -1.
+
+    Parameters
+    ----------
+    data_groups : pd.Series or np.array
+        Group label of each observation.
+    mapping : iterable
+        List or dictionary of the group labels to use.
+
+    Returns
+    -------
+    codes : np.array
+        Integer group code of each observation.
+    """
+    return pd.Index(list(mapping)).get_indexer(np.asarray(data_groups))
+
+
+class GroupIndex:
+    """
+    Observations sorted by (group, value), with cumulative weights and the start
+    and end of each group, from which weighted quantiles of every group can be
+    read in one vectorized step.
+
+    Parameters
+    ----------
+    values : np.array
+        Value of the variable for each observation.
+    codes : np.array
+        Integer group code of each observation (see get_group_codes). Observations
+        with negative codes are dropped.
+    n_groups : int
+        Number of groups.
+    weights : np.array or None
+        Weight of each observation; all observations count equally if None.
+    """
+
+    def __init__(self, values, codes, n_groups, weights=None):
+        values = np.asarray(values, dtype=float)
+        codes = np.asarray(codes)
+        weights = np.ones_like(values) if weights is None else np.asarray(weights, dtype=float)
+
+        keep = codes >= 0
+        order = np.lexsort((values[keep], codes[keep]))
+        self.rows = np.flatnonzero(keep)[order]  # original position of each observation
+        self.n_obs = values.size
+        self.values = values[keep][order]
+        self.codes = codes[keep][order]
+        self.weights = weights[keep][order]
+        self.n_groups = n_groups
+
+        group_ids = np.arange(n_groups)
+        self.starts = np.searchsorted(self.codes, group_ids, side="left")
+        self.ends = np.searchsorted(self.codes, group_ids, side="right")
+        self.cum_weights = np.cumsum(self.weights)
+
+    # Arrays that make up an index, as saved to and loaded from disk
+    array_names = ("rows", "values", "codes", "weights", "cum_weights", "starts", "ends")
+
+    def to_arrays(self):
+        """Get the arrays of the index, keyed by name."""
+        return {name: getattr(self, name) for name in self.array_names}
+
+    @classmethod
+    def from_arrays(cls, arrays, n_obs):
+        """
+        Rebuild an index from the arrays made by to_arrays, which can be memory-mapped
+        files, without sorting the data again.
+
+        Parameters
+        ----------
+        arrays : dict
+            Arrays of the index, keyed by name.
+        n_obs : int
+            Number of observations in the dataset the index was made from.
+
+        Returns
+        -------
+        index : GroupIndex
+            The rebuilt index.
+        """
+        index = cls.__new__(cls)
+        for name in cls.array_names:
+            setattr(index, name, arrays[name])
+        index.n_obs = n_obs
+        index.n_groups = len(index.starts)
+        return index
+
+    @property
+    def counts(self):
+        """Number of observations in each group."""
+        return self.ends - self.starts
+
+    @property
+    def weight_sums(self):
+        """Total weight of each group."""
+        return group_sums(self.cum_weights, self.starts, self.ends)
+
+    def quantiles(self, probs):
+        """
+        Weighted quantiles of every group. For a probability p and a group with
+        total weight W, the quantile is the first value whose cumulative weight
+        reaches pW, or the average of that value and the next one if pW falls
+        exactly on a cumulative weight (up to rounding).
+
+        Parameters
+        ----------
+        probs : float or np.array
+            Probability point(s) at which to evaluate the quantiles.
+
+        Returns
+        -------
+        quantiles : np.array
+            Array of shape (n_groups, len(probs)); rows of empty groups are NaN.
+        """
+        return weighted_group_quantiles(
+            self.values,
+            self.cum_weights,
+            self.starts,
+            self.ends,
+            probs,
+        )
+
+    def medians(self):
+        """Weighted median of every group, NaN for empty groups."""
+        return self.quantiles(0.5)[:, 0]
+
+
+def group_sums(cum_weights, starts, ends):
+    """
+    Total weight of each contiguous group, given cumulative weights along the last
+    axis and the start and (exclusive) end of each group.
+    """
+    base = np.where(starts > 0, cum_weights[..., np.maximum(starts - 1, 0)], 0)
+    top = np.where(ends > 0, cum_weights[..., np.maximum(ends - 1, 0)], 0)
+    return np.where(ends > starts, top - base, 0)
+
+
+def weighted_group_quantiles(values, cum_weights, starts, ends, probs):
+    """
+    Weighted quantiles of contiguous groups of sorted values. All groups and
+    probability points are handled in one search over the cumulative weights.
+
+    Parameters
+    ----------
+    values : np.array
+        Values sorted by (group, value).
+    cum_weights : np.array
+        Cumulative sum of the weights of the sorted values.
+    starts : np.array
+        Index of the first observation of each group.
+    ends : np.array
+        Index one past the last observation of each group.
+    probs : float or np.array
+        Probability point(s) at which to evaluate the quantiles.
+
+    Returns
+    -------
+    quantiles : np.array
+        Array of shape (n_groups, len(probs)); groups without weight are NaN.
+    """
+    probs = np.atleast_1d(np.asarray(probs, dtype=float))
+    totals = group_sums(cum_weights, starts, ends)
+    if values.size == 0:
+        return np.full((starts.size, probs.size), np.nan)
+
+    # Cumulative weight targets of each group, in terms of the overall cumulative sum
+    base = np.where(starts > 0, cum_weights[np.maximum(starts - 1, 0)], 0.0)
+    targets = base[:, None] + probs[None, :] * totals[:, None]
+
+    # First observation of the group whose cumulative weight reaches each target
+    last = np.minimum(np.maximum(ends - 1, starts), values.size - 1)[:, None]
+    idx = np.searchsorted(cum_weights, targets, side="left")
+    idx = np.clip(idx, starts[:, None], last)
+    quantiles = values[idx]
+
+    # Targets that fall exactly on a cumulative weight average with the next value
+    exact = np.isclose(cum_weights[idx], targets, rtol=1e-12, atol=1e-10) & (idx < last)
+    quantiles = np.where(exact, 0.5 * (quantiles + values[np.minimum(idx + 1, last)]), quantiles)
+
+    return np.where(totals[:, None] > 0.0, quantiles, np.nan)
+
+
+def draw_bootstrap_counts(n_obs, n_draws, rng, chunk_size=100):
+    """
+    Draw bootstrap replicates of a dataset as a sparse matrix of resampling counts:
+    entry (b, i) is the number of times observation i appears in replicate b. The
+    draws are the same as estimagic's get_bootstrap_indices for the same generator.
+
+    Parameters
+    ----------
+    n_obs : int
+        Number of observations in the dataset.
+    n_draws : int
+        Number of bootstrap replicates.
+    rng : np.random.Generator
+        Random number generator for the resampling.
+    chunk_size : int
+        Number of replicates drawn at a time, which bounds the memory used.
+
+    Returns
+    -------
+    counts : sparse.csr_matrix
+        Matrix of shape (n_draws, n_obs) with integer resampling counts.
+    """
+    blocks = []
+    for start in range(0, n_draws, chunk_size):
+        size = min(chunk_size, n_draws - start)
+        indices = rng.integers(0, n_obs, size=(size, n_obs))
+        rows = np.repeat(np.arange(size), n_obs)
+        blocks.append(
+            sparse.csr_matrix(
+                (np.ones(rows.size, dtype=np.int32), (rows, indices.ravel())),
+                shape=(size, n_obs),
+            ),
+        )
+    return sparse.vstack(blocks, format="csr")
+
+
+def bootstrap_group_quantiles(index, counts, probs=0.5, chunk_size=100):
+    """
+    Weighted quantiles of every group in every bootstrap replicate. A replicate that
+    includes observation i c times is the same as the original data with weight
+    c * w_i, so each block of replicates is handled as one matrix of cumulative
+    weights, searched for all groups and probability points at once.
+
+    Parameters
+    ----------
+    index : GroupIndex
+        Sorted index of the original dataset.
+    counts : sparse.csr_matrix
+        Resampling counts of shape (n_draws, n_obs), as from draw_bootstrap_counts.
+    probs : float or np.array
+        Probability point(s) at which to evaluate the quantiles.
+    chunk_size : int
+        Number of replicates handled at a time, which bounds the memory used.
+
+    Returns
+    -------
+    quantiles : np.array
+        Array of shape (n_draws, n_groups, len(probs)); groups that are empty in a
+        replicate are NaN.
+    """
+    probs = np.atleast_1d(np.asarray(probs, dtype=float))
+    counts = sparse.csr_matrix(counts)[:, index.rows]
+    n_draws, n_sorted = counts.shape
+    starts, ends = index.starts, index.ends
+    last = np.minimum(np.maximum(ends - 1, starts), max(n_sorted - 1, 0))
+    group_of = np.repeat(np.arange(index.n_groups), ends - starts)
+    positions = np.arange(n_sorted)
+
+    quantiles = np.full((n_draws, index.n_groups, probs.size), np.nan)
+    if n_sorted == 0:
+        return quantiles
+
+    for start in range(0, n_draws, chunk_size):
+        block = counts[start : start + chunk_size].toarray()
+        rows = np.arange(block.shape[0])[:, None]
+        cum_weights = np.cumsum(block * index.weights, axis=1)
+        totals = group_sums(cum_weights, starts, ends)
+        base = np.where(starts > 0, cum_weights[:, np.maximum(starts - 1, 0)], 0.0)
+
+        # Next resampled observation after each position, as the averaging partner
+        # for exact hits (observations that were not drawn are not in the replicate)
+        drawn = np.where(block > 0, positions, n_sorted)
+        next_drawn = np.minimum.accumulate(drawn[:, ::-1], axis=1)[:, ::-1]
+        next_drawn = np.concatenate(
+            [next_drawn[:, 1:], np.full((block.shape[0], 1), n_sorted)],
+            axis=1,
+        )
+
+        for k, prob in enumerate(probs):
+            targets = base + prob * totals
+            # Count observations of each group whose cumulative weight is below target
+            below = np.cumsum(cum_weights < targets[:, group_of], axis=1)
+            idx = np.minimum(starts + group_sums(below, starts, ends), last)
+            values = index.values[idx]
+
+            partner = next_drawn[rows, idx]
+            exact = np.isclose(
+                cum_weights[rows, idx], targets, rtol=1e-12, atol=1e-10
+            ) & (partner <= last)
+            partner_values = index.values[np.minimum(partner, n_sorted - 1)]
+            values = np.where(exact, 0.5 * (values + partner_values), values)
+            quantiles[start : start + block.shape[0], :, k] = np.where(
+                totals > 0.0, values, np.nan
+            )
+
+    return quantiles
+
+
+def get_bootstrap_moments(
+    data,
+    variable,
+    weights=None,
+    groups=None,
+    mapping=None,
+    n_draws=1000,
+    rng=None,
+    counts=None,
+):
+    """
+    Bootstrap the group medians of a dataset in one batch, returning the medians of
+    every replicate and their covariance matrix. Moments are named by the keys of
+    mapping that have data in the original sample, as in get_weighted_moments.
+
+    Parameters
+    ----------
+    data : pd.DataFrame or ColumnarTable
+        The dataset from which the moments are being extracted.
+    variable : str
+        Name of the variable for which conditional medians will be calculated.
+    weights : str or None
+        Name of the weighting variable in the dataset, if any.
+    groups : str
+        Name of the variable to condition the medians on.
+    mapping : iterable
+        List or dictionary of values that the variable named in groups can have.
+    n_draws : int
+        Number of bootstrap replicates, ignored if counts is passed.
+    rng : np.random.Generator or None
+        Random number generator for the resampling, ignored if counts is passed.
+    counts : sparse.csr_matrix or None
+        Resampling counts to use instead of drawing new ones.
+
+    Returns
+    -------
+    replicate_moments : pd.DataFrame
+        Medians of each replicate (rows) for each moment (columns).
+    moments_cov : pd.DataFrame
+        Covariance matrix of the moments across replicates.
+    """
+    index = get_group_index(data, variable, weights=weights, groups=groups, mapping=mapping)
+    if counts is None:
+        rng = np.random.default_rng() if rng is None else rng
+        counts = draw_bootstrap_counts(index.n_obs, n_draws, rng)
+
+    medians = bootstrap_group_quantiles(index, counts, 0.5)[:, :, 0]
+    labels = list(mapping)
+    keep = np.flatnonzero(index.counts > 0)
+    replicate_moments = pd.DataFrame(medians[:, keep], columns=[labels[j] for j in keep])
+    moments_cov = replicate_moments.cov()
+    return replicate_moments, moments_cov
+
+
+# Group indices already built for a dataset, dropped when the dataset is deleted
+_group_index_memo = {}
+
+
+def get_group_index(data, variable, weights=None, groups=None, mapping=None):
+    """
+    Make (or reuse) the GroupIndex for one variable of a dataset. Indices are
+    remembered for as long as the dataset object exists, so repeated calls on
+    the same frame sort it only once; datasets must not be modified in place.
+    Tables from estimark.data come with the indices they were built with.
+
+    Parameters
+    ----------
+    data : pd.DataFrame or ColumnarTable
+        The dataset from which the moments are being extracted.
+    variable : str
+        Name of the variable for which conditional quantiles will be calculated.
+    weights : str or None
+        Name of the weighting variable in the dataset, if any.
+    groups : str
+        Name of the variable to condition the quantiles on.
+    mapping : iterable
+        List or dictionary of values that the variable named in groups can have.
+
+    Returns
+    -------
+    index : GroupIndex
+        Sorted index of the data, with groups numbered in the order of mapping.
+    """
+    # Columnar tables carry the indices that were made when they were built
+    if hasattr(data, "get_group_index"):
+        index = data.get_group_index(variable, weights=weights, groups=groups, mapping=mapping)
+        if index is not None:
+            return index
+
+    labels = tuple(mapping)
+    memo_key = (id(data), variable, weights, groups, labels)
+    entry = _group_index_memo.get(memo_key)
+    if entry is not None and entry[0]() is data:
+        return entry[1]
+
+    index = GroupIndex(
+        np.asarray(data[variable]),
+        get_group_codes(data[groups], labels),
+        len(labels),
+        weights=np.asarray(data[weights]) if weights else None,
+    )
+    ref = weakref.ref(data, lambda _: _group_index_memo.pop(memo_key, None))
+    _group_index_memo[memo_key] = (ref, index)
+    return index
+
+
+class MedianBuffer:
+    """
+    Exact, mergeable median of a stream of values, held in memory that grows only
+    with the square root of the number of values. The buffer keeps every distinct
+    value (with its count) in a window of ranks around the median, and only counts
+    the values below and above the window. After each batch, the window is narrowed
+    to z standard deviations of the median's rank around the median, so values
+    that arrive in exchangeable batches (such as chunks of ex ante identical simulated
+    agents) are overwhelmingly unlikely to move the median out of it. If they do,
+    median raises a ValueError rather than return a wrong value.
+
+    Parameters
+    ----------
+    z : float
+        Half-width of the window, in standard deviations of the median's rank.
+    """
+
+    def __init__(self, z=8.0):
+        self.z = z
+        self.lo = -np.inf  # values in [lo, hi] are kept, others only counted
+        self.hi = np.inf
+        self.n_below = 0
+        self.n_above = 0
+        self.n_nan = 0
+        self.values = np.empty(0)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return self.n_below + self.n_above + int(self.counts.sum())
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.counts.nbytes
+
+    def insert(self, values, counts):
+        """
+        Merge values with the given counts into the buffer, which must all lie in
+        the window.
+        """
+        values, inverse = np.unique(np.concatenate([self.values, values]), return_inverse=True)
+        counts = np.concatenate([self.counts, counts])
+        self.values = values
+        self.counts = np.bincount(inverse, weights=counts, minlength=values.size).astype(np.int64)
+
+    def add(self, values):
+        """
+        Add a batch of values to the stream.
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        nan = np.isnan(values)
+        self.n_nan += int(np.count_nonzero(nan))
+        values = values[~nan]
+        below = values < self.lo
+        above = values > self.hi
+        self.n_below += int(np.count_nonzero(below))
+        self.n_above += int(np.count_nonzero(above))
+        inside, counts = np.unique(values[~(below | above)], return_counts=True)
+        self.insert(inside, counts)
+        self.shrink()
+
+    def merge(self, other):
+        """
+        Add the values of another buffer, e.g. one filled by another process. The
+        window of the merged buffer is the intersection of the two windows.
+        """
+        self.clip(max(self.lo, other.lo), min(self.hi, other.hi))
+        below = other.values < self.lo
+        above = other.values > self.hi
+        inside = ~(below | above)
+        self.n_below += other.n_below + int(other.counts[below].sum())
+        self.n_above += other.n_above + int(other.counts[above].sum())
+        self.n_nan += other.n_nan
+        self.insert(other.values[inside], other.counts[inside])
+        self.shrink()
+
+    def clip(self, lo, hi):
+        """
+        Narrow the window to [lo, hi], counting the values that fall out of it.
+        """
+        i_lo = np.searchsorted(self.values, lo, side="left")
+        i_hi = np.searchsorted(self.values, hi, side="right")
+        self.n_below += int(self.counts[:i_lo].sum())
+        self.n_above += int(self.counts[i_hi:].sum())
+        self.values = self.values[i_lo:i_hi]
+        self.counts = self.counts[i_lo:i_hi]
+        self.lo = lo
+        self.hi = hi
+
+    def get_middle_ranks(self):
+        n = len(self)
+        return (n - 1) // 2, n // 2
+
+    def shrink(self):
+        """
+        Narrow the window to z standard deviations of the median's rank (sqrt(n) / 2)
+        on either side of the middle ranks.
+        """
+        if self.values.size == 0:
+            return
+        n = len(self)
+        width = int(np.ceil(self.z * np.sqrt(n) / 2.0))
+        r_lo, r_hi = self.get_middle_ranks()
+        cum_counts = np.cumsum(self.counts)
+        i_lo = np.searchsorted(cum_counts, r_lo - width - self.n_below, side="right")
+        i_hi = np.searchsorted(cum_counts, r_hi + width - self.n_below, side="right")
+        i_lo = min(i_lo, self.values.size - 1)
+        i_hi = min(i_hi, self.values.size - 1)
+        lo = self.values[i_lo] if i_lo > 0 else self.lo
+        hi = self.values[i_hi] if i_hi < self.values.size - 1 else self.hi
+        self.clip(lo, hi)
+
+    def median(self):
+        """
+        Median of all the values added, defined as np.median: NaN if any value was
+        NaN, and the mean of the two middle values if their number is even.
+        """
+        if self.n_nan > 0 or len(self) == 0:
+            return np.nan
+        cum_counts = np.cumsum(self.counts)
+        middle = []
+        for rank in self.get_middle_ranks():
+            k = rank - self.n_below
+            if k < 0 or k >= cum_counts[-1]:
+                msg = "The median has left the window of the buffer."
+                raise ValueError(msg)
+            middle.append(self.values[np.searchsorted(cum_counts, k, side="right")])
+        return np.mean(middle)
@@ -3,15 +3,18 @@ model.  The empirical data is stored in a separate csv file and is loaded in set
 """
 from __future__ import annotations
 
+import functools
+import hashlib
+import importlib.metadata
+import importlib.util
+import os
+import pickle
 import warnings
+from pathlib import Path
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import numpy as np
-from HARK.Calibration.Income.IncomeTools import Cagetti_income, CGM_income, parse_income_spec
-from HARK.Calibration.life_tables.us_ssa.SSATools import parse_ssa_life_table
-from HARK.distributions import DiscreteDistribution
-from .income_process import construct_lognormal_income_process_with_retirement_expense_shocks, construct_lognormal_income_process_with_mateos_expense_shocks
 
 # ---------------------------------------------------------------------------------
 # - Define all of the model parameters for Life-Cycle-Prime-Time and ConsumerExamples -
@@ -65,6 +68,7 @@ num_agents = 10000  # Number of agents to simulate
 # Bootstrap options
 bootstrap_size = 50  # Number of re-estimations to do during bootstrap
 seed = 1132023  # Just an integer to seed the estimation
+bootstrap_cores = 12  # Number of processes to spread bootstrap replicates over
 
 params_to_estimate = ["CRRA"]
 
@@ -98,18 +102,6 @@ bounds_BeqInt = [0.0, 10.0]  # Bounds for the pseudo intercept of the bequest mo
 terminal_t = final_age - initial_age
 retirement_t = retirement_age - initial_age - 1
 
-# Income
-income_spec = Cagetti_income[education]
-# Replace retirement age
-income_spec["age_ret"] = retirement_age
-inc_calib = parse_income_spec(
-    age_min=initial_age,
-    age_max=final_age,
-    **income_spec,
-    SabelhausSong=ss_variances,
-)
-inc_calib["PermGroFac"][retirement_age - initial_age] = 0.85
-
 # Age groups for the estimation: calculate average wealth-to-permanent income ratio
 # for consumers within each of these age groups, compare actual to simulated data
 
@@ -122,9 +114,10 @@ age_groups = [
 age_labels = [f"({group[0]-1},{group[-1]}]" for group in age_groups]
 
 # Generate mappings between the real ages in the groups and the indices of simulated data
-age_mapping = dict(zip(age_labels, map(np.array, age_groups)))
+age_mapping = dict(zip(age_labels, map(np.array, age_groups), strict=True))
 sim_mapping = {
-    label: np.array(group) - initial_age for label, group in zip(age_labels, age_groups)
+    label: np.array(group) - initial_age
+    for label, group in zip(age_labels, age_groups, strict=True)
 }
 
 remove_ages_from_scf = np.arange(
@@ -163,23 +156,10 @@ init_params_options = {
     },
 }
 
-# Survival probabilities over the lifecycle
-liv_prb = parse_ssa_life_table(
-    female=False,
-    min_age=initial_age,
-    max_age=final_age - 1,
-    cohort=1960,
-)
-
-aNrmInit = DiscreteDistribution(
-    prob_w_to_y,
-    init_w_to_y,
-    seed=seed,
-).draw(N=num_agents)
-
 bootstrap_options = {
     "bootstrap_size": bootstrap_size,
     "seed": seed,
+    "n_cores": bootstrap_cores,
 }
 
 minimize_options = {
@@ -196,61 +176,270 @@ minimize_options = {
     "numdiff_options": {"n_cores": 12},
 }
 
+# Options for the batch evaluator of the optimizer: with more than one core in
+# minimize_options, batches are spread over worker processes that each build their
+# agent once and keep it, so only parameter vectors are sent to them; in every
+# process, points are solved in stacked groups of solver_options["batch_size"]
+worker_pool_options = {
+    "enabled": True,  # Use the warm pool instead of estimagic's batch evaluators
+    "idle_timeout": 600.0,  # Seconds after which idle workers shut down
+}
+
+# Options for multi-fidelity estimation: the optimizer runs through the levels in
+# order, each starting from the optimum of the one before, and moves on to the next
+# level once its trust region has shrunk below convergence.min_trust_region_radius.
+# Each level's calibration replaces values of init_calibration; the last level must
+# be the full calibration. Its algo_options are merged into minimize_options.
+fidelity_options = {
+    "enabled": False,  # Whether estimate() uses the schedule by default
+    "levels": [
+        {
+            "calibration": {
+                "AgentCount": 1000,
+                "aXtraCount": 10,
+                "PermShkCount": 3,
+                "TranShkCount": 3,
+                "ExpShkCount": 7,
+                "ChiFromOmega_N": 101,
+            },
+            "multistart": True,  # Screen start points on the cheapest level only
+            "algo_options": {
+                "convergence.min_trust_region_radius": 0.05,
+                "stopping.max_criterion_evaluations": 100,
+            },
+        },
+        {
+            "calibration": {
+                "AgentCount": 3000,
+                "aXtraCount": 15,
+                "PermShkCount": 5,
+                "TranShkCount": 5,
+                "ExpShkCount": 13,
+                "ChiFromOmega_N": 251,
+            },
+            "multistart": False,
+            "algo_options": {
+                "radius_options": {"initial_radius": 0.05},
+                "convergence.min_trust_region_radius": 0.005,
+                "stopping.max_criterion_evaluations": 60,
+            },
+        },
+        {
+            "calibration": {},
+            "multistart": False,
+            "algo_options": {"radius_options": {"initial_radius": 0.005}},
+        },
+    ],
+}
+
+# Options for the parameter sweep behind the contour plot of the criterion
+sweep_options = {
+    "grid_density": 20,  # Number of parameter values in each dimension
+    "width": 0.25,  # Half-width of each grid as a fraction of the parameter's bounds
+    "n_cores": 12,  # Number of processes to spread grid points over
+}
+
+# Options for the finite-difference Jacobian of the simulated moments
+jacobian_options = {
+    "step": 0.01,  # Size of the perturbation of each parameter
+    "n_cores": 12,  # Number of processes to spread the perturbed simulations over
+}
+
+# Options for the in-process cache of solved agents used by simulate_moments
+solution_cache_options = {
+    "max_mb": 512.0,  # Memory budget for cached solutions, in megabytes
+    "digits": 10,  # Decimal places that parameters are rounded to for cache keys
+}
+
+# Options for simulating agents in simulate_moments
+simulation_options = {
+    "fast": True,  # Use estimark.simulation instead of HARK's simulate when possible
+    "streaming": False,  # Simulate in chunks and keep only the moments, for huge AgentCount
+    "chunk_size": 10000,  # Largest number of agents simulated at once when streaming
+    "histogram": False,  # Iterate the distribution on a histogram instead of simulating
+    "histogram_max": 1000.0,  # Highest gridpoint of the wealth histogram
+    "histogram_count": 600,  # Number of gridpoints of the wealth histogram
+    "share_count": 201,  # Number of gridpoints of the risky share histogram
+}
+
+# Options for skipping constructors whose inputs have not changed since a recent build
+constructor_options = {
+    "elide": True,  # Restore the objects of earlier builds instead of constructing them again
+    "memo_size": 2,  # Builds remembered per constructed object, e.g. subjective and true beliefs
+}
+
+# Options for solving IndShkLifeCycleConsumerType
+solver_options = {
+    "backend": "hark",  # "hark" for HARK's solver, or "egm" for the array kernel in estimark.egm
+    "jit": False,  # Compile the EGM kernel with numba, if it is installed
+    "batch_size": 8,  # Parameter vectors solved together in one stacked backward induction
+}
+
+# Options for the scheduler that runs many specifications in run_all*.py
+scheduler_options = {
+    "n_cores": None,  # Total number of cores to split between specifications; all if None
+    "blas_threads": 1,  # Number of BLAS threads allowed in each process
+}
+
+# Directory for files that estimark builds and reuses across runs
+cache_dir = Path(__file__).resolve().parent / ".." / "cache"
+
+# Directory of the memory-mapped columnar copies of the SCF and S&P data
+data_cache_dir = cache_dir / "data"
+
+# Options for the on-disk store of simulated moments shared across runs
+evaluation_store_options = {
+    # ESTIMARK_EVALUATION_STORE points every process, workers included, at another file
+    "path": Path(os.environ.get("ESTIMARK_EVALUATION_STORE", cache_dir / "evaluations.sqlite")),
+    "digits": 10,  # Decimal places that parameters are rounded to for store keys
+    "enabled": True,  # Whether to look up and record evaluations at all
+}
+
 # -----------------------------------------------------------------------------
 # -- Set up the dictionary "container" for making a basic lifecycle type ------
 # -----------------------------------------------------------------------------
 
-retired_PermShkStd = 0.0
-#retired_TranShkStd = 0.0
-#retired_PermShkStd = inc_calib["PermShkStd"][retirement_t]
-retired_TranShkStd = inc_calib["TranShkStd"][retirement_t]
-
-# Dictionary that can be passed to ConsumerType to instantiate
-init_calibration = {
-    "CRRA": init_CRRA,
-    "DiscFac": init_DiscFac,
-    "Rfree": terminal_t*[Rfree],
-    "RiskyAvg": Rfree + Eq_prem,
-    "RiskyStd": RiskyStd,
-    "PermGroFac": inc_calib["PermGroFac"],
-    "PermGroFacAgg": 1.0,
-    "BoroCnstArt": BoroCnstArt,
-    "PermShkStd": inc_calib["PermShkStd"][: retirement_t + 1]
-    + [retired_PermShkStd] * (terminal_t - retirement_t - 1),
-    "PermShkCount": PermShkCount,
-    "TranShkStd": inc_calib["TranShkStd"][: retirement_t + 1]
-    + [retired_TranShkStd] * (terminal_t - retirement_t - 1),
-    "TranShkCount": TranShkCount,
-    "T_cycle": terminal_t,
-    "T_sim": terminal_t+1,
-    "UnempPrb": UnempPrb,
-    "ExpShkProb": ExpShkProb,
-    "ExpShkMean": ExpShkMean,
-    "ExpShkStd": ExpShkStd,
-    "ExpShkCount": ExpShkCount,
-    "T_retire": 0*retirement_t,
-    "T_age": terminal_t+1,
-    "IncUnemp": IncUnemp,
-    "aXtraMin": aXtraMin,
-    "aXtraMax": aXtraMax,
-    "aXtraCount": aXtraCount,
-    "aXtraNestFac": exp_nest,
-    "LivPrb": liv_prb,
-    "AgentCount": num_agents,
-    "seed": seed,
-    "tax_rate": 0.0,
-    "vFuncBool": vFuncBool,
-    "CubicBool": CubicBool,
-    "aNrmInit": aNrmInit,
-    "neutral_measure": True,  # Harmemberg
-    "sim_common_Rrisky": False,  # idiosyncratic risky return
-    "WealthShift": init_WealthShift,
-    "BeqMPC" : init_BeqMPC,
-    "BeqInt" : init_BeqInt,
-    "ChiFromOmega_N": 501,  # Number of gridpoints in chi-from-omega function
-    "ChiFromOmega_bound": 15,  # Highest gridpoint to use for it
-    #"constructors" : {"IncShkDstn" : construct_lognormal_income_process_with_retirement_expense_shocks},
-}
+def build_calibration_inputs():
+    """
+    Build the parts of the calibration that need HARK's calibration tools: the
+    Cagetti income profile, the SSA survival probabilities, and the draws of the
+    initial wealth-to-income ratio.
+
+    Returns
+    -------
+    inputs : dict
+        Dictionary with inc_calib, liv_prb and aNrmInit.
+    """
+    # HARK is only imported when the calibration has to be built
+    IncomeTools = importlib.import_module("HARK.Calibration.Income.IncomeTools")
+    SSATools = importlib.import_module("HARK.Calibration.life_tables.us_ssa.SSATools")
+    distributions = importlib.import_module("HARK.distributions")
+
+    # Income, with the retirement age replaced
+    income_spec = {**IncomeTools.Cagetti_income[education], "age_ret": retirement_age}
+    inc_calib = IncomeTools.parse_income_spec(
+        age_min=initial_age,
+        age_max=final_age,
+        **income_spec,
+        SabelhausSong=ss_variances,
+    )
+    inc_calib["PermGroFac"][retirement_age - initial_age] = 0.85
+
+    # Survival probabilities over the lifecycle
+    liv_prb = SSATools.parse_ssa_life_table(
+        female=False,
+        min_age=initial_age,
+        max_age=final_age - 1,
+        cohort=1960,
+    )
+
+    aNrmInit = distributions.DiscreteDistribution(
+        prob_w_to_y,
+        init_w_to_y,
+        seed=seed,
+    ).draw(N=num_agents)
+
+    return {"inc_calib": inc_calib, "liv_prb": liv_prb, "aNrmInit": aNrmInit}
+
+
+def get_calibration_key():
+    """
+    Hash everything that the built calibration depends on: this file (which holds
+    all the parameter values), the SSA life tables shipped with HARK, and the
+    installed HARK version.
+    """
+    digest = hashlib.sha1(Path(__file__).read_bytes())
+    life_tables = Path(importlib.util.find_spec("HARK").origin).parent.joinpath(
+        "Calibration", "life_tables", "us_ssa"
+    )
+    for path in sorted(life_tables.glob("*.csv")):
+        digest.update(path.read_bytes())
+    digest.update(importlib.metadata.version("econ-ark").encode())
+    return digest.hexdigest()
+
+
+@functools.cache
+def get_calibration_inputs():
+    """
+    Get the built parts of the calibration, loading them from the cache directory
+    if they were built before with the same parameters and data, and building and
+    saving them otherwise.
+    """
+    path = cache_dir / f"calibration-{get_calibration_key()}.pkl"
+    if path.exists():
+        with path.open("rb") as f:
+            return pickle.load(f)
+
+    inputs = build_calibration_inputs()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with temp_path.open("wb") as f:
+        pickle.dump(inputs, f)
+    temp_path.replace(path)
+    return inputs
+
+
+@functools.cache
+def get_init_calibration():
+    """
+    Make the dictionary that can be passed to ConsumerType to instantiate it.
+    """
+    inputs = get_calibration_inputs()
+    inc_calib = inputs["inc_calib"]
+
+    retired_PermShkStd = 0.0
+    #retired_TranShkStd = 0.0
+    #retired_PermShkStd = inc_calib["PermShkStd"][retirement_t]
+    retired_TranShkStd = inc_calib["TranShkStd"][retirement_t]
+
+    # Dictionary that can be passed to ConsumerType to instantiate
+    return {
+        "CRRA": init_CRRA,
+        "DiscFac": init_DiscFac,
+        "Rfree": terminal_t*[Rfree],
+        "RiskyAvg": Rfree + Eq_prem,
+        "RiskyStd": RiskyStd,
+        "PermGroFac": inc_calib["PermGroFac"],
+        "PermGroFacAgg": 1.0,
+        "BoroCnstArt": BoroCnstArt,
+        "PermShkStd": inc_calib["PermShkStd"][: retirement_t + 1]
+        + [retired_PermShkStd] * (terminal_t - retirement_t - 1),
+        "PermShkCount": PermShkCount,
+        "TranShkStd": inc_calib["TranShkStd"][: retirement_t + 1]
+        + [retired_TranShkStd] * (terminal_t - retirement_t - 1),
+        "TranShkCount": TranShkCount,
+        "T_cycle": terminal_t,
+        "T_sim": terminal_t+1,
+        "UnempPrb": UnempPrb,
+        "ExpShkProb": ExpShkProb,
+        "ExpShkMean": ExpShkMean,
+        "ExpShkStd": ExpShkStd,
+        "ExpShkCount": ExpShkCount,
+        "T_retire": 0*retirement_t,
+        "T_age": terminal_t+1,
+        "IncUnemp": IncUnemp,
+        "aXtraMin": aXtraMin,
+        "aXtraMax": aXtraMax,
+        "aXtraCount": aXtraCount,
+        "aXtraNestFac": exp_nest,
+        "LivPrb": inputs["liv_prb"],
+        "AgentCount": num_agents,
+        "seed": seed,
+        "tax_rate": 0.0,
+        "vFuncBool": vFuncBool,
+        "CubicBool": CubicBool,
+        "aNrmInit": inputs["aNrmInit"],
+        "neutral_measure": True,  # Harmemberg
+        "sim_common_Rrisky": False,  # idiosyncratic risky return
+        "use_shock_bank": True,  # replay the same shock draws in every simulation
+        "WealthShift": init_WealthShift,
+        "BeqMPC" : init_BeqMPC,
+        "BeqInt" : init_BeqInt,
+        "ChiFromOmega_N": 501,  # Number of gridpoints in chi-from-omega function
+        "ChiFromOmega_bound": 15,  # Highest gridpoint to use for it
+        # (constructors from estimark.income_process)
+        #"constructors" : {"IncShkDstn" : construct_lognormal_income_process_with_retirement_expense_shocks},
+    }
 
 
 # from Mateo's JMP for College Educated
@@ -282,14 +471,14 @@ init_subjective_stock = {
     "Rfree": terminal_t*[Rfree],
     "RiskyAvg": np.exp(ElnR_real + 0.5 * VlnR),
     "RiskyStd": np.sqrt(np.exp(2 * ElnR_real + VlnR) * (np.exp(VlnR) - 1)),
-    "RiskyAvgTrue": init_calibration["RiskyAvg"],
-    "RiskyStdTrue": init_calibration["RiskyStd"],
+    "RiskyAvgTrue": Rfree + Eq_prem,  # as in init_calibration
+    "RiskyStdTrue": RiskyStd,
 }
 
 true_stock_params = {
     "Rfree": terminal_t*[Rfree],
-    "RiskyAvg": init_calibration["RiskyAvg"],
-    "RiskyStd": init_calibration["RiskyStd"],
+    "RiskyAvg": Rfree + Eq_prem,
+    "RiskyStd": RiskyStd,
     }
 
 # from Tao's JMP
@@ -299,3 +488,22 @@ init_subjective_labor = {
     "PermShkStd": [0.03] * (retirement_t + 1)
     + [0.03 * np.sqrt(2)] * (terminal_t - retirement_t - 1),
 }
+
+
+# Globals that are built on first use rather than when this module is imported
+lazy_globals = {
+    "inc_calib": lambda: get_calibration_inputs()["inc_calib"],
+    "liv_prb": lambda: get_calibration_inputs()["liv_prb"],
+    "aNrmInit": lambda: get_calibration_inputs()["aNrmInit"],
+    "retired_TranShkStd": lambda: get_init_calibration()["TranShkStd"][-1],
+    "init_calibration": get_init_calibration,
+}
+
+
+def __getattr__(name):
+    if name in lazy_globals:
+        value = lazy_globals[name]()
+        globals()[name] = value
+        return value
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
@@ -0,0 +1,316 @@
+"""Persistent pool of warm worker processes for parallel criterion evaluations.
+With n_cores > 1, estimagic's batch evaluators pickle the criterion together with
+its criterion_kwargs for every task of every batch, and with them the whole agent:
+its calibration, shock distributions, solution and simulated history. Here each
+worker process builds its agent once, from its name and calibration overrides, and
+keeps it (with its warm solution cache) from one batch to the next. The criterion
+is wrapped in a WarmCriterion that leaves the agent behind when it is pickled, so
+the parent only sends parameter vectors and receives criterion values and moments.
+
+Each process evaluates its share of a batch in groups of up to batch_size points.
+The points of a group are evaluated on threads that first meet at a SolveBatch: the
+last one to arrive solves all of them in one stacked backward induction (for agents
+whose can_stack_solves is True) and puts the solutions in the solution cache. The
+evaluations themselves then run one at a time and find their solutions there.
+Estimagic passes batch evaluators internal parameter vectors, not parameter
+dictionaries, so this is the first point at which the whole group is known.
+
+A typical use, as in estimate_min:
+
+    pool = WarmPool(agent)
+    criterion = WarmCriterion(msm_criterion, agent, emp_moments=emp_moments)
+    options = pool.set_batch_evaluator(minimize_options)
+    em.minimize(criterion, initial_params, **options)
+"""
+
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from estimark.lazy import lazy_import
+from estimark.store import hash_object
+
+# Lazy imports of submodules import their parent packages, so estimagic's
+# decorators are reached through the package
+em = lazy_import("estimagic")
+estimation = lazy_import("estimark.estimation")
+loky = lazy_import("joblib.externals.loky")
+
+# Agents held by this (worker) process, keyed by name and calibration overrides
+resident_agents = {}
+
+# The SolveBatch that each thread of evaluate_batch belongs to, if any
+batch_state = threading.local()
+
+
+def get_resident_agent(agent_name, calibration_overrides=None, calibration_hash=None):
+    """
+    Find the agent that this process keeps for a specification, building it with
+    make_agent the first time it is asked for.
+
+    Parameters
+    ----------
+    agent_name : str
+        Name of the agent specification.
+    calibration_overrides : dict or None
+        Calibrated values that replace those of init_calibration, as in make_agent.
+    calibration_hash : str or None
+        Calibration hash of the agent in the parent process. A resident agent
+        whose hash differs (say, because the parameter files changed) is rebuilt.
+
+    Returns
+    -------
+    agent : AgentType
+        Agent resident in this process.
+    """
+    key = (agent_name, hash_object(calibration_overrides or {}))
+    agent = resident_agents.get(key)
+    if agent is None or (
+        calibration_hash is not None and agent.calibration_hash != calibration_hash
+    ):
+        agent = estimation.make_agent(agent_name, calibration_overrides)
+        resident_agents[key] = agent
+    return agent
+
+
+def init_resident_agent(agent_name, calibration_overrides=None):
+    """
+    Build the resident agent of a worker process when it starts, so that the first
+    batch does not wait for it.
+    """
+    get_resident_agent(agent_name, calibration_overrides)
+
+
+class SolveBatch:
+    """
+    Meeting point of the threads that evaluate one group of points. Each thread
+    arrives once, with the parameters its criterion is evaluated at, or without
+    them if it finished without reaching the criterion. The last to arrive solves
+    the parameters of all of them together, and the others wait until it has.
+
+    Parameters
+    ----------
+    n_tasks : int
+        Number of threads in the group.
+    """
+
+    def __init__(self, n_tasks):
+        self.waiting = n_tasks
+        self.params_list = []
+        self.solver = None
+        self.solved = False
+        self.condition = threading.Condition()
+        # Held while a criterion is evaluated, as the threads share one agent
+        self.lock = threading.Lock()
+
+    def arrive(self, params=None, solver=None, wait=True):
+        """
+        Register one thread's parameters, and wait until the group has been solved.
+
+        Parameters
+        ----------
+        params : dict or None
+            Parameters of this thread's evaluation, if it has one.
+        solver : callable or None
+            Function that solves a list of parameter dictionaries, such as a
+            wrapper of solve_params_batch; nothing is solved if no thread has one.
+        wait : bool
+            Whether to wait for the solve.
+        """
+        with self.condition:
+            if params is not None:
+                self.params_list.append(params)
+            if solver is not None:
+                self.solver = solver
+            self.waiting -= 1
+            if self.waiting == 0:
+                try:
+                    if self.solver is not None and len(self.params_list) > 1:
+                        self.solver(self.params_list)
+                finally:
+                    self.solved = True
+                    self.condition.notify_all()
+            while wait and not self.solved:
+                self.condition.wait()
+
+
+def evaluate_batch(func, arguments, batch_size):
+    """
+    Evaluate func at each of the arguments in this process, in groups of up to
+    batch_size that meet at a SolveBatch before their criteria are evaluated.
+
+    Returns
+    -------
+    results : list
+        The evaluations of func, in the order of arguments.
+    """
+    results = []
+    for start in range(0, len(arguments), batch_size):
+        group = arguments[start : start + batch_size]
+        if len(group) == 1:
+            results.append(func(group[0]))
+            continue
+        batch = SolveBatch(len(group))
+
+        def task(arg, batch=batch):
+            batch_state.batch = batch
+            batch_state.arrived = False
+            try:
+                return func(arg)
+            finally:
+                if not batch_state.arrived:
+                    batch.arrive(wait=False)
+                batch_state.batch = None
+
+        with ThreadPoolExecutor(max_workers=len(group)) as threads:
+            results.extend(threads.map(task, group))
+    return results
+
+
+class WarmCriterion:
+    """
+    Criterion (or moment simulator) that evaluates func at some parameters with an
+    agent and fixed keyword arguments. When it is pickled to a worker process, the
+    agent is left behind, and the worker uses its resident agent instead.
+
+    Parameters
+    ----------
+    func : callable
+        Function taking a params dict, the agent as the keyword argument agent and
+        the keyword arguments in kwargs, such as msm_criterion or simulate_moments.
+    agent : AgentType
+        Agent made by make_agent; used directly when evaluating in this process.
+    **kwargs
+        Other keyword arguments of func, such as the empirical moments and weights.
+    """
+
+    def __init__(self, func, agent, **kwargs):
+        self.func = func
+        self.agent = agent
+        self.agent_name = agent.name
+        self.calibration_overrides = getattr(agent, "calibration_overrides", None)
+        self.calibration_hash = getattr(agent, "calibration_hash", None)
+        self.kwargs = kwargs
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["agent"] = None
+        return state
+
+    def __call__(self, params):
+        agent = self.agent
+        if agent is None:
+            agent = get_resident_agent(
+                self.agent_name,
+                self.calibration_overrides,
+                self.calibration_hash,
+            )
+        batch = getattr(batch_state, "batch", None)
+        if batch is None:
+            return self.func(params, agent=agent, **self.kwargs)
+
+        # Solve the whole group together before evaluating any of it
+        if not batch_state.arrived:
+            batch_state.arrived = True
+            solver = None
+            if agent.can_stack_solves() and "emp_moments" in self.kwargs:
+                emp_moments = self.kwargs["emp_moments"]
+
+                def solver(params_list):
+                    estimation.solve_params_batch(agent, params_list, emp_moments)
+
+            batch.arrive(params, solver)
+        with batch.lock:
+            return self.func(params, agent=agent, **self.kwargs)
+
+
+class WarmPool:
+    """
+    Batch evaluator for estimagic whose worker processes keep a resident agent.
+    The processes belong to loky's reusable executor, so they outlive each batch
+    and each optimization, until they have been idle for idle_timeout seconds.
+    With a single core, batches are evaluated in this process. Either way, each
+    process solves its points in stacked groups of up to batch_size.
+
+    Parameters
+    ----------
+    agent : AgentType
+        Agent whose specification the workers build when they start.
+    idle_timeout : float
+        Seconds after which idle worker processes shut down.
+    batch_size : int
+        Largest number of points solved together.
+    """
+
+    def __init__(self, agent, idle_timeout=600.0, batch_size=8):
+        self.agent_name = agent.name
+        self.calibration_overrides = getattr(agent, "calibration_overrides", None)
+        self.idle_timeout = idle_timeout
+        self.batch_size = batch_size
+
+    def get_executor(self, n_cores):
+        """
+        Get the pool of n_cores warm worker processes, starting it if needed.
+        """
+        return loky.get_reusable_executor(
+            max_workers=n_cores,
+            timeout=self.idle_timeout,
+            initializer=init_resident_agent,
+            initargs=(self.agent_name, self.calibration_overrides),
+        )
+
+    def __call__(self, func, arguments, *, n_cores=1, error_handling="continue", unpack_symbol=None):
+        """
+        Evaluate func at each of the arguments, with the interface of estimagic's
+        batch evaluators: with error_handling "continue", failed tasks return the
+        traceback of their exception; unpack_symbol may be None, "*" or "**".
+
+        Returns
+        -------
+        results : list
+            The evaluations of func, in the order of arguments.
+        """
+        n_cores = int(n_cores) if int(n_cores) >= 2 else 1
+        reraise = error_handling == "raise"
+
+        @em.decorators.unpack(symbol=unpack_symbol)
+        @em.decorators.catch(default="__traceback__", reraise=reraise)
+        def internal_func(*args, **kwargs):
+            return func(*args, **kwargs)
+
+        arguments = list(arguments)
+        if n_cores == 1 or len(arguments) <= 1:
+            return evaluate_batch(internal_func, arguments, self.batch_size)
+
+        # Spread the points evenly over the workers, each solving its own share
+        size = -(-len(arguments) // n_cores)
+        chunks = [arguments[start : start + size] for start in range(0, len(arguments), size)]
+        results = self.get_executor(n_cores).map(
+            evaluate_batch,
+            [internal_func] * len(chunks),
+            chunks,
+            [self.batch_size] * len(chunks),
+        )
+        return [result for chunk in results for result in chunk]
+
+    def set_batch_evaluator(self, options):
+        """
+        Copy a dictionary of minimize_options with this pool as the batch evaluator
+        of the multistart exploration, and of the optimizer and numerical
+        derivatives where they are given n_cores (optimizers that do not evaluate
+        in parallel take neither option).
+        """
+        options = {
+            key: value.copy() if isinstance(value, dict) else value
+            for key, value in options.items()
+        }
+        for key in ["algo_options", "numdiff_options"]:
+            if "n_cores" in options.get(key, {}):
+                options[key]["batch_evaluator"] = self
+        if options.get("multistart"):
+            options["multistart_options"] = {
+                **options.get("multistart_options", {}),
+                "batch_evaluator": self,
+            }
+        return options
@@ -2,31 +2,135 @@
 
 from __future__ import annotations
 
+import functools
 from pathlib import Path
 
-import pandas as pd
-
+from estimark.data import file_digest, get_table
+from estimark.lazy import lazy_import
 from estimark.parameters import (
+    age_labels,
+    data_cache_dir,
     education,
     final_age_data,
     initial_age,
     remove_ages_from_scf,
 )
 
+pd = lazy_import("pandas")
+
 # Get the directory containing the current file and construct the full path to the CSV file
 csv_file_path = Path(__file__).resolve().parent / ".." / "data" / "SCFdata.csv"
 
 # Define the variables to keep
 keep_vars = ["age", "age_group", "wealth_income_ratio", "weight", "wave"]
 
-# Read the CSV file and filter data in one step
-scf_data = pd.read_csv(csv_file_path)
-scf_data_full = scf_data.loc[
-    (scf_data.norminc > 0.0)
-    & (scf_data.education == education)
-    & (scf_data.age > initial_age)
-    & (scf_data.age <= final_age_data),
-    keep_vars,
-]
-
-scf_data = scf_data_full.loc[~scf_data.age.isin(remove_ages_from_scf)]
+# Settings of the sample that the cached tables depend on, including the code
+# in this file that reads it
+sample_settings = {
+    "reader": file_digest(__file__),
+    "education": education,
+    "initial_age": initial_age,
+    "final_age_data": final_age_data,
+    "remove_ages": remove_ages_from_scf,
+    "age_labels": age_labels,
+}
+
+# Sorted index that the wealth moments are computed from
+wealth_index = {
+    "variable": "wealth_income_ratio",
+    "weights": "weight",
+    "groups": "age_group",
+    "labels": age_labels,
+}
+
+
+def read_scf_sample(path, remove_ages=False):
+    """
+    Read the SCF data and keep the households in the estimation sample, at all ages
+    or without the ages around retirement.
+
+    Parameters
+    ----------
+    path : Path
+        Location of the SCF CSV file.
+    remove_ages : bool
+        Whether to drop the ages in remove_ages_from_scf.
+
+    Returns
+    -------
+    frame : pd.DataFrame
+        The sample, with the columns in keep_vars.
+    categories : dict
+        Labels of the categorical columns.
+    indices : [dict]
+        Sorted indices to store with the table.
+    """
+    # Read the CSV file and filter data in one step
+    scf_data = pd.read_csv(path)
+    keep = (
+        (scf_data.norminc > 0.0)
+        & (scf_data.education == education)
+        & (scf_data.age > initial_age)
+        & (scf_data.age <= final_age_data)
+    )
+    if remove_ages:
+        keep &= ~scf_data.age.isin(remove_ages_from_scf)
+    frame = scf_data.loc[keep, keep_vars].reset_index(drop=True)
+    return frame, {"age_group": age_labels}, [wealth_index]
+
+
+@functools.cache
+def get_scf_table_full():
+    """
+    Get the memory-mapped SCF sample at all ages.
+    """
+    return get_table(
+        "scf_full",
+        csv_file_path,
+        read_scf_sample,
+        sample_settings,
+        data_cache_dir,
+    )
+
+
+@functools.cache
+def get_scf_table():
+    """
+    Get the memory-mapped SCF estimation sample, without the ages around retirement.
+    """
+    return get_table(
+        "scf",
+        csv_file_path,
+        functools.partial(read_scf_sample, remove_ages=True),
+        sample_settings,
+        data_cache_dir,
+    )
+
+
+@functools.cache
+def get_scf_data_full():
+    """
+    Get the SCF sample at all ages as a DataFrame.
+    """
+    return get_scf_table_full().to_frame()
+
+
+@functools.cache
+def get_scf_data():
+    """
+    Get the SCF estimation sample, without the ages around retirement, as a DataFrame.
+    """
+    return get_scf_table().to_frame()
+
+
+# The data are read the first time they are used rather than on import
+lazy_globals = {"scf_data": get_scf_data, "scf_data_full": get_scf_data_full}
+
+
+def __getattr__(name):
+    if name in lazy_globals:
+        value = lazy_globals[name]()
+        globals()[name] = value
+        return value
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
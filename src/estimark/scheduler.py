@@ -0,0 +1,206 @@
+"""Replication scheduler for running many Life-Cycle-Prime-Time specifications.
+A single budget of cores is split between specifications, which run in separate
+processes, and the parallelism inside each specification (optimizer, numerical
+derivatives, bootstrap, Jacobian and contour sweeps), so that the two levels
+never compete for the same cores. BLAS libraries are pinned to a fixed number
+of threads in every worker, and specifications are queued longest first.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from time import time
+
+from estimark.estimation import estimate, evaluation_store
+from estimark.parameters import bootstrap_options, minimize_options, sweep_options
+
+# Environment variables that set the thread count of common BLAS libraries
+blas_thread_variables = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+# Rough seconds per criterion evaluation of each agent type, used until the
+# evaluation store has timings for a specification
+default_eval_seconds = {
+    "IndShock": 1.0,
+    "WarmGlow": 1.5,
+    "Portfolio": 3.0,
+    "WarmGlowPortfolio": 4.0,
+    "WealthPortfolio": 5.0,
+}
+
+
+@contextmanager
+def pin_blas_threads(n_threads):
+    """
+    Set the thread count of BLAS libraries for processes started inside this
+    context, restoring the environment of the current process when it exits.
+    Libraries that are already loaded in the current process are not affected.
+    """
+    saved = {key: os.environ.get(key) for key in blas_thread_variables}
+    try:
+        for key in blas_thread_variables:
+            os.environ[key] = str(n_threads)
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def expected_cost(spec):
+    """
+    Estimate the relative cost of running one specification through estimate(),
+    as seconds per criterion evaluation times the number of evaluations that its
+    stages need. Recorded timings from the evaluation store are used if there are
+    any; otherwise a default by agent type.
+
+    Parameters
+    ----------
+    spec : dict
+        Keyword arguments for estimate().
+
+    Returns
+    -------
+    cost : float
+        Expected cost in (approximate) seconds on a single core.
+    """
+    agent_name = spec["agent_name"]
+    seconds = evaluation_store.mean_seconds(agent_name)
+    if seconds is None:
+        seconds = 1.0
+        for key, value in default_eval_seconds.items():
+            if key in agent_name:
+                seconds = value
+        if "Sub" in agent_name:
+            seconds *= 1.2
+
+    n_params = len(spec["params_to_estimate"])
+    n_evals = minimize_options.get("algo_options", {}).get(
+        "stopping.max_criterion_evaluations", 100
+    )
+    evals = 0.0
+    if spec.get("estimate_model", True):
+        evals += n_evals
+    if spec.get("compute_se_bootstrap"):
+        evals += n_evals * bootstrap_options["bootstrap_size"]
+    if spec.get("compute_sensitivity"):
+        evals += n_params + 1
+    if spec.get("make_contour_plot"):
+        evals += sweep_options["grid_density"] ** 2
+    return seconds * evals
+
+
+def allocate_cores(costs, n_cores):
+    """
+    Split a budget of cores between specifications in proportion to their
+    expected costs. Each specification gets at least one core; cores left over by
+    rounding go to those with the largest remainders, the costliest first. With at
+    least as many specifications as cores, each one gets a single core.
+
+    Parameters
+    ----------
+    costs : [float]
+        Expected cost of each specification, from the costliest to the cheapest.
+    n_cores : int
+        Total number of cores.
+
+    Returns
+    -------
+    shares : [int]
+        Number of cores for each specification.
+    """
+    shares = [1] * len(costs)
+    spare = n_cores - len(costs)
+    if spare <= 0:
+        return shares
+    total = sum(costs)
+    weights = [cost / total for cost in costs] if total > 0 else [1 / len(costs)] * len(costs)
+    extra = [weight * spare for weight in weights]
+    for j, value in enumerate(extra):
+        shares[j] += int(value)
+    left = n_cores - sum(shares)
+    by_remainder = sorted(range(len(costs)), key=lambda j: extra[j] - int(extra[j]), reverse=True)
+    for j in by_remainder[:left]:
+        shares[j] += 1
+    return shares
+
+
+def run_spec(spec, n_cores):
+    """
+    Run one specification through estimate() on n_cores cores, returning its name
+    and the seconds it took.
+    """
+    t0 = time()
+    estimate(**spec, n_cores=n_cores)
+    return spec["agent_name"], time() - t0
+
+
+def run_replications(specs, n_cores=None, blas_threads=1):
+    """
+    Run a list of specifications within a single budget of cores. Specifications
+    are started longest expected cost first, each in its own process. The cores
+    each one uses inside its own estimation are set before any starts, in
+    proportion to its expected cost (see allocate_cores); a specification waits
+    until enough cores are free for its share.
+
+    Parameters
+    ----------
+    specs : [dict]
+        Keyword arguments for estimate(), one dictionary per specification.
+    n_cores : int or None
+        Total number of cores to use; all of them if None.
+    blas_threads : int
+        Number of threads each process allows its BLAS library.
+
+    Returns
+    -------
+    run_times : dict
+        Mapping from specification names to the seconds each one took.
+    """
+    n_cores = n_cores or os.cpu_count()
+
+    costs = {id(spec): expected_cost(spec) for spec in specs}
+    pending = sorted(specs, key=lambda spec: costs[id(spec)], reverse=True)
+    shares = allocate_cores([costs[id(spec)] for spec in pending], n_cores)
+    pending = list(zip(pending, shares, strict=True))
+    max_workers = max(1, min(len(pending), n_cores))
+    print(
+        f"Running {len(pending)} specifications on {n_cores} cores, "
+        f"up to {max_workers} at a time.",
+    )
+
+    # Spawned workers start a fresh interpreter, so the BLAS settings apply to them
+    context = multiprocessing.get_context("spawn")
+    run_times = {}
+    running = {}
+    free_cores = n_cores
+    with pin_blas_threads(blas_threads), ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=context
+    ) as pool:
+        while pending or running:
+            while pending and pending[0][1] <= free_cores and len(running) < max_workers:
+                spec, share = pending.pop(0)
+                running[pool.submit(run_spec, spec, share)] = share
+                free_cores -= share
+                print(f"Started {spec['agent_name']} on {share} cores.")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                free_cores += running.pop(future)
+                agent_name, run_time = future.result()
+                run_times[agent_name] = run_time
+                minutes, seconds = divmod(run_time, 60)
+                print(f"Finished {agent_name} in {int(minutes)} min, {int(seconds)} sec.")
+
+    print("All replications complete.")
+    return run_times
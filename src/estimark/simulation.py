@@ -0,0 +1,389 @@
+"""Fast simulation of the solved lifecycle agent types in estimark.agents.
+HARK's AgentType.simulate advances the population one period at a time through
+get_mortality, get_shocks, get_states, get_controls and get_poststates, with
+dictionary bookkeeping and a loop over the ages present in every step. For the
+lifecycle types used here nobody dies, everyone is born together, and all shocks
+come from the shock bank, so every agent is in the same period of its life. The
+simulator below exploits that: shocks for the whole panel are looked up from the
+bank at once, and each period is a handful of array operations plus a single call
+of that period's policy functions.
+
+The timing is the same as HARK's, including the wrap of t_cycle back to zero
+in the period after the last one of the cycle, so the simulated histories match
+agent.simulate exactly.
+
+For populations too large to hold their histories, simulate_lifecycle_medians runs
+the same loop over chunks of agents and streams each age group's values into an
+exact median buffer, so that only the moments are kept.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from estimark.lazy import lazy_import
+from estimark.moments import MedianBuffer
+
+agents = lazy_import("estimark.agents")
+egm = lazy_import("estimark.egm")
+
+# Variables that the fast simulator can record in agent.history
+fast_track_vars = {
+    "PermShk",
+    "TranShk",
+    "Risky",
+    "Adjust",
+    "pLvl",
+    "bNrm",
+    "mNrm",
+    "cNrm",
+    "Share",
+    "aNrm",
+    "aLvl",
+}
+
+
+def is_portfolio_solution(agent):
+    """
+    Check whether the agent's solution has a portfolio choice, with policy functions
+    for agents who can and cannot adjust their risky share.
+    """
+    return hasattr(agent.solution[0], "ShareFuncAdj")
+
+
+def can_simulate_fast(agent):
+    """
+    Check whether simulate_lifecycle reproduces agent.simulate for this agent: it
+    must be a solved lifecycle type from estimark.agents that replays its shock
+    bank, tracking only variables the fast simulator knows about.
+
+    Parameters
+    ----------
+    agent : AgentType
+        Agent to be simulated.
+
+    Returns
+    -------
+    fast : bool
+        Whether the fast simulator can be used.
+    """
+    if not isinstance(agent, agents.TempConsumerType) or not agent.use_shock_bank:
+        return False
+    if agent.cycles != 1 or agent.read_shocks or not hasattr(agent, "solution"):
+        return False
+
+    track_vars = set(agent.track_vars)
+    if not track_vars <= fast_track_vars:
+        return False
+    if is_portfolio_solution(agent):
+        # Risky returns and adjustment must come from the bank too
+        _, RiskyDstn, AdjustPrb = agent.get_shock_bank_dstns()
+        return RiskyDstn is not None and AdjustPrb is not None
+    return not track_vars & {"Risky", "Adjust", "Share"}
+
+
+def get_shock_panels(agent, sim_periods, events=None):
+    """
+    Look up the income shocks of every agent in every simulated period from the
+    shock bank, as TempConsumerType.get_shocks would one period at a time.
+
+    Parameters
+    ----------
+    agent : TempConsumerType
+        Agent with an up to date shock bank.
+    sim_periods : int
+        Number of periods to simulate.
+    events : np.array or None
+        Panel of income shock indices; the agent's banked panel if None.
+
+    Returns
+    -------
+    PermShk : np.array
+        Permanent shocks (including expected growth), of shape (sim_periods, N).
+    TranShk : np.array
+        Transitory shocks, of shape (sim_periods, N).
+    """
+    events = agent.shock_bank["IncShk"] if events is None else events
+    N = events.shape[1]
+    PermShk = np.empty((sim_periods, N))
+    TranShk = np.empty((sim_periods, N))
+    for t_sim in range(sim_periods):
+        # Newborns use the first period's distribution, others the one before t_cycle
+        t = 0 if t_sim == 0 else t_sim % agent.T_cycle - 1
+        atoms = agent.IncShkDstn[t].atoms
+        PermShk[t_sim] = atoms[0][events[t_sim]] * agent.PermGroFac[t]
+        TranShk[t_sim] = atoms[1][events[t_sim]]
+    if not agent.NewbornTransShk:
+        TranShk[0] = 1.0
+    return PermShk, TranShk
+
+
+def iterate_lifecycle(agent, sim_periods, bank, aNrmInit):
+    """
+    Simulate a group of agents from birth, yielding the variables of each period.
+    This is the loop behind simulate_lifecycle and simulate_lifecycle_medians.
+
+    Parameters
+    ----------
+    agent : TempConsumerType
+        Solved agent for which can_simulate_fast is True.
+    sim_periods : int
+        Number of periods to simulate.
+    bank : dict
+        Panels of shock indices for the group, as in agent.shock_bank.
+    aNrmInit : np.array
+        Initial assets of each agent in the group.
+
+    Yields
+    ------
+    t_sim : int
+        Simulated period.
+    now : dict
+        Mapping from the names of fast_track_vars to their values in period t_sim.
+    """
+    portfolio = is_portfolio_solution(agent)
+    N = aNrmInit.size
+
+    PermShk, TranShk = get_shock_panels(agent, sim_periods, bank["IncShk"])
+    Rfree = np.array(agent.Rfree)
+    if portfolio:
+        Risky = agent.RiskyDstn.atoms[0][bank["Risky"][:sim_periods]]
+        Adjust = bank["Adjust"][:sim_periods]
+
+    # Everyone is born in the first period, as in TempConsumerType.sim_birth
+    aNrm = np.array(aNrmInit, dtype=float)
+    pLvl = np.ones(N)
+    Share = np.zeros(N)
+
+    with np.errstate(divide="ignore", over="ignore", under="ignore", invalid="ignore"):
+        for t_sim in range(sim_periods):
+            t = t_sim % agent.T_cycle
+            solution = agent.solution[t]
+
+            # Transition to this period's states, at last period's portfolio share
+            RfreeNow = Rfree[t]
+            if portfolio:
+                RfreeNow = Share * Risky[t_sim] + (1.0 - Share) * RfreeNow
+            pLvl = pLvl * PermShk[t_sim]
+            bNrm = (RfreeNow / PermShk[t_sim]) * aNrm
+            mNrm = bNrm + TranShk[t_sim]
+
+            # Controls, from the policy functions of this period
+            if not portfolio and hasattr(solution, "policy"):
+                # Solved by estimark.egm, so skip the interpolator objects
+                cNrm = egm.eval_policy(solution.policy, mNrm)
+            elif not portfolio:
+                cNrm = solution.cFunc(mNrm)
+            elif Adjust[t_sim].all():
+                cNrm = solution.cFuncAdj(mNrm)
+                Share = solution.ShareFuncAdj(mNrm)
+            else:
+                adjust = Adjust[t_sim]
+                fixed = ~adjust
+                cNrm = np.full(N, np.nan)
+                ShareNow = np.full(N, np.nan)
+                cNrm[adjust] = solution.cFuncAdj(mNrm[adjust])
+                ShareNow[adjust] = solution.ShareFuncAdj(mNrm[adjust])
+                cNrm[fixed] = solution.cFuncFxd(mNrm[fixed], Share[fixed])
+                ShareNow[fixed] = solution.ShareFuncFxd(mNrm[fixed], Share[fixed])
+                Share = ShareNow
+            aNrm = mNrm - cNrm
+
+            now = {
+                "PermShk": PermShk[t_sim],
+                "TranShk": TranShk[t_sim],
+                "pLvl": pLvl,
+                "bNrm": bNrm,
+                "mNrm": mNrm,
+                "cNrm": cNrm,
+                "aNrm": aNrm,
+                "aLvl": aNrm * pLvl,
+            }
+            if portfolio:
+                now.update(Risky=Risky[t_sim], Adjust=Adjust[t_sim], Share=Share)
+            yield t_sim, now
+
+
+def simulate_lifecycle(agent, sim_periods=None):
+    """
+    Simulate a solved lifecycle agent from birth with array operations, recording
+    the variables in agent.track_vars. The histories are also stored in
+    agent.history, as agent.simulate would.
+
+    Parameters
+    ----------
+    agent : TempConsumerType
+        Solved agent for which can_simulate_fast is True.
+    sim_periods : int or None
+        Number of periods to simulate; agent.T_sim if None.
+
+    Returns
+    -------
+    history : dict
+        Mapping from tracked variable names to arrays of shape (T_sim, AgentCount),
+        with NaN in periods that were not simulated.
+    """
+    sim_periods = agent.T_sim if sim_periods is None else sim_periods
+    agent.update_shock_bank()
+
+    history = {}
+    for var_name in agent.track_vars:
+        history[var_name] = np.full((agent.T_sim, agent.AgentCount), np.nan)
+
+    aNrmInit = np.asarray(agent.aNrmInit, dtype=float)
+    for t_sim, now in iterate_lifecycle(agent, sim_periods, agent.shock_bank, aNrmInit):
+        for var_name, var_history in history.items():
+            var_history[t_sim] = now[var_name]
+
+    agent.history = history
+    return history
+
+
+def plan_lifecycle(groups):
+    """
+    Work out the least a simulation must do to produce a set of moments: the number
+    of periods up to the last one that any moment uses, and the periods in which
+    each variable must be recorded.
+
+    Parameters
+    ----------
+    groups : dict
+        Mapping from moment names to pairs of a variable name in fast_track_vars and
+        an array of the simulated periods whose values the moment depends on.
+
+    Returns
+    -------
+    sim_periods : int
+        Number of periods to simulate.
+    record : dict
+        Mapping from variable names to sorted arrays of the periods to record.
+    """
+    record = {}
+    for var_name, periods in groups.values():
+        record[var_name] = np.union1d(record.get(var_name, []), periods).astype(int)
+    sim_periods = max((int(periods[-1]) + 1 for periods in record.values()), default=0)
+    return sim_periods, record
+
+
+def simulate_lifecycle_records(agent, sim_periods, record):
+    """
+    Simulate a solved lifecycle agent from birth, as simulate_lifecycle does, but
+    keep only the variables and periods in record. Nothing is stored in
+    agent.history.
+
+    Parameters
+    ----------
+    agent : TempConsumerType
+        Solved agent for which can_simulate_fast is True.
+    sim_periods : int
+        Number of periods to simulate.
+    record : dict
+        Mapping from variable names in fast_track_vars to sorted arrays of periods,
+        as made by plan_lifecycle.
+
+    Returns
+    -------
+    records : dict
+        Mapping from variable names to arrays of shape (len(record[var_name]),
+        AgentCount), with one row per recorded period.
+    """
+    agent.update_shock_bank()
+    records = {
+        var_name: np.empty((len(periods), agent.AgentCount))
+        for var_name, periods in record.items()
+    }
+    rows = [
+        [(var_name, row) for var_name, periods in record.items() for row in np.flatnonzero(periods == t_sim)]
+        for t_sim in range(sim_periods)
+    ]
+
+    aNrmInit = np.asarray(agent.aNrmInit, dtype=float)
+    for t_sim, now in iterate_lifecycle(agent, sim_periods, agent.shock_bank, aNrmInit):
+        for var_name, row in rows[t_sim]:
+            records[var_name][row] = now[var_name]
+    return records
+
+
+def iterate_chunks(agent, chunk_size):
+    """
+    Split the agent's population into chunks of at most chunk_size agents, each with
+    its own shock bank and initial assets. A population that fits in one chunk is the
+    agent's own, with its shock bank and aNrmInit. Otherwise, chunk j draws its shocks
+    from a seed sequence made from the agent's seed and j, and resamples its initial
+    assets from aNrmInit, so the population can be far larger than aNrmInit.
+
+    Parameters
+    ----------
+    agent : TempConsumerType
+        Agent with a shock bank.
+    chunk_size : int
+        Largest number of agents in a chunk.
+
+    Yields
+    ------
+    bank : dict
+        Panels of shock indices for the chunk.
+    aNrmInit : np.array
+        Initial assets of the agents in the chunk.
+    """
+    if agent.AgentCount <= chunk_size:
+        agent.update_shock_bank()
+        yield agent.shock_bank, np.asarray(agent.aNrmInit, dtype=float)
+        return
+
+    aNrmInit = np.asarray(agent.aNrmInit, dtype=float)
+    for j, start in enumerate(range(0, agent.AgentCount, chunk_size)):
+        n_agents = min(chunk_size, agent.AgentCount - start)
+        bank_seq, init_seq = np.random.SeedSequence([agent.seed, j]).spawn(2)
+        bank = agent.draw_shock_bank(bank_seq, n_agents)
+        yield bank, np.random.default_rng(init_seq).choice(aNrmInit, n_agents)
+
+
+def simulate_lifecycle_medians(agent, groups, sim_periods=None, chunk_size=10000, z=8.0):
+    """
+    Simulate a solved lifecycle agent in chunks of agents, keeping only the medians
+    of variables over groups of periods. Each group's values are streamed into a
+    MedianBuffer, so memory stays nearly flat as AgentCount grows, and the medians
+    are exactly those of the whole simulated panel. If the median of a group ever
+    leaves its buffer's window, the simulation is repeated with a wider one.
+
+    Parameters
+    ----------
+    agent : TempConsumerType
+        Solved agent for which can_simulate_fast is True.
+    groups : dict
+        Mapping from moment names to pairs of a variable name in fast_track_vars and
+        an array of the simulated periods whose values the moment is the median of.
+    sim_periods : int or None
+        Number of periods to simulate; agent.T_sim if None.
+    chunk_size : int
+        Largest number of agents simulated at once.
+    z : float
+        Half-width of the buffers' windows, as in MedianBuffer.
+
+    Returns
+    -------
+    medians : dict
+        Mapping from moment names to medians.
+    """
+    sim_periods = agent.T_sim if sim_periods is None else sim_periods
+    ends = {name: max(periods) for name, (var_name, periods) in groups.items()}
+    in_period = [
+        [name for name, (var_name, periods) in groups.items() if t_sim in periods]
+        for t_sim in range(sim_periods)
+    ]
+
+    buffers = {name: MedianBuffer(z) for name in groups}
+    for bank, aNrmInit in iterate_chunks(agent, chunk_size):
+        values = {name: [] for name in groups}
+        for t_sim, now in iterate_lifecycle(agent, sim_periods, bank, aNrmInit):
+            for name in in_period[t_sim]:
+                values[name].append(now[groups[name][0]].copy())
+                if t_sim == ends[name]:
+                    buffers[name].add(np.concatenate(values[name]))
+                    values[name] = []
+
+    try:
+        return {name: buffer.median() for name, buffer in buffers.items()}
+    except ValueError:
+        return simulate_lifecycle_medians(agent, groups, sim_periods, chunk_size, 4.0 * z)
@@ -2,17 +2,22 @@
 
 from __future__ import annotations
 
+import functools
 from pathlib import Path
 
-import pandas as pd
-
+from estimark.data import file_digest, get_table
+from estimark.lazy import lazy_import
 from estimark.parameters import (
+    age_labels,
     age_mapping,
+    data_cache_dir,
     final_age_data,
     initial_age,
     remove_ages_from_snp,
 )
 
+pd = lazy_import("pandas")
+
 file_path = (
     Path(__file__).resolve().parent / ".." / "data" / "S&P Target Date glidepath.xlsx"
 )
@@ -20,24 +25,115 @@ file_path = (
 # Define column mapping and columns to keep
 column_mapping = {"Current Age": "age", "S&P Target Date Equity allocation": "share"}
 
-# Load data, rename columns, filter data
-snp_data = (
-    pd.read_excel(file_path, usecols=column_mapping.keys())
-    .rename(columns=column_mapping)
-    .query(f"{initial_age} < age <= {final_age_data}")
-)
+# Settings of the sample that the cached tables depend on, including the code
+# in this file that reads it
+sample_settings = {
+    "reader": file_digest(__file__),
+    "initial_age": initial_age,
+    "final_age_data": final_age_data,
+    "remove_ages": remove_ages_from_snp,
+    "age_mapping": age_mapping,
+}
 
-# Assign age groups
-bins = [initial_age + 1] + [group[-1] + 1 for group in age_mapping.values()]
-labels = list(age_mapping.keys())
+# Sorted index that the share moments are computed from
+share_index = {
+    "variable": "share",
+    "weights": None,
+    "groups": "age_group",
+    "labels": age_labels,
+}
+
+
+def read_snp_sample(path, remove_ages=False):
+    """
+    Read the S&P glidepath and assign age groups, at all ages or only at the ages
+    that are matched in the estimation.
+
+    Parameters
+    ----------
+    path : Path
+        Location of the S&P workbook.
+    remove_ages : bool
+        Whether to drop the ages in remove_ages_from_snp.
+
+    Returns
+    -------
+    frame : pd.DataFrame
+        The glidepath, with age, share and age_group columns.
+    categories : dict
+        Labels of the categorical columns.
+    indices : [dict]
+        Sorted indices to store with the table.
+    """
+    # Load data, rename columns, filter data
+    snp_data = (
+        pd.read_excel(path, usecols=column_mapping.keys())
+        .rename(columns=column_mapping)
+        .query(f"{initial_age} < age <= {final_age_data}")
+    )
+
+    # Assign age groups
+    bins = [initial_age + 1] + [group[-1] + 1 for group in age_mapping.values()]
+    snp_data = snp_data.assign(
+        age_group=pd.cut(snp_data["age"], bins=bins, labels=age_labels, right=False),
+    )
+
+    # Remove ages
+    if remove_ages:
+        snp_data = snp_data.loc[
+            ~snp_data.age.isin(remove_ages_from_snp),
+            ["age", "share", "age_group"],
+        ]
+    frame = snp_data.reset_index(drop=True)
+    return frame, {"age_group": age_labels}, [share_index]
+
+
+@functools.cache
+def get_snp_table_full():
+    """
+    Get the memory-mapped S&P glidepath at all ages.
+    """
+    return get_table("snp_full", file_path, read_snp_sample, sample_settings, data_cache_dir)
+
+
+@functools.cache
+def get_snp_table():
+    """
+    Get the memory-mapped S&P shares that are matched in the estimation.
+    """
+    return get_table(
+        "snp",
+        file_path,
+        functools.partial(read_snp_sample, remove_ages=True),
+        sample_settings,
+        data_cache_dir,
+    )
+
+
+@functools.cache
+def get_snp_data_full():
+    """
+    Get the S&P glidepath at all ages as a DataFrame.
+    """
+    return get_snp_table_full().to_frame()
+
+
+@functools.cache
+def get_snp_data():
+    """
+    Get the S&P shares that are matched in the estimation as a DataFrame.
+    """
+    return get_snp_table().to_frame()
+
+
+# The data are read the first time they are used rather than on import
+lazy_globals = {"snp_data": get_snp_data, "snp_data_full": get_snp_data_full}
 
-snp_data = snp_data.assign(
-    age_group=pd.cut(snp_data["age"], bins=bins, labels=labels, right=False),
-)
 
-snp_data_full = snp_data.copy()
-# Remove ages
-snp_data = snp_data.loc[
-    ~snp_data.age.isin(remove_ages_from_snp),
-    ["age", "share", "age_group"],
-]
+def __getattr__(name):
+    if name in lazy_globals:
+        value = lazy_globals[name]()
+        globals()[name] = value
+        return value
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
@@ -0,0 +1,259 @@
+"""On-disk store of simulated moments for the Life-Cycle-Prime-Time estimation.
+Every call to simulate_moments is recorded in a SQLite file together with the
+agent name, parameters, seed and a hash of the calibration, so that points
+computed in earlier runs (or by other processes) can be looked up instead of
+solved and simulated again. Losses computed by msm_criterion are recorded in a
+second table, keyed by a hash of the targeted moments and their weights.
+
+The store can be read from a notebook with:
+
+    from estimark.store import EvaluationStore
+    store = EvaluationStore("path/to/evaluations.sqlite")
+    store.to_frame("IndShock")
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from time import time
+
+import numpy as np
+
+from estimark.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+schema = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY,
+    agent_name TEXT NOT NULL,
+    params TEXT NOT NULL,
+    seed INTEGER,
+    calibration_hash TEXT NOT NULL,
+    moments TEXT NOT NULL,
+    seconds REAL,
+    created REAL,
+    UNIQUE (agent_name, params, seed, calibration_hash)
+);
+CREATE TABLE IF NOT EXISTS losses (
+    evaluation_id INTEGER NOT NULL REFERENCES evaluations (id),
+    target_hash TEXT NOT NULL,
+    loss REAL,
+    created REAL,
+    PRIMARY KEY (evaluation_id, target_hash)
+);
+"""
+
+
+def update_hash(digest, obj):
+    """
+    Feed a canonical representation of obj into a hashlib digest. Dictionaries are
+    hashed in key order, arrays by dtype, shape and data, callables by their
+    qualified name, and objects by their class and attributes.
+    """
+    if isinstance(obj, dict):
+        digest.update(b"dict")
+        for key in sorted(obj, key=str):
+            update_hash(digest, str(key))
+            update_hash(digest, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        digest.update(type(obj).__name__.encode())
+        for item in obj:
+            update_hash(digest, item)
+    elif isinstance(obj, np.ndarray):
+        digest.update(f"ndarray{obj.dtype}{obj.shape}".encode())
+        digest.update(np.ascontiguousarray(obj).tobytes())
+    elif obj is None or isinstance(obj, (bool, int, float, str, np.generic)):
+        digest.update(repr(obj).encode())
+    elif callable(obj):
+        digest.update(f"{obj.__module__}.{obj.__qualname__}".encode())
+    elif hasattr(obj, "__dict__"):
+        digest.update(type(obj).__qualname__.encode())
+        update_hash(digest, vars(obj))
+    else:
+        digest.update(repr(obj).encode())
+
+
+def hash_object(obj):
+    """
+    Hash a (possibly nested) calibration dictionary or other object into a short
+    hex string that is stable across processes and sessions.
+    """
+    digest = hashlib.sha1()
+    update_hash(digest, obj)
+    return digest.hexdigest()
+
+
+class EvaluationStore:
+    """
+    SQLite store of simulated moments, keyed on the agent name, the rounded values
+    of the estimated parameters, the simulation seed and a hash of the calibration.
+    Each process opens its own connection, so the store can be shared by a pool of
+    worker processes.
+
+    Parameters
+    ----------
+    path : str or Path
+        Location of the SQLite file, which is created if it does not exist.
+    digits : int
+        Number of decimal places that parameter values are rounded to when
+        making keys.
+    enabled : bool
+        Whether to use the store at all; if False, lookups always miss and nothing
+        is recorded.
+    """
+
+    def __init__(self, path, digits=10, enabled=True):
+        self.path = Path(path)
+        self.digits = digits
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._owner = None
+
+    @property
+    def connection(self):
+        # Connections cannot be shared with forked worker processes, nor with the
+        # threads that evaluate a batch in estimark.pool
+        owner = (os.getpid(), threading.get_ident())
+        if self._connection is None or self._owner != owner:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=60.0)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(schema)
+            self._owner = owner
+        return self._connection
+
+    def make_key(self, agent, params):
+        """
+        Make the key of an evaluation from the agent and the estimated parameters.
+        The calibration hash is the one attached to the agent by make_agent.
+        """
+        rounded = {
+            key: round(float(np.squeeze(value)), self.digits)
+            for key, value in sorted(params.items())
+        }
+        return (
+            agent.name,
+            json.dumps(rounded),
+            int(getattr(agent, "seed", 0)),
+            getattr(agent, "calibration_hash", ""),
+        )
+
+    def get(self, key, moment_names, count=True):
+        """
+        Look up the simulated moments of an evaluation, returning None unless all of
+        moment_names were recorded. Lookups that only check ahead whether an
+        evaluation is needed pass count=False to leave the hit and miss counters alone.
+        """
+        if not self.enabled:
+            return None
+        row = self.connection.execute(
+            "SELECT moments FROM evaluations WHERE agent_name = ? AND params = ? "
+            "AND seed = ? AND calibration_hash = ?",
+            key,
+        ).fetchone()
+        moments = json.loads(row[0]) if row is not None else {}
+        if row is None or any(name not in moments for name in moment_names):
+            self.misses += count
+            return None
+        self.hits += count
+        return {name: moments[name] for name in moment_names}
+
+    def put(self, key, moments, seconds=None):
+        """
+        Record the simulated moments of an evaluation, merging them with any moments
+        already recorded under the same key.
+        """
+        if not self.enabled:
+            return
+        with self.connection as connection:
+            row = connection.execute(
+                "SELECT moments FROM evaluations WHERE agent_name = ? AND params = ? "
+                "AND seed = ? AND calibration_hash = ?",
+                key,
+            ).fetchone()
+            merged = json.loads(row[0]) if row is not None else {}
+            merged.update({name: float(value) for name, value in moments.items()})
+            connection.execute(
+                "INSERT INTO evaluations "
+                "(agent_name, params, seed, calibration_hash, moments, seconds, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (agent_name, params, seed, calibration_hash) "
+                "DO UPDATE SET moments = excluded.moments",
+                (*key, json.dumps(merged), seconds, time()),
+            )
+
+    def put_loss(self, key, target_hash, loss):
+        """
+        Record the loss of an evaluation against the targets with the given hash.
+        """
+        if not self.enabled:
+            return
+        with self.connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO losses (evaluation_id, target_hash, loss, created) "
+                "SELECT id, ?, ?, ? FROM evaluations WHERE agent_name = ? AND params = ? "
+                "AND seed = ? AND calibration_hash = ?",
+                (target_hash, float(loss), time(), *key),
+            )
+
+    def to_frame(self, agent_name=None, target_hash=None):
+        """
+        Read the recorded evaluations into a DataFrame with one column per parameter
+        and per moment, plus the seed, calibration hash, timing and, if target_hash
+        is given, the loss against those targets.
+
+        Parameters
+        ----------
+        agent_name : str or None
+            Name of the specification to read; all of them if None.
+        target_hash : str or None
+            Hash of the targets whose losses to include.
+
+        Returns
+        -------
+        evaluations : pd.DataFrame
+            Recorded evaluations, one per row.
+        """
+        query = (
+            "SELECT e.id, e.agent_name, e.params, e.seed, e.calibration_hash, "
+            "e.moments, e.seconds, e.created, l.loss FROM evaluations e "
+            "LEFT JOIN losses l ON l.evaluation_id = e.id AND l.target_hash = ?"
+        )
+        args = [target_hash]
+        if agent_name is not None:
+            query += " WHERE e.agent_name = ?"
+            args.append(agent_name)
+        rows = pd.read_sql_query(query, self.connection, params=args)
+
+        params = pd.DataFrame([json.loads(x) for x in rows.pop("params")], index=rows.index)
+        moments = pd.DataFrame([json.loads(x) for x in rows.pop("moments")], index=rows.index)
+        if target_hash is None:
+            rows = rows.drop(columns="loss")
+        return pd.concat([rows, params, moments], axis=1).set_index("id")
+
+    def mean_seconds(self, agent_name):
+        """
+        Average time taken by the recorded evaluations of a specification, or None
+        if it has none.
+        """
+        if not self.enabled:
+            return None
+        row = self.connection.execute(
+            "SELECT AVG(seconds) FROM evaluations WHERE agent_name = ?",
+            (agent_name,),
+        ).fetchone()
+        return row[0]
+
+    def stats(self):
+        """
+        Report the number of lookups that hit and missed in this process.
+        """
+        return {"hits": self.hits, "misses": self.misses}
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
-from estimark.estimation import estimate
 from estimark.options import low_resource
+from estimark.parameters import scheduler_options
+from estimark.scheduler import run_replications
 
 agent_names = [
     "Portfolio",
@@ -12,6 +13,7 @@ agent_names = [
 
 # Ask the user which replication to run, and run it:
 def run_replication():
+    specs = []
     for agent_name in agent_names:
         for sub_stock in [0]:
             temp_agent_name = agent_name
@@ -22,11 +24,9 @@ def run_replication():
             replication_specs["agent_name"] = temp_agent_name
             replication_specs["save_dir"] = "docs/tables/TRP"
 
-            print("Model: ", replication_specs["agent_name"])
+            specs.append(replication_specs)
 
-            estimate(**replication_specs)
-
-    print("All replications complete.")
+    run_replications(specs, **scheduler_options)
 
 
 if __name__ == "__main__":
@@ -2,11 +2,10 @@ from __future__ import annotations
 
 import itertools
 
-import dask
-from dask.distributed import Client
-
-from estimark.estimation import estimate, get_empirical_moments, get_moments_cov
+from estimark.estimation import get_empirical_moments, get_moments_cov
 from estimark.options import low_resource
+from estimark.parameters import scheduler_options
+from estimark.scheduler import run_replications
 
 agent_names = [
     "IndShock",
@@ -18,15 +17,13 @@ agent_names = [
 
 
 def run_replication():
-    inds_emp_moments = get_empirical_moments("IndShock")
-    port_emp_moments = get_empirical_moments("Porfolio")
+    inds_emp_moments, _ = get_empirical_moments("IndShock")
+    port_emp_moments, _ = get_empirical_moments("Portfolio")
 
     inds_moments_cov = get_moments_cov("IndShock", inds_emp_moments)
-    port_moments_cov = get_moments_cov("Porfolio", port_emp_moments)
-
-    client = Client(threads_per_worker=10, n_workers=20)
+    port_moments_cov = get_moments_cov("Portfolio", port_emp_moments)
 
-    lazy_results = []
+    specs = []
 
     for agent_name in agent_names:
         for sub_stock, sub_labor in itertools.product(range(2), repeat=2):
@@ -43,8 +40,6 @@ def run_replication():
             replication_specs["agent_name"] = temp_agent_name
             replication_specs["save_dir"] = "docs/tables/msm"
 
-            print("Model: ", replication_specs["agent_name"])
-
             if "Portfolio" in replication_specs["agent_name"]:
                 replication_specs["emp_moments"] = port_emp_moments
                 replication_specs["moments_cov"] = port_moments_cov
@@ -54,12 +49,9 @@ def run_replication():
 
             replication_specs["estimate_method"] = "msm"
 
-            lazy_result = dask.delayed(estimate)(**replication_specs)
-            lazy_results.append(lazy_result)
-
-    dask.compute(*lazy_results)
+            specs.append(replication_specs)
 
-    client.close()
+    run_replications(specs, **scheduler_options)
 
 
 if __name__ == "__main__":
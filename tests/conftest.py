@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+import pytest
+
+from estimark import estimation
+
+
+@pytest.fixture(scope="session", autouse=True)
+def evaluation_store_path(tmp_path_factory):
+    """Keeps the tests, and the worker processes they start, out of the real
+    evaluation store."""
+    path = tmp_path_factory.mktemp("store") / "evaluations.sqlite"
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("ESTIMARK_EVALUATION_STORE", str(path))
+        patch.setattr(estimation.evaluation_store, "path", path)
+        patch.setattr(estimation.evaluation_store, "_connection", None)
+        yield path
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import pickle
+
+import numpy as np
+import pytest
+
+from estimark.agents import rebuild_agent
+from estimark.estimation import make_agent, prepare_solve
+from estimark.parameters import true_stock_params
+
+
+def test_agents_pickle_lean_and_rebuild_the_same_solution():
+    agent = make_agent("(Stock)Portfolio")
+    agent.assign_parameters(CRRA=4.0, DiscFac=0.96)
+    prepare_solve(agent)
+    agent.solve()
+
+    # Only the calibration and parameters are sent by default
+    payload = pickle.dumps(agent)
+    assert len(payload) < 200_000
+    rebuilt = pickle.loads(payload)
+    assert not hasattr(rebuilt, "solution")
+    assert rebuilt.calibration_hash == agent.calibration_hash
+    assert rebuilt.belief_now == "subjective"
+
+    prepare_solve(rebuilt)
+    rebuilt.solve()
+    mNrm = np.linspace(0.5, 20.0, 50)
+    for expected, solution in zip(agent.solution, rebuilt.solution, strict=True):
+        np.testing.assert_array_equal(solution.cFunc(mNrm), expected.cFunc(mNrm))
+        np.testing.assert_array_equal(solution.ShareFuncAdj(mNrm), expected.ShareFuncAdj(mNrm))
+
+    # The solution comes along when asked for
+    agent.pickle_solution = True
+    assert len(pickle.loads(pickle.dumps(agent)).solution) == len(agent.solution)
+
+    with pytest.raises(ValueError, match="schema version"):
+        rebuild_agent({**agent.get_payload(), "schema": 0})
+
+
+def test_constructors_are_skipped_when_inputs_are_unchanged():
+    agent = make_agent("IndShock")
+    assert agent.elide_constructors
+    agent.update()
+    IncShkDstn = agent.IncShkDstn
+    PermShkStd = agent.PermShkStd
+    solution_terminal = agent.solution_terminal
+
+    # The estimated parameters only reach the terminal solution
+    agent.assign_parameters(CRRA=agent.CRRA + 1.0)
+    agent.update()
+    assert agent.IncShkDstn is IncShkDstn
+    assert agent.solution_terminal is not solution_terminal
+
+    # A new income process is built, and the old one restored when it comes back
+    agent.assign_parameters(PermShkStd=[2.0 * x for x in PermShkStd])
+    agent.update_income_process()
+    assert agent.IncShkDstn is not IncShkDstn
+    built = agent.constructor_stats["built"]
+    agent.assign_parameters(PermShkStd=PermShkStd)
+    agent.update_income_process()
+    assert agent.IncShkDstn is IncShkDstn
+    assert agent.constructor_stats["built"] == built
+    assert agent.constructor_stats["seconds_saved"] > 0.0
+
+
+def test_dual_belief_agent_swaps_belief_objects():
+    agent = make_agent("PortfolioSub(Stock)")
+    assert {"RiskyDstn", "ShockDstn", "ShareLimit"} <= set(agent.belief_keys)
+
+    agent.update()
+    agent.use_beliefs("subjective")
+    subjective = agent.RiskyDstn, agent.ShockDstn
+    agent.use_beliefs("true")
+    assert agent.RiskyDstn is not subjective[0]
+    assert agent.RiskyAvg == true_stock_params["RiskyAvg"]
+
+    agent.use_beliefs("subjective")
+    assert (agent.RiskyDstn, agent.ShockDstn) == subjective
+    agent.update()
+    assert (agent.RiskyDstn, agent.ShockDstn) == subjective
+
+
+def test_agents_rebuilt_without_the_shock_bank_draw_the_same_histories():
+    agent = make_agent("IndShock", {"AgentCount": 200})
+    agent.use_shock_bank = False
+    agent.track_vars = ["aNrm", "pLvl"]
+    prepare_solve(agent)
+    agent.solve()
+    agent.initialize_sim()
+    agent.simulate()
+
+    # The rebuilt distributions take the sender's seeds and random states
+    agent.pickle_solution = True
+    rebuilt = pickle.loads(pickle.dumps(agent))
+    for sender in [agent, rebuilt]:
+        sender.initialize_sim()
+        sender.simulate()
+    for var in agent.track_vars:
+        np.testing.assert_array_equal(rebuilt.history[var], agent.history[var])
+
+    # With the shock bank, later agents rebuilt here skip the first one's builds, but
+    # get their own copies of the objects that hold random states
+    payload = pickle.dumps(make_agent("IndShock"))
+    first, second = pickle.loads(payload), pickle.loads(payload)
+    assert second.constructor_stats["built"] == 0
+    assert second.IncShkDstn is not first.IncShkDstn
+    assert second.parameters["IncShkDstn"] is second.IncShkDstn
+
+
+def test_agents_rebuilt_together_simulate_as_they_would_alone():
+    agent = make_agent("IndShock", {"AgentCount": 200})
+    agent.track_vars = ["PermShk", "TranShk", "aNrm"]
+    prepare_solve(agent)
+    agent.solve()
+    agent.pickle_solution = True
+    payload = pickle.dumps(agent)
+
+    # Rebuilt with the shock bank, the agents skip each other's builds; drawing live
+    # shocks afterwards must not advance generators that the other agent also uses
+    together = [pickle.loads(payload), pickle.loads(payload)]
+    for sender in [agent, *together]:
+        sender.use_shock_bank = False
+        sender.initialize_sim()
+    for rebuilt in together:
+        rebuilt.simulate()
+    agent.simulate()
+    for rebuilt in together:
+        for var in agent.track_vars:
+            np.testing.assert_array_equal(rebuilt.history[var], agent.history[var])
+
+
+def simulate_shocks(agent):
+    agent.initialize_sim()
+    agent.simulate()
+    return {var: agent.history[var].copy() for var in agent.track_vars}
+
+
+def test_shock_bank_replays_the_same_draws():
+    agent = make_agent("IndShock", {"AgentCount": 200})
+    agent.track_vars = ["PermShk", "TranShk"]
+    prepare_solve(agent)
+    agent.solve()
+    shocks = simulate_shocks(agent)
+    bank = agent.shock_bank
+
+    # Again, and after a change of parameters that leaves the shocks alone
+    agent.assign_parameters(CRRA=agent.CRRA + 1.0)
+    prepare_solve(agent)
+    agent.solve()
+    for replay in [simulate_shocks(agent), simulate_shocks(agent)]:
+        assert agent.shock_bank is bank
+        for var, history in shocks.items():
+            np.testing.assert_array_equal(replay[var], history)
+
+
+def test_shock_bank_is_redrawn_when_its_signature_changes():
+    agent = make_agent("IndShock", {"AgentCount": 200})
+    agent.track_vars = ["TranShk"]
+    prepare_solve(agent)
+    agent.solve()
+    shocks = simulate_shocks(agent)
+    bank = agent.shock_bank
+    signature = agent.get_shock_bank_signature()
+
+    # Wider shocks move the atoms, but the banked events stay valid
+    agent.assign_parameters(TranShkStd=[2.0 * std for std in agent.TranShkStd])
+    agent.update_income_process()
+    wider = simulate_shocks(agent)
+    assert agent.get_shock_bank_signature() == signature
+    assert agent.shock_bank is bank
+    assert not np.array_equal(wider["TranShk"], shocks["TranShk"])
+
+    # Other probabilities, or another seed, call for new events
+    agent.assign_parameters(TranShkCount=agent.TranShkCount + 2)
+    agent.update_income_process()
+    assert agent.get_shock_bank_signature() != signature
+    simulate_shocks(agent)
+    assert agent.shock_bank is not bank
+    assert agent.shock_bank["signature"] == agent.get_shock_bank_signature()
+
+    bank = agent.shock_bank
+    agent.seed += 1
+    simulate_shocks(agent)
+    assert agent.shock_bank is not bank
+    assert not np.array_equal(agent.shock_bank["IncShk"], bank["IncShk"])
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from estimark.cache import SolutionCache, estimate_nbytes
+
+
+def test_solution_cache_keys_on_rounded_params_and_regime():
+    cache = SolutionCache(digits=6)
+    agent = SimpleNamespace(name="PortfolioSub(Stock)Market")
+    key = cache.make_key(agent, {"CRRA": 2.0000000001, "BeqMPC": 0.1})
+
+    assert key == cache.make_key(agent, {"BeqMPC": 0.1, "CRRA": 2.0})
+    assert key[1] == ("(Stock)",)
+    assert cache.get(key) is None
+
+    solution = [np.zeros(10)]
+    cache.put(key, solution)
+    assert cache.get(key) is solution
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_solution_cache_evicts_least_recently_used():
+    solution_size = estimate_nbytes([np.zeros(1000)])
+    cache = SolutionCache(max_mb=2.5 * solution_size / 2**20)
+    for key in "abc":
+        cache.put(key, [np.zeros(1000)])
+        cache.get("a")
+
+    assert list(cache.entries) == ["c", "a"]
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import inspect
+
+from estimark.checkpoint import (
+    CriterionHistory,
+    get_best_params,
+    get_history_path,
+    read_history,
+    read_records,
+    read_state,
+    write_state,
+)
+
+
+def criterion(params, agent=None, emp_moments=None):
+    assert agent is None
+    assert emp_moments is None
+    return {"value": (params["CRRA"] - 3.0) ** 2}
+
+
+def test_criterion_history_resumes_from_best_point(tmp_path):
+    path = tmp_path / "history.jsonl"
+    wrapped = CriterionHistory(criterion, path)
+    assert inspect.signature(wrapped) == inspect.signature(criterion)
+    for value in [1.0, 2.5, 4.0]:
+        wrapped({"CRRA": value}, agent=None)
+
+    # A record cut off by an interrupted write is skipped
+    with path.open("a") as f:
+        f.write('{"params": {"CRRA": 3.0}, "val')
+
+    assert len(read_records(path)) == 3
+    assert read_history(path)["CRRA"].tolist() == [1.0, 2.5, 4.0]
+    assert get_best_params(path, ["CRRA"]) == {"CRRA": 2.5}
+    assert get_best_params(path, ["CRRA", "BeqMPC"]) is None
+
+
+def test_state_round_trip(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    assert read_state(path) == {}
+    write_state(path, {"finished": {"estimate": {"params": {"CRRA": 2.0}}}})
+    assert read_state(path)["finished"]["estimate"]["params"] == {"CRRA": 2.0}
+
+
+def test_history_files_are_kept_apart_by_calibration_and_targets(tmp_path):
+    path = get_history_path(tmp_path, "IndShock", "calib", "targets")
+    assert path == get_history_path(tmp_path, "IndShock", "calib", "targets")
+    assert path != get_history_path(tmp_path, "IndShock", "other", "targets")
+    assert path != get_history_path(tmp_path, "IndShock", "calib", "other")
+    assert path.name.startswith("IndShock_history_")
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from estimark.data import get_table
+from estimark.moments import GroupIndex, get_group_codes, get_group_index
+
+labels = ["a", "b", "c"]
+index_spec = {"variable": "value", "weights": "weight", "groups": "group", "labels": labels}
+
+
+def read_sample(path):
+    frame = pd.read_csv(path)
+    return frame, {"group": labels}, [index_spec]
+
+
+def write_source(path, seed):
+    rng = np.random.default_rng(seed)
+    n = 500
+    pd.DataFrame(
+        {
+            "value": np.round(rng.lognormal(size=n), 3),
+            "weight": rng.integers(1, 5, size=n).astype(float),
+            "group": rng.choice(labels, size=n),
+            "year": rng.choice([1995, 2004], size=n),
+        },
+    ).to_csv(path, index=False)
+
+
+def test_table_matches_source_and_rebuilds_on_change(tmp_path):
+    source = tmp_path / "source.csv"
+    cache_dir = tmp_path / "cache"
+    write_source(source, 0)
+
+    table = get_table("sample", source, read_sample, {"n": 1}, cache_dir)
+    frame = pd.read_csv(source)
+    assert isinstance(table["value"], np.memmap)
+    assert table["year"].dtype == np.int16
+    assert table.to_frame().astype({"group": str}).equals(frame)
+
+    # The stored index is the one that would be made from the data
+    index = get_group_index(table, "value", weights="weight", groups="group", mapping=labels)
+    expected = GroupIndex(
+        frame["value"],
+        get_group_codes(frame["group"], labels),
+        len(labels),
+        weights=frame["weight"],
+    )
+    assert np.array_equal(index.rows, expected.rows)
+    assert np.array_equal(index.medians(), expected.medians())
+
+    # Touching the source is not a change, but new contents or settings are
+    os.utime(source, ns=(0, 0))
+    assert get_table("sample", source, read_sample, {"n": 1}, cache_dir).path == table.path
+    other = get_table("sample", source, read_sample, {"n": 2}, cache_dir)
+    assert other.path != table.path
+    write_source(source, 1)
+    rebuilt = get_table("sample", source, read_sample, {"n": 2}, cache_dir)
+    assert rebuilt.path != other.path
+    assert rebuilt.to_frame().astype({"group": str}).equals(pd.read_csv(source))
+    assert {p.name for p in cache_dir.iterdir()} == {"sample.json", rebuilt.path.name}
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import numpy as np
+
+from estimark.distribution import (
+    can_iterate_distribution,
+    distribute_mass,
+    iterate_distribution_medians,
+    make_histogram_grid,
+)
+from estimark.estimation import make_agent
+from estimark.parameters import sim_mapping
+from estimark.simulation import plan_lifecycle, simulate_lifecycle_medians
+
+
+def test_distribute_mass_keeps_mass_and_mean():
+    grid = make_histogram_grid(100.0, 50)
+    values = np.random.default_rng(0).lognormal(size=1000)
+    weights = np.full(values.size, 1.0 / values.size)
+    mass = distribute_mass(values, weights, grid)
+    assert np.isclose(mass.sum(), 1.0)
+    assert np.isclose(mass @ grid, weights @ values)
+
+
+def test_histogram_medians_match_a_large_simulation():
+    agent = make_agent("Portfolio")
+    agent.update()
+    agent.solve()
+    assert can_iterate_distribution(agent)
+
+    groups = {key: ("bNrm", periods) for key, periods in sim_mapping.items()}
+    groups.update({key + "_port": ("Share", periods) for key, periods in sim_mapping.items()})
+    sim_periods, _ = plan_lifecycle(groups)
+    medians = iterate_distribution_medians(
+        agent, groups, sim_periods, make_histogram_grid(1000.0, 600), np.linspace(0.0, 1.0, 201)
+    )
+
+    agent.AgentCount = 100000
+    simulated = simulate_lifecycle_medians(agent, groups, sim_periods, chunk_size=50000)
+    for key, value in simulated.items():
+        np.testing.assert_allclose(medians[key], value, rtol=0.02, err_msg=key)
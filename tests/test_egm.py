@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from estimark import egm
+from estimark.estimation import make_agent
+from estimark.simulation import simulate_lifecycle
+
+
+@pytest.mark.parametrize("jit", [False, True])
+def test_egm_solution_matches_hark(jit):
+    if jit and egm.numba is None:
+        pytest.skip("numba is not installed")
+
+    agent = make_agent("IndShock")
+    agent.AgentCount = 300
+    agent.aNrmInit = agent.aNrmInit[:300]
+    agent.track_vars = [*agent.track_vars, "cNrm"]
+    agent.update()
+    agent.solver_backend = "hark"
+    agent.solve()
+    expected = agent.solution
+    expected_history = simulate_lifecycle(agent, agent.T_cycle + 1)
+
+    agent.solver_backend = "egm"
+    agent.solver_jit = jit
+    assert egm.can_solve_egm(agent)
+    agent.solve()
+    assert len(agent.solution) == len(expected)
+
+    # Exact with the NumPy kernel, to rounding when compiled
+    tol = {"rtol": 1e-12, "atol": 0.0} if jit else {"rtol": 0.0, "atol": 0.0}
+    m = np.linspace(-1.0, 100.0, 2001)
+    for t in range(agent.T_cycle):
+        solution = agent.solution[t]
+        for attr in ["mNrmMin", "hNrm", "MPCmin", "MPCmax"]:
+            assert getattr(solution, attr) == getattr(expected[t], attr)
+        np.testing.assert_allclose(solution.cFunc(m), expected[t].cFunc(m), **tol)
+        np.testing.assert_allclose(solution.vPfunc(m), expected[t].vPfunc(m), **tol)
+        np.testing.assert_array_equal(egm.eval_policy(solution.policy, m), solution.cFunc(m))
+
+    history = simulate_lifecycle(agent, agent.T_cycle + 1)
+    for key, value in expected_history.items():
+        np.testing.assert_allclose(history[key], value, **tol)
+
+
+def test_batched_solve_matches_separate_solves():
+    agent = make_agent("IndShock")
+    param_names = ["CRRA", "DiscFac"]
+    param_matrix = np.array([[3.0, 1.0], [4.2, 0.97], [6.5, 1.02]])
+    solutions = agent.solve_batch(param_matrix, param_names)
+    assert len(solutions) == len(param_matrix)
+    assert agent.solution is solutions[-1]
+
+    m = np.linspace(-1.0, 100.0, 2001)
+    for row, solution in zip(param_matrix, solutions, strict=True):
+        agent.assign_parameters(**dict(zip(param_names, row, strict=True)))
+        agent.update()
+        agent.solver_backend = "hark"
+        agent.solve()
+        for t in range(agent.T_cycle):
+            assert solution[t].MPCmin == agent.solution[t].MPCmin
+            np.testing.assert_array_equal(solution[t].cFunc(m), agent.solution[t].cFunc(m))
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import numpy as np
+
+from estimark.emulator import MomentEmulator
+
+
+def moments(params):
+    x, y = params["x"], params["y"]
+    return {"a": np.sin(3.0 * x) + y**2, "b": x * y}
+
+
+def test_emulator_refines_where_uncertain_and_reports_its_error():
+    emulator = MomentEmulator(["x", "y"], ["a", "b"], {"x": (0.0, 1.0), "y": (-1.0, 1.0)})
+    n_evaluations = emulator.refine(moments, max_evaluations=40, tol=0.005)
+    assert len(emulator) == n_evaluations < 40
+
+    points = np.random.default_rng(0).uniform([0.0, -1.0], [1.0, 1.0], (1000, 2))
+    mean, std = emulator.predict(points)
+    true = np.array([[moments({"x": x, "y": y})[name] for name in "ab"] for x, y in points])
+    assert mean.shape == std.shape == (1000, 2)
+    np.testing.assert_allclose(mean, true, atol=0.02)
+
+    errors = emulator.errors()
+    assert set(errors) == {"a", "b"}
+    assert all(0.0 <= error < 0.02 for error in errors.values())
+
+    emp = {"a": 0.5, "b": 0.0}
+    weights = {"a": 1.0, "b": 2.0}
+    expected = np.square(mean[:, 0] - 0.5) + np.square(2.0 * mean[:, 1])
+    np.testing.assert_allclose(emulator.criterion(points, emp, weights), expected)
+    assert emulator.predict_moments({"x": 0.3, "y": 0.1}).keys() == {"a", "b"}
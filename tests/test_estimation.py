@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from estimark import estimation
+from estimark.cache import SolutionCache
+from estimark.estimation import (
+    get_fidelity_minimize_options,
+    get_worker_initargs,
+    init_worker,
+    make_agent,
+)
+from estimark.parameters import fidelity_options, minimize_options
+
+
+def test_workers_rebuild_the_parents_calibration():
+    agent = make_agent("IndShock", {"AgentCount": 200, "aXtraCount": 10})
+    init_worker(*get_worker_initargs(agent))
+    assert estimation.worker_state.agent.AgentCount == 200
+    assert estimation.worker_state.agent.calibration_hash == agent.calibration_hash
+
+    with pytest.raises(ValueError, match="calibration hash"):
+        init_worker(agent.name, None, agent.calibration_hash)
+
+
+def test_simulate_moments_leaves_the_agent_solved_at_its_params(evaluation_store_path):
+    agent = make_agent("IndShock", {"AgentCount": 200, "aXtraCount": 10})
+    emp_moments, _ = estimation.get_empirical_moments("IndShock")
+    assert estimation.evaluation_store.path == evaluation_store_path
+    first, second = {"CRRA": 3.0, "DiscFac": 0.95}, {"CRRA": 5.0, "DiscFac": 0.95}
+
+    moments = estimation.simulate_moments(first, agent, emp_moments)
+    solution = agent.solution
+    estimation.simulate_moments(second, agent, emp_moments)
+    assert agent.solution is not solution
+
+    # Criterion calls take the stored moments without solving again
+    assert estimation.simulate_moments(first, agent, emp_moments, use_store=True) == moments
+    assert agent.CRRA == 3.0
+    assert estimation.simulate_moments(first, agent, emp_moments) == moments
+    assert agent.solution is solution
+
+
+def test_fidelity_levels_are_cached_apart_from_the_full_calibration():
+    cheap_level, full_level = fidelity_options["levels"][0], fidelity_options["levels"][-1]
+    agent = make_agent("IndShock")
+    cheap_agent = make_agent("IndShock", cheap_level["calibration"])
+    assert cheap_agent.AgentCount == len(cheap_agent.aNrmInit) < agent.AgentCount
+    np.testing.assert_array_equal(cheap_agent.aNrmInit, agent.aNrmInit[: cheap_agent.AgentCount])
+
+    cache = SolutionCache()
+    params = {"CRRA": 2.0}
+    assert cache.make_key(cheap_agent, params) != cache.make_key(agent, params)
+
+    options = get_fidelity_minimize_options(minimize_options, full_level)
+    assert not options["multistart"]
+    assert options["algo_options"]["radius_options"] == full_level["algo_options"]["radius_options"]
+    assert "radius_options" not in minimize_options["algo_options"]
+
+
+@pytest.fixture
+def sweep_calls(monkeypatch):
+    """Replaces the criterion of parameter sweeps with a cheap one that records the
+    points it is evaluated at."""
+    calls = []
+
+    def criterion(params, **_):
+        calls.append(params)
+        return {"value": sum(params.values())}
+
+    monkeypatch.setattr(estimation, "msm_criterion", criterion)
+    monkeypatch.setattr(estimation, "solve_params_batch", lambda *_: None)
+    return calls
+
+
+def test_param_sweep_resumes_after_an_interruption(sweep_calls, tmp_path, monkeypatch):
+    agent = make_agent("IndShock")
+    grids = {"CRRA": np.array([2.0, 3.0, 4.0]), "DiscFac": np.array([0.9, 0.95])}
+    model_estimate = {"CRRA": 3.0, "DiscFac": 0.95}
+    emp_moments, weights = {"(25,30]": 1.0}, {"(25,30]": 1.0}
+    args = (agent, model_estimate, grids, emp_moments, weights, tmp_path)
+
+    # The points done before the interruption are on disk
+    criterion = estimation.msm_criterion
+
+    def interrupted_criterion(params, **kwargs):
+        if len(sweep_calls) == 3:
+            msg = "interrupted"
+            raise RuntimeError(msg)
+        return criterion(params, **kwargs)
+
+    monkeypatch.setattr(estimation, "msm_criterion", interrupted_criterion)
+    with pytest.raises(RuntimeError, match="interrupted"):
+        estimation.run_param_sweep(*args, flush_every=1)
+    assert len(sweep_calls) == 3
+    monkeypatch.setattr(estimation, "msm_criterion", criterion)
+    values = estimation.run_param_sweep(*args)
+    assert len(sweep_calls) == 3 + 3
+    assert np.array_equal(values, grids["CRRA"][:, None] + grids["DiscFac"][None, :])
+
+    # A finished sweep is read back without evaluating anything
+    estimation.run_param_sweep(*args)
+    assert len(sweep_calls) == 6
+
+
+def test_param_sweep_starts_over_for_other_targets(sweep_calls, tmp_path):
+    agent = make_agent("IndShock")
+    grids = {"CRRA": np.array([2.0, 3.0])}
+    model_estimate = {"CRRA": 3.0, "DiscFac": 0.95}
+    emp_moments, weights = {"(25,30]": 1.0}, {"(25,30]": 1.0}
+    estimation.run_param_sweep(agent, model_estimate, grids, emp_moments, weights, tmp_path)
+    assert len(sweep_calls) == 2
+
+    changes = [
+        {"emp_moments": {"(25,30]": 2.0}},
+        {"weights": {"(25,30]": 2.0}},
+        {"agent": make_agent("IndShock", {"AgentCount": 200})},
+    ]
+    for n, change in enumerate(changes, start=1):
+        kwargs = {"agent": agent, "emp_moments": emp_moments, "weights": weights, **change}
+        estimation.run_param_sweep(
+            model_estimate=model_estimate, grids=grids, save_dir=tmp_path, **kwargs
+        )
+        assert len(sweep_calls) == 2 + 2 * n
+
+
+def test_param_sweep_over_three_parameters(sweep_calls, tmp_path):
+    agent = make_agent("IndShock")
+    grids = {
+        "CRRA": np.array([2.0, 3.0]),
+        "DiscFac": np.array([0.9, 0.95, 0.99]),
+        "WealthShare": np.array([0.1, 0.2]),
+    }
+    values = estimation.run_param_sweep(agent, {}, grids, {}, {}, tmp_path)
+    assert values.shape == (2, 3, 2)
+    expected = sum(np.meshgrid(*grids.values(), indexing="ij"))
+    np.testing.assert_allclose(values, expected)
+    assert {"CRRA", "DiscFac", "WealthShare"} == set(sweep_calls[0])
+
+
+@pytest.fixture
+def cheap_moments(monkeypatch):
+    """Replaces the simulated moments with a smooth function of CRRA and DiscFac."""
+
+    def simulate_moments(params, _agent, emp_moments, **_):
+        return {
+            key: k * params["CRRA"] ** 2 + params["DiscFac"] / k
+            for k, key in enumerate(emp_moments, start=1)
+        }
+
+    monkeypatch.setattr(estimation, "simulate_moments", simulate_moments)
+    monkeypatch.setattr(estimation, "solve_params_batch", lambda *_: None)
+
+
+@pytest.mark.usefixtures("cheap_moments")
+def test_moment_jacobian_matches_finite_differences():
+    agent = make_agent("IndShock")
+    emp_moments = {"(25,30]": 1.0, "(30,35]": 1.0, "(35,40]": 1.0}
+    params = {"CRRA": 3.0, "DiscFac": 0.95}
+    jacobian = estimation.compute_moment_jacobian(agent, params, emp_moments, step=1e-6)
+    assert jacobian.index.name == "moment"
+    assert jacobian.columns.name == "parameter"
+    assert list(jacobian.index) == list(emp_moments)
+    assert list(jacobian.columns) == list(params)
+
+    k = np.arange(1, 4)
+    np.testing.assert_allclose(jacobian["CRRA"], 2.0 * k * params["CRRA"], rtol=1e-5)
+    np.testing.assert_allclose(jacobian["DiscFac"], 1.0 / k, rtol=1e-5)
+
+    nested = estimation.get_msm_jacobian(params, agent, emp_moments, step=1e-6)
+    assert list(nested) == list(emp_moments)
+    assert nested["(30,35]"] == jacobian.loc["(30,35]"].to_dict()
+
+
+@pytest.mark.usefixtures("cheap_moments")
+def test_moment_jacobian_steps_backward_at_an_upper_bound():
+    agent = make_agent("IndShock")
+    emp_moments = {"(25,30]": 1.0}
+    upper = estimation.init_params_options["upper_bounds"]["CRRA"]
+    params = {"CRRA": upper, "DiscFac": 0.95}
+    step = 0.01
+    jacobian = estimation.compute_moment_jacobian(agent, params, emp_moments, step=step)
+
+    # The backward difference of CRRA**2 is 2 * CRRA - step, the forward one 2 * CRRA + step
+    assert jacobian.loc["(25,30]", "CRRA"] == pytest.approx(2.0 * upper - step)
+    assert jacobian.loc["(25,30]", "DiscFac"] == pytest.approx(1.0)
+
+
+def test_moment_jacobian_is_the_same_on_worker_processes(monkeypatch):
+    agent = make_agent("IndShock", {"AgentCount": 200, "aXtraCount": 10})
+    emp_moments, _ = estimation.get_empirical_moments("IndShock")
+    params = {"CRRA": 3.0, "DiscFac": 0.95}
+
+    # Nothing read back from the evaluation store; workers simulate every vector
+    monkeypatch.setattr(estimation.evaluation_store, "enabled", False)
+    parallel = estimation.compute_moment_jacobian(agent, params, emp_moments, n_cores=2)
+    serial = estimation.compute_moment_jacobian(agent, params, emp_moments)
+    assert parallel.shape == (len(emp_moments), len(params))
+    assert parallel.equals(serial)
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from estimark.income_process import (
+    construct_lognormal_income_process_with_mateos_expense_shocks,
+    construct_lognormal_income_process_with_retirement_expense_shocks,
+)
+
+income_args = {
+    "T_cycle": 10,
+    "PermShkStd": [0.1] * 10,
+    "PermShkCount": 3,
+    "TranShkStd": [0.1] * 10,
+    "TranShkCount": 3,
+    "T_retire": 4,
+    "UnempPrb": 0.05,
+    "IncUnemp": 0.3,
+    "UnempPrbRet": 0.0,
+    "IncUnempRet": 0.0,
+}
+expense_args = {"ExpShkProb": 0.1, "ExpShkMean": -1.0, "ExpShkStd": 1.0, "ExpShkCount": 5}
+
+
+@pytest.mark.parametrize(
+    ("constructor", "extra_args"),
+    [
+        (construct_lognormal_income_process_with_retirement_expense_shocks, expense_args),
+        (construct_lognormal_income_process_with_mateos_expense_shocks, {}),
+    ],
+)
+def test_retirement_years_share_arrays_but_not_seeds(constructor, extra_args):
+    IncShkDstn = constructor(**income_args, **extra_args, RNG=np.random.default_rng(0))
+    assert len(IncShkDstn) == income_args["T_cycle"]
+
+    retired = IncShkDstn[income_args["T_retire"] :]
+    assert retired[0].atoms is retired[1].atoms
+    assert not retired[0].atoms.flags.writeable
+    assert len({dstn.seed for dstn in retired}) == len(retired)
+    assert not np.array_equal(retired[0].draw(50), retired[1].draw(50))
+    np.testing.assert_array_equal(retired[0].atoms[0], 1.0)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+from statsmodels.stats.weightstats import DescrStatsW
+
+from estimark.moments import (
+    GroupIndex,
+    MedianBuffer,
+    draw_bootstrap_counts,
+    get_bootstrap_moments,
+    get_group_codes,
+)
+
+
+def make_data(seed=0, n=2000):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "value": np.round(rng.lognormal(size=n), 1),  # rounding makes ties
+            "weight": rng.integers(1, 5, size=n).astype(float),
+            "group": rng.choice(["a", "b", "c", "x"], size=n),
+        },
+    )
+
+
+def test_group_quantiles_match_descrstatsw():
+    data = make_data()
+    mapping = ["a", "b", "c", "empty"]
+    probs = np.array([0.1, 0.25, 0.5, 0.9])
+    index = GroupIndex(
+        data["value"],
+        get_group_codes(data["group"], mapping),
+        len(mapping),
+        weights=data["weight"],
+    )
+    quantiles = index.quantiles(probs)
+
+    for j, key in enumerate(mapping[:-1]):
+        group = data[data["group"] == key]
+        stats = DescrStatsW(group["value"].to_numpy(), weights=group["weight"].to_numpy())
+        np.testing.assert_array_equal(
+            quantiles[j],
+            stats.quantile(probs, return_pandas=False),
+        )
+        assert index.weight_sums[j] == group["weight"].sum()
+    assert np.all(np.isnan(quantiles[-1]))
+
+
+def test_unweighted_medians_match_pandas():
+    data = make_data(seed=1, n=501)
+    mapping = ["a", "b", "c"]
+    index = GroupIndex(data["value"], get_group_codes(data["group"], mapping), 3)
+    expected = data.groupby("group")["value"].median()[mapping].to_numpy()
+    np.testing.assert_array_equal(index.medians(), expected)
+
+
+def test_bootstrap_moments_match_resampled_data():
+    data = make_data(seed=2, n=300)
+    mapping = ["a", "b", "c"]
+    counts = draw_bootstrap_counts(len(data), 20, np.random.default_rng(5))
+    replicates, cov = get_bootstrap_moments(
+        data, "value", weights="weight", groups="group", mapping=mapping, counts=counts
+    )
+
+    indices = np.random.default_rng(5).integers(0, len(data), size=(20, len(data)))
+    for b, rows in enumerate(indices):
+        sample = data.iloc[rows]
+        for key in mapping:
+            group = sample[sample["group"] == key]
+            stats = DescrStatsW(group["value"].to_numpy(), weights=group["weight"].to_numpy())
+            assert replicates.loc[b, key] == stats.quantile(0.5, return_pandas=False)[0]
+    np.testing.assert_allclose(cov.to_numpy(), np.cov(replicates.to_numpy(), rowvar=False))
+
+
+def test_median_buffer_is_exact_and_mergeable():
+    rng = np.random.default_rng(0)
+    # Rounding makes ties, and the masses at one make a tied median
+    batches = [np.round(rng.lognormal(size=rng.integers(1, 2000)), 2) for _ in range(40)]
+    batches += [np.ones(3000)]
+    values = np.concatenate(batches)
+
+    buffer, odd, even = MedianBuffer(), MedianBuffer(), MedianBuffer()
+    for j, batch in enumerate(batches):
+        buffer.add(batch)
+        (odd if j % 2 else even).add(batch)
+    odd.merge(even)
+    assert buffer.median() == odd.median() == np.median(values)
+    assert buffer.counts.size < values.size / 10
+
+    buffer.add([np.nan])
+    assert np.isnan(buffer.median())
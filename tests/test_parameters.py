@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from estimark import parameters
+from estimark.store import hash_object
+
+
+@pytest.fixture
+def builds(monkeypatch, tmp_path):
+    """Points the calibration cache at a temporary directory and counts the builds
+    of the calibration inputs."""
+    calls = []
+    build = parameters.build_calibration_inputs
+
+    def counted_build():
+        calls.append(parameters.get_calibration_key())
+        return build()
+
+    monkeypatch.setattr(parameters, "cache_dir", tmp_path)
+    monkeypatch.setattr(parameters, "build_calibration_inputs", counted_build)
+    parameters.get_calibration_inputs.cache_clear()
+    yield calls
+    parameters.get_calibration_inputs.cache_clear()
+
+
+def test_calibration_inputs_are_cached_by_key(builds, monkeypatch, tmp_path):
+    inputs = parameters.get_calibration_inputs()
+    key = parameters.get_calibration_key()
+    assert (tmp_path / f"calibration-{key}.pkl").exists()
+
+    # Another process with the same key loads the pickle
+    parameters.get_calibration_inputs.cache_clear()
+    assert hash_object(parameters.get_calibration_inputs()) == hash_object(inputs)
+    assert builds == [key]
+
+    # An edit of parameters.py or another HARK version makes a new key
+    source = tmp_path / "parameters.py"
+    source.write_text(Path(parameters.__file__).read_text() + "\n# edited\n")
+    monkeypatch.setattr(parameters, "__file__", str(source))
+    edited_key = parameters.get_calibration_key()
+    monkeypatch.setattr(parameters.importlib.metadata, "version", lambda name: f"{name}-0.0")
+    hark_key = parameters.get_calibration_key()
+    assert len({key, edited_key, hark_key}) == 3
+
+    parameters.get_calibration_inputs.cache_clear()
+    parameters.get_calibration_inputs()
+    assert builds == [key, hark_key]
+
+
+def test_lazy_globals_match_an_eager_build(monkeypatch):
+    inputs = parameters.build_calibration_inputs()
+    for name in ["inc_calib", "liv_prb", "aNrmInit"]:
+        assert hash_object(getattr(parameters, name)) == hash_object(inputs[name])
+
+    monkeypatch.setattr(parameters, "get_calibration_inputs", lambda: inputs)
+    init_calibration = parameters.get_init_calibration.__wrapped__()
+    assert hash_object(parameters.init_calibration) == hash_object(init_calibration)
+    assert parameters.retired_TranShkStd == init_calibration["TranShkStd"][-1]
+
+    with pytest.raises(AttributeError, match="no attribute 'missing'"):
+        _ = parameters.missing
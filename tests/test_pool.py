@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import pickle
+
+from estimark import estimation
+from estimark.estimation import get_empirical_moments, make_agent, simulate_moments
+from estimark.pool import WarmCriterion, WarmPool
+
+
+def test_warm_pool_matches_serial_evaluations(monkeypatch):
+    overrides = {"AgentCount": 200, "aXtraCount": 10, "PermShkCount": 3, "TranShkCount": 3}
+    agent = make_agent("IndShock", overrides)
+    emp_moments, _ = get_empirical_moments("IndShock")
+    criterion = WarmCriterion(simulate_moments, agent, emp_moments=emp_moments, use_store=False)
+
+    # Nothing reaches the evaluation store before the workers evaluate the points
+    monkeypatch.setattr(estimation.evaluation_store, "enabled", False)
+
+    # Workers get the specification, not the agent
+    unpickled = pickle.loads(pickle.dumps(criterion))
+    assert unpickled.agent is None
+    assert unpickled.calibration_overrides == overrides
+
+    points = [{"CRRA": CRRA, "DiscFac": 0.945} for CRRA in [2.0, 3.0, 4.0]]
+    expected = [criterion(params) for params in points]
+    pool = WarmPool(agent)
+    for _ in range(2):
+        assert pool(criterion, points, n_cores=2) == expected
+
+
+def test_batches_are_solved_together():
+    agent = make_agent("IndShock", {"AgentCount": 200, "aXtraCount": 10})
+    agent.solver_backend = "egm"
+    assert agent.can_stack_solves()
+    emp_moments, _ = get_empirical_moments("IndShock")
+    criterion = WarmCriterion(simulate_moments, agent, emp_moments=emp_moments)
+
+    calls = []
+    solve_batch = agent.solve_batch
+
+    def counted_solve_batch(param_matrix, *args, **kwargs):
+        calls.append(len(param_matrix))
+        return solve_batch(param_matrix, *args, **kwargs)
+
+    agent.solve_batch = counted_solve_batch
+    points = [{"CRRA": CRRA, "DiscFac": 0.93} for CRRA in [2.0, 2.5, 3.0, 3.5, 4.0]]
+    results = WarmPool(agent, batch_size=4)(criterion, points, n_cores=1)
+    assert calls == [4]
+    assert results == [simulate_moments(params, agent, emp_moments) for params in points]
@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+import os
+
+from estimark.scheduler import allocate_cores, blas_thread_variables, pin_blas_threads
+
+
+def test_costlier_specifications_get_more_cores():
+    shares = allocate_cores(list(range(20, 0, -1)), 32)
+    assert sum(shares) == 32
+    assert shares == sorted(shares, reverse=True)
+    assert allocate_cores([6.0, 1.0, 1.0], 8) == [5, 2, 1]
+    assert allocate_cores([3.0, 2.0, 1.0], 2) == [1, 1, 1]
+
+
+def test_blas_threads_are_pinned_only_inside_the_run():
+    before = {key: os.environ.get(key) for key in blas_thread_variables}
+    with pin_blas_threads(3):
+        assert all(os.environ[key] == "3" for key in blas_thread_variables)
+    assert {key: os.environ.get(key) for key in blas_thread_variables} == before
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from estimark.estimation import make_agent
+from estimark.parameters import sim_mapping
+from estimark.simulation import (
+    can_simulate_fast,
+    iterate_chunks,
+    iterate_lifecycle,
+    plan_lifecycle,
+    simulate_lifecycle,
+    simulate_lifecycle_medians,
+    simulate_lifecycle_records,
+)
+
+
+@pytest.mark.parametrize("agent_name", ["IndShock", "Portfolio"])
+def test_fast_simulation_matches_hark(agent_name):
+    agent = make_agent(agent_name)
+    agent.AgentCount = 300
+    agent.aNrmInit = agent.aNrmInit[:300]
+    agent.track_vars = [*agent.track_vars, "cNrm", "aLvl"]
+    agent.update()
+    agent.solve()
+
+    agent.initialize_sim()
+    agent.simulate(agent.T_cycle + 1)
+    expected = {key: value.copy() for key, value in agent.history.items()}
+
+    assert can_simulate_fast(agent)
+    history = simulate_lifecycle(agent, agent.T_cycle + 1)
+    for key, value in expected.items():
+        np.testing.assert_array_equal(history[key], value)
+
+    # A planned simulation records the same values, only where moments need them
+    groups = {"wealth": ("bNrm", np.array([5, 1, 3])), "late": ("cNrm", np.array([40, 42]))}
+    sim_periods, record = plan_lifecycle(groups)
+    assert sim_periods == 43
+    np.testing.assert_array_equal(record["bNrm"], [1, 3, 5])
+    records = simulate_lifecycle_records(agent, sim_periods, record)
+    for key, periods in record.items():
+        np.testing.assert_array_equal(records[key], expected[key][periods])
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 120])
+def test_streamed_medians_match_the_whole_panel(chunk_size):
+    agent = make_agent("IndShock")
+    agent.AgentCount = 500
+    agent.aNrmInit = agent.aNrmInit[:500]
+    agent.update()
+    agent.solve()
+    sim_periods = agent.T_cycle + 1
+    groups = {key: ("bNrm", periods) for key, periods in sim_mapping.items()}
+    medians = simulate_lifecycle_medians(agent, groups, sim_periods, chunk_size=chunk_size)
+
+    # The same chunks, with every history kept
+    bNrm = np.hstack(
+        [
+            np.array([now["bNrm"] for t_sim, now in iterate_lifecycle(agent, sim_periods, *chunk)])
+            for chunk in iterate_chunks(agent, chunk_size)
+        ]
+    )
+    assert bNrm.shape == (sim_periods, agent.AgentCount)
+    if chunk_size >= agent.AgentCount:
+        np.testing.assert_array_equal(bNrm, simulate_lifecycle(agent, sim_periods)["bNrm"])
+    for key, periods in sim_mapping.items():
+        assert medians[key] == np.median(bNrm[periods])
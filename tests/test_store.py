@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from estimark.store import EvaluationStore, hash_object
+
+
+def test_evaluation_store_round_trip(tmp_path):
+    store = EvaluationStore(tmp_path / "evaluations.sqlite", digits=6)
+    agent = SimpleNamespace(name="IndShock", seed=0, calibration_hash="abc")
+    key = store.make_key(agent, {"CRRA": 2.0000000001, "DiscFac": np.array(0.95)})
+    assert key == store.make_key(agent, {"DiscFac": 0.95, "CRRA": 2.0})
+    assert store.get(key, ["(25,30]"]) is None
+
+    store.put(key, {"(25,30]": 1.5, "(30,35]": 2.5}, seconds=0.1)
+    assert store.get(key, ["(30,35]", "(25,30]"]) == {"(30,35]": 2.5, "(25,30]": 1.5}
+    assert store.get(key, ["(35,40]"]) is None
+    assert store.stats() == {"hits": 1, "misses": 2}
+
+    store.put_loss(key, "target", 0.25)
+    frame = store.to_frame("IndShock", target_hash="target")
+    assert frame["loss"].tolist() == [0.25]
+    assert frame["CRRA"].tolist() == [2.0]
+
+
+def test_hash_object_is_canonical():
+    calibration = {"a": np.arange(3.0), "b": [1, 2.5, "x"], "c": {"y": None}}
+    reordered = {"c": {"y": None}, "b": [1, 2.5, "x"], "a": np.arange(3.0)}
+    assert hash_object(calibration) == hash_object(reordered)
+    assert hash_object(calibration) != hash_object({**calibration, "a": np.arange(4.0)})